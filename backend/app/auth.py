@@ -1,20 +1,194 @@
-from fastapi import Request, HTTPException, Security
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+import jwt
+from fastapi import Request, HTTPException, Security, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
-from .supabase_client import supabase
+from .supabase_client import supabase, run_blocking
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
+# 'local' verifies Supabase JWTs in-process (SUPABASE_JWT_SECRET for HS256
+# projects, the project JWKS for asymmetric keys); 'remote' asks the auth
+# server on every cache miss. Local mode falls back to remote when no key is
+# available.
+AUTH_VERIFY_MODE = os.environ.get("AUTH_VERIFY_MODE", "local").lower()
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", 10000))
+JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
+JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = os.environ.get("SUPABASE_JWKS_URL") or (
+    f"{os.environ.get('SUPABASE_URL', '').rstrip('/')}/auth/v1/.well-known/jwks.json"
+)
+JWKS_CACHE_SECONDS = int(os.environ.get("JWKS_CACHE_SECONDS", 600))
+# Algorithms accepted for access tokens; the token's own header only picks among these
+JWT_ALGORITHMS = [
+    a.strip() for a in os.environ.get("SUPABASE_JWT_ALGORITHMS", "HS256,RS256,ES256").split(",") if a.strip()
+]
+
+
+class AuthUser:
+    """The verified user, built from JWT claims (mirrors the fields of Supabase's User)."""
+
+    def __init__(self, claims: Dict[str, Any]):
+        self.id = claims.get("sub")
+        self.email = claims.get("email")
+        self.phone = claims.get("phone")
+        self.role = claims.get("role")
+        self.aud = claims.get("aud")
+        self.app_metadata = claims.get("app_metadata", {})
+        self.user_metadata = claims.get("user_metadata", {})
+        self.claims = claims
+
+
+class LocalVerificationUnavailable(Exception):
+    """No key to verify this token locally; use the auth server instead."""
+
+
+# sha256(token) -> (expires_at, user)
+_token_cache: Dict[str, Tuple[float, Any]] = {}
+_token_cache_lock = threading.Lock()
+_jwks_client: Optional[jwt.PyJWKClient] = None
+
+
+def _cache_get(token_hash: str) -> Optional[Any]:
+    with _token_cache_lock:
+        entry = _token_cache.get(token_hash)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _token_cache[token_hash]
+            return None
+        return entry[1]
+
+
+def _cache_put(token_hash: str, user: Any, token_exp: Optional[float] = None):
+    expires_at = time.time() + AUTH_CACHE_TTL
+    if token_exp:
+        # Never trust a cached token past its own expiry
+        expires_at = min(expires_at, token_exp)
+    with _token_cache_lock:
+        if len(_token_cache) >= AUTH_CACHE_MAX_ENTRIES:
+            now = time.time()
+            for key in [k for k, (exp, _) in _token_cache.items() if exp <= now]:
+                del _token_cache[key]
+            while len(_token_cache) >= AUTH_CACHE_MAX_ENTRIES:
+                # Oldest insertion first
+                del _token_cache[next(iter(_token_cache))]
+        _token_cache[token_hash] = (expires_at, user)
+
+
+def _signing_key(kid: Optional[str]):
     """
-    Verifies the JWT token from the Authorization header using Supabase.
-    Returns the user object if valid.
+    Public key for a kid from the project JWKS. The key set is fetched at
+    most every JWKS_CACHE_SECONDS; an unknown kid is rejected rather than
+    triggering a refetch, so forged tokens cannot make us hit the endpoint.
+    """
+    global _jwks_client
+    try:
+        if _jwks_client is None:
+            _jwks_client = jwt.PyJWKClient(JWKS_URL, cache_jwk_set=True, lifespan=JWKS_CACHE_SECONDS)
+        keys = _jwks_client.get_signing_keys()
+    except jwt.PyJWKClientError as e:
+        raise LocalVerificationUnavailable(f"JWKS unavailable: {e}")
+    for signing_key in keys:
+        if kid and signing_key.key_id == kid:
+            return signing_key.key
+    raise HTTPException(status_code=401, detail="Invalid authentication token: unknown signing key")
+
+
+def _verify_local(token: str) -> Dict[str, Any]:
+    """
+    Verify signature, expiry and audience of a Supabase access token. Returns
+    its claims. Blocking (may fetch the JWKS); run it off the event loop.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid authentication token: {e}")
+    alg = header.get("alg")
+    if alg not in JWT_ALGORITHMS:
+        raise HTTPException(status_code=401, detail="Invalid authentication token: algorithm not allowed")
+
+    # The key decides the algorithm family: the shared secret only ever
+    # verifies HS256, JWKS keys only the asymmetric algorithms
+    if alg == "HS256":
+        if not JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET not set")
+        key, algorithms = JWT_SECRET, ["HS256"]
+    else:
+        key, algorithms = _signing_key(header.get("kid")), [a for a in JWT_ALGORITHMS if a != "HS256"]
+
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=JWT_AUDIENCE,
+            options={"require": ["exp", "sub"]}
+        )
+    except jwt.PyJWTError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid authentication token: {e}")
+
+
+async def _verify_remote(token: str):
+    user = await run_blocking(supabase.auth.get_user, token)
+    if not user:
+         raise HTTPException(status_code=401, detail="Invalid authentication token")
+    return user.user
+
+
+async def verify_token(token: str):
+    """
+    Verifies a Supabase access token and returns the user.
+    Verified tokens are cached (keyed by token hash) for AUTH_CACHE_TTL_SECONDS.
     """
-    token = credentials.credentials
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    cached = _cache_get(token_hash)
+    if cached is not None:
+        return cached
+
     try:
-        user = supabase.auth.get_user(token)
-        if not user:
-             raise HTTPException(status_code=401, detail="Invalid authentication token")
-        return user.user
+        if AUTH_VERIFY_MODE != "remote":
+            try:
+                claims = await asyncio.to_thread(_verify_local, token)
+                user = AuthUser(claims)
+                _cache_put(token_hash, user, claims.get("exp"))
+                return user
+            except LocalVerificationUnavailable as e:
+                print(f"Local JWT verification unavailable, using auth server: {e}")
+
+        user = await _verify_remote(token)
+        _cache_put(token_hash, user)
+        return user
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    Verifies the JWT token from the Authorization header using Supabase.
+    Returns the user object if valid.
+    """
+    return await verify_token(credentials.credentials)
+
+
+async def get_stream_user(
+    access_token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(optional_security)
+):
+    """
+    Like get_current_user, but also accepts the token as ?access_token=...
+    (EventSource cannot send an Authorization header).
+    """
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await verify_token(token)
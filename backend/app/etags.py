@@ -0,0 +1,35 @@
+import hashlib
+from typing import Any
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Browsers keep the body but must revalidate it (If-None-Match) before use
+CACHE_CONTROL = "private, no-cache"
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as for GET
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def conditional_response(request: Request, content: Any) -> Response:
+    """
+    JSON response with an ETag derived from the body (so from the rows and
+    their timestamps), or 304 when it matches If-None-Match. The route has
+    always just queried: rows are written by other instances, the worker
+    and scripts, which no in-process state here would see.
+    """
+    response = JSONResponse(content=jsonable_encoder(content))
+    etag = 'W/"' + hashlib.sha1(response.body).hexdigest() + '"'
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
@@ -4,6 +4,12 @@ from fastapi.staticfiles import StaticFiles
 import os
 from pathlib import Path
 
+from .tracing import setup_tracing, shutdown_tracing, tracer, context_from
+from opentelemetry.trace import SpanKind
+
+# Tracing must be installed before the first span is created
+setup_tracing()
+
 app = FastAPI(title="Gemini Pipeline API")
 
 # CORS - Configure based on environment
@@ -27,11 +33,43 @@ else:
         allow_headers=["*"],
     )
 
+# Request tracing: one server span per API request, continuing an incoming
+# traceparent header when there is one
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=context_from(dict(request.headers)),
+        kind=SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.target": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+        # Name by route template so /products/{product_id} groups together
+        route = request.scope.get("route")
+        if route is not None and getattr(route, "path", None):
+            span.update_name(f"{request.method} {route.path}")
+        return response
+
 # Health Check
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "environment": os.getenv("NODE_ENV", "development")}
 
+# Metrics (Prometheus text format)
+# Set METRICS_TOKEN to require "Authorization: Bearer <token>" from the scraper
+from fastapi import Request, Response, HTTPException
+from .metrics import render_metrics, refresh_queue_depth
+
+@app.get("/api/metrics")
+async def metrics(request: Request):
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    await refresh_queue_depth()
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Routers
 from .routers import brands, products, pipeline, prompts, dashboard, sync
 app.include_router(brands.router)
@@ -41,6 +79,27 @@ app.include_router(prompts.router)
 app.include_router(dashboard.router)
 app.include_router(sync.router)
 
+# Pipeline Worker
+# Each API process also drains the durable job queue unless disabled
+# (e.g. when dedicated workers run via scripts/run_worker.py)
+from .services.pipeline_worker import pipeline_worker
+from .services.image_fetcher import image_fetcher
+from .services.upload_queue import upload_queue
+
+@app.on_event("startup")
+async def start_pipeline_worker():
+    if os.getenv("PIPELINE_WORKER_ENABLED", "true").lower() != "false":
+        pipeline_worker.start()
+
+@app.on_event("shutdown")
+async def stop_pipeline_worker():
+    if pipeline_worker.running:
+        await pipeline_worker.stop()
+    # Result documents are uploaded in the background; let them land
+    await upload_queue.drain(timeout=30)
+    await image_fetcher.close()
+    shutdown_tracing()
+
 # Static files (Frontend)
 # In production, Next.js runs separately and proxies API requests here
 # No need to serve static files from FastAPI
@@ -0,0 +1,147 @@
+import os
+import time
+from typing import Any, Dict
+import httpx
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Pipeline steps take seconds to minutes; API calls milliseconds to seconds
+STEP_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+CALL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+pipeline_step_seconds = Histogram(
+    "pipeline_step_duration_seconds", "Duration of a pipeline step",
+    ["step", "status"], buckets=STEP_BUCKETS
+)
+pipeline_products_total = Counter(
+    "pipeline_products_total", "Products finished by the pipeline worker", ["status"]
+)
+gemini_requests_total = Counter(
+    "gemini_requests_total", "Gemini generate_content calls",
+    ["model", "outcome", "retry"]
+)
+gemini_request_seconds = Histogram(
+    "gemini_request_duration_seconds", "Latency of Gemini generate_content calls",
+    ["model", "outcome"], buckets=CALL_BUCKETS
+)
+gemini_cache_total = Counter(
+    "gemini_response_cache_total", "Gemini response cache lookups", ["result"]
+)
+supabase_request_seconds = Histogram(
+    "supabase_request_duration_seconds", "Latency of Supabase database/storage/auth calls",
+    ["operation", "outcome"], buckets=CALL_BUCKETS
+)
+shopify_request_seconds = Histogram(
+    "shopify_request_duration_seconds", "Latency of Shopify API calls",
+    ["api", "method", "status"], buckets=CALL_BUCKETS
+)
+
+
+def _shopify_api(url: httpx.URL) -> str:
+    if url.path.endswith("/graphql.json"):
+        return "graphql"
+    if "/admin/api/" in url.path:
+        return "rest"
+    # Staged uploads go straight to Shopify's storage target
+    return "staged_upload"
+
+
+async def _on_shopify_request(request: httpx.Request):
+    request.extensions["metrics_started"] = time.perf_counter()
+
+
+async def _on_shopify_response(response: httpx.Response):
+    started = response.request.extensions.get("metrics_started")
+    if started is None:
+        return
+    shopify_request_seconds.labels(
+        api=_shopify_api(response.request.url),
+        method=response.request.method,
+        status=str(response.status_code)
+    ).observe(time.perf_counter() - started)
+
+
+def shopify_event_hooks() -> Dict[str, Any]:
+    """httpx event hooks that time every Shopify request: httpx.AsyncClient(event_hooks=...)."""
+    return {"request": [_on_shopify_request], "response": [_on_shopify_response]}
+
+
+# Claimable items per brand, read from the queue tables. Refreshed before a
+# scrape when older than QUEUE_DEPTH_CACHE_SECONDS, so scrapes stay cheap.
+QUEUE_DEPTH_CACHE_SECONDS = float(os.environ.get("QUEUE_DEPTH_CACHE_SECONDS", 15))
+_queue_depth: Dict[str, int] = {}
+_queue_depth_at = 0.0
+
+
+async def refresh_queue_depth():
+    """Reload _queue_depth (pipeline_queue_depth RPC) unless it is still fresh."""
+    global _queue_depth, _queue_depth_at
+    if time.monotonic() - _queue_depth_at < QUEUE_DEPTH_CACHE_SECONDS:
+        return
+    _queue_depth_at = time.monotonic()
+    from .supabase_client import supabase, execute
+    from .services.pipeline_worker import pipeline_worker
+    try:
+        response = await execute(supabase.rpc("pipeline_queue_depth", {"p_max_attempts": pipeline_worker.max_attempts}))
+        _queue_depth = {row["brand_id"]: row["pending"] for row in (response.data or [])}
+    except Exception as e:
+        print(f"Error reading pipeline queue depth: {e}")
+
+
+class RuntimeCollector:
+    """Gauges read from live objects at scrape time (pool, limiters, upload queue)."""
+
+    def describe(self):
+        # Without it the registry calls collect() on register, at import
+        # time, and the service imports below would be circular
+        return []
+
+    def collect(self):
+        # Imported here: the services import this module for their counters
+        from .services.worker_pool import product_pool
+        from .services.pipeline_worker import pipeline_worker
+        from .services.rate_limiter import gemini_limiters
+        from .services.upload_queue import upload_queue
+
+        in_flight = GaugeMetricFamily(
+            "pipeline_products_in_flight", "Products currently being processed", labels=["brand"]
+        )
+        waiting = GaugeMetricFamily(
+            "pipeline_products_waiting", "Claimed products waiting for a concurrency slot", labels=["brand"]
+        )
+        for brand_id in product_pool.brands():
+            in_flight.add_metric([brand_id], product_pool.in_flight(brand_id))
+            waiting.add_metric([brand_id], product_pool.waiting(brand_id))
+        yield in_flight
+        yield waiting
+
+        pending = GaugeMetricFamily(
+            "pipeline_items_pending", "Claimable job items in the queue (all workers)", labels=["brand"]
+        )
+        for brand_id, count in _queue_depth.items():
+            pending.add_metric([brand_id], count)
+        yield pending
+
+        claimed = GaugeMetricFamily("pipeline_items_claimed", "Job items leased by this worker")
+        claimed.add_metric([], pipeline_worker.claimed)
+        yield claimed
+
+        rpm = GaugeMetricFamily("gemini_rate_limit_rpm", "Current adaptive request rate", labels=["model"])
+        queued = GaugeMetricFamily("gemini_rate_limit_waiting", "Calls waiting for a rate limit token", labels=["model"])
+        for name, snapshot in gemini_limiters.snapshot().items():
+            rpm.add_metric([name], snapshot["current_rpm"])
+            queued.add_metric([name], snapshot["queue_depth"])
+        yield rpm
+        yield queued
+
+        uploads = GaugeMetricFamily("storage_uploads_pending", "Background storage uploads not finished")
+        uploads.add_metric([], upload_queue.pending)
+        yield uploads
+
+
+REGISTRY.register(RuntimeCollector())
+
+
+def render_metrics() -> tuple:
+    """Prometheus text exposition of every registered metric: (body, content type)."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
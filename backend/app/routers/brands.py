@@ -1,31 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from typing import List, Dict, Any
 from ..auth import get_current_user
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute
+from ..etags import conditional_response
 
 router = APIRouter(prefix="/api/brands", tags=["brands"])
 
 @router.get("/")
-async def get_brands(user=Depends(get_current_user)):
+async def get_brands(request: Request, user=Depends(get_current_user)):
     """
     Get all available brands.
     """
     try:
-        response = supabase.table("brands").select("*").execute()
-        return {"brands": response.data}
+        response = await execute(supabase.table("brands").select("*"))
+        return conditional_response(request, {"brands": response.data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{brand_id}")
-async def get_brand(brand_id: str, user=Depends(get_current_user)):
+async def get_brand(brand_id: str, request: Request, user=Depends(get_current_user)):
     """
     Get specific brand details.
     """
     try:
-        response = supabase.table("brands").select("*").eq("id", brand_id).execute()
+        response = await execute(supabase.table("brands").select("*").eq("id", brand_id))
         if not response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
-        return response.data[0]
+        return conditional_response(request, response.data[0])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -36,7 +37,7 @@ async def create_brand(brand: Dict[str, Any] = Body(...), user=Depends(get_curre
     """
     try:
         # TODO: Add validation
-        response = supabase.table("brands").insert(brand).execute()
+        response = await execute(supabase.table("brands").insert(brand))
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -47,7 +48,7 @@ async def update_brand_config(brand_id: str, config: Dict[str, Any] = Body(...),
     Update brand configuration (settings/shopify_config).
     """
     try:
-        response = supabase.table("brands").update(config).eq("id", brand_id).execute()
+        response = await execute(supabase.table("brands").update(config).eq("id", brand_id))
         if not response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         return response.data[0]
@@ -1,111 +1,195 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body
-from typing import List
-from ..auth import get_current_user
-from ..supabase_client import supabase
-from ..services.gemini_service import GeminiService
+import json
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from ..auth import get_current_user, get_stream_user
+from ..supabase_client import supabase, execute
+from ..services.job_queue import JobQueue
+from ..services.pipeline_worker import pipeline_worker
+from ..services.rate_limiter import gemini_limiters
+from ..services.event_bus import event_bus
+from ..services.brand_cache import invalidate_brand
+from ..etags import conditional_response
 
 router = APIRouter(prefix="/api/pipeline", tags=["pipeline"])
 
-async def run_pipeline_task(job_id: str, brand_id: str, product_ids: List[str], modes: List[str]):
-    """
-    Background task to run pipeline.
-    """
-    try:
-        service = GeminiService(brand_id)
-        
-        # Update job status
-        supabase.table("pipeline_jobs").update({"status": "running"}).eq("id", job_id).execute()
-        
-        processed_count = 0
-        for pid in product_ids:
-            # Fetch full product data (the whole row)
-            p_response = supabase.table("products").select("*").eq("brand_id", brand_id).eq("product_id", pid).execute()
-            if p_response.data:
-                product_data = p_response.data[0]
-                if not product_data:
-                     # Fallback 
-                     product_data = {"product_id": pid}
-                     
-                await service.process_product(product_data, modes)
-                
-            processed_count += 1
-            # Update progress
-            supabase.table("pipeline_jobs").update({"progress": processed_count}).eq("id", job_id).execute()
-            
-        supabase.table("pipeline_jobs").update({"status": "completed", "completed_at": "now()"}).eq("id", job_id).execute()
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        supabase.table("pipeline_jobs").update({"status": "failed", "error": str(e)}).eq("id", job_id).execute()
-
 @router.post("/run")
 async def run_pipeline(
-    background_tasks: BackgroundTasks,
     payload: dict = Body(...),
     user=Depends(get_current_user)
 ):
     """
     Start a pipeline job.
+    Products are queued as durable job items and picked up by pipeline workers.
     """
     try:
         brand_id = payload.get("brand_id")
         product_ids = payload.get("product_ids", [])
         modes = payload.get("modes", ['ecommerce', 'lookbook'])
+        # Regenerate every step instead of reusing cached Gemini responses
+        bypass_cache = bool(payload.get("bypass_cache", False))
         
         if not brand_id or not product_ids:
              raise HTTPException(status_code=400, detail="brand_id and product_ids required")
              
-        # Create Job
-        job_data = {
-            "brand_id": brand_id,
-            "status": "pending",
-            "total_products": len(product_ids),
-            "progress": 0,
-            "product_ids": product_ids 
-        }
-        response = supabase.table("pipeline_jobs").insert(job_data).execute()
-        job_id = response.data[0]['id']
+        # Create Job and queue its items
+        job_id = await JobQueue.enqueue(brand_id, product_ids, modes, bypass_cache=bypass_cache)
         
-        # Start Background Task
-        background_tasks.add_task(run_pipeline_task, job_id, brand_id, product_ids, modes)
+        # Let the local worker pick it up without waiting for the next poll
+        pipeline_worker.wake()
         
         return {"success": True, "job_id": job_id}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    brand_id: str,
+    job_id: Optional[str] = None,
+    user=Depends(get_stream_user)
+):
+    """
+    Server-sent events for pipeline progress of a brand (optionally one job):
+    job.queued / job.progress / job.completed / job.failed,
+    product.started / product.completed / product.failed and
+    step.started / step.completed / step.failed.
+    Authenticate with the Authorization header or ?access_token=.
+    """
+    subscription = event_bus.subscribe(brand_id=brand_id, job_id=job_id)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Job list columns: not the prompt snapshot or trace context each job carries
+JOB_SUMMARY_COLUMNS = "id, status, progress, total_products, modes, error, started_at, completed_at"
+
 @router.get("/jobs")
-async def list_jobs(brand_id: str, user=Depends(get_current_user)):
+async def list_jobs(brand_id: str, request: Request, user=Depends(get_current_user)):
+    """
+    Recent jobs of a brand. Always queried: job rows are also changed by
+    standalone workers and the queue RPCs, which no cache here sees. The
+    ETag only saves sending an unchanged body again.
+    """
     try:
-        response = supabase.table("pipeline_jobs").select("*").eq("brand_id", brand_id).order("started_at", desc=True).limit(20).execute()
-        return {"jobs": response.data}
+        response = await execute(supabase.table("pipeline_jobs").select(JOB_SUMMARY_COLUMNS).eq("brand_id", brand_id).order("started_at", desc=True).limit(20))
+        return conditional_response(request, {"jobs": response.data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/rate-limits")
+async def get_rate_limits(user=Depends(get_current_user)):
+    """
+    Current Gemini rate limiter state per model (rate and queue depth).
+    """
+    return {"models": gemini_limiters.snapshot()}
+
+@router.get("/jobs/{job_id}/items")
+async def list_job_items(job_id: str, request: Request, status: Optional[str] = None, user=Depends(get_current_user)):
+    """
+    Per-product state of a job: status, attempts, error, timings and the
+    per-step record of the last attempt. Filter with ?status=failed etc.
+    Items change as they finish, so this one is always queried; the ETag
+    only saves sending an unchanged body again.
+    """
+    try:
+        return conditional_response(request, {"items": await JobQueue.items(job_id, status)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str, payload: dict = Body(default={}), user=Depends(get_current_user)):
+    """
+    Re-queue only the failed items of a job (and, unless include_stalled is
+    false, running items whose worker stopped heartbeating). Completed
+    products are not sent to Gemini again.
+    """
+    try:
+        job = await JobQueue.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        requeued = await JobQueue.retry(job_id, include_stalled=bool(payload.get("include_stalled", True)))
+        if requeued:
+            invalidate_brand(job["brand_id"])
+            event_bus.publish("job.queued", job_id=job_id, brand_id=job["brand_id"], retried=requeued)
+            pipeline_worker.wake()
+        return {"success": True, "job_id": job_id, "requeued": requeued}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Active items with their job, for the product-status endpoints
+ACTIVE_ITEM_COLUMNS = "product_id, status, job_id, pipeline_jobs(id, status, progress, total_products, modes, started_at)"
+
 @router.get("/product-status/{product_id}")
 async def get_product_processing_status(product_id: str, brand_id: str, user=Depends(get_current_user)):
     """
     Check if a specific product is currently being processed in any active job.
     """
     try:
-        # Get all active jobs (pending or running) for this brand
-        response = supabase.table("pipeline_jobs").select("*").eq("brand_id", brand_id).in_("status", ["pending", "running"]).execute()
-        
-        is_processing = False
-        active_jobs = []
-        
-        if response.data:
-            for job in response.data:
-                # Check if this product is in the job's product list
-                # product_ids column is expected to be a JSON array of strings
-                job_product_ids = job.get('product_ids', [])
-                if job_product_ids and product_id in job_product_ids:
-                    is_processing = True
-                    active_jobs.append(job)
-        
-        return {"is_processing": is_processing, "active_jobs": active_jobs}
+        # Queued or running items of this product (idx_pipeline_job_items_active_product)
+        response = await execute(
+            supabase.table("pipeline_job_items").select(ACTIVE_ITEM_COLUMNS)
+            .eq("brand_id", brand_id).eq("product_id", product_id)
+            .in_("status", ["pending", "running"])
+        )
+        active_jobs = [item["pipeline_jobs"] for item in (response.data or []) if item.get("pipeline_jobs")]
+        return {"is_processing": bool(response.data), "active_jobs": active_jobs}
     except Exception as e:
         # Fallback to safe False if schema issue
         print(f"Error checking status: {e}")
         return {"is_processing": False, "error": str(e)}
+
+@router.post("/product-status")
+async def get_products_processing_status(payload: dict = Body(...), user=Depends(get_current_user)):
+    """
+    Batch variant for a product list page.
+    Body: {"brand_id": ..., "product_ids": [...]}.
+    Returns {"statuses": {product_id: {"is_processing", "status", "job_id"}}}.
+    """
+    brand_id = payload.get("brand_id")
+    product_ids = list(dict.fromkeys(payload.get("product_ids") or []))
+    if not brand_id:
+        raise HTTPException(status_code=400, detail="brand_id required")
+    if len(product_ids) > 500:
+        raise HTTPException(status_code=400, detail="At most 500 product_ids per request")
+
+    statuses = {pid: {"is_processing": False, "status": None, "job_id": None} for pid in product_ids}
+    if not product_ids:
+        return {"statuses": statuses}
+    try:
+        response = await execute(
+            supabase.table("pipeline_job_items").select("product_id, status, job_id")
+            .eq("brand_id", brand_id).in_("product_id", product_ids)
+            .in_("status", ["pending", "running"])
+        )
+        for item in response.data or []:
+            current = statuses[item["product_id"]]
+            # A running item wins over one that is still queued
+            if current["status"] != "running":
+                statuses[item["product_id"]] = {"is_processing": True, "status": item["status"], "job_id": item["job_id"]}
+        return {"statuses": statuses}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import json
+import base64
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import Optional, List
 from ..auth import get_current_user
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute
 from ..services.shopify_service import ShopifyService
+from ..services.product_results import ProductResults
+from ..services.brand_cache import product_counts, facets_cache, invalidate_brand
+from ..etags import conditional_response
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
+# Columns of products (schema_products_final.sql plus migrations)
+PRODUCT_COLUMNS = {
+    "id", "brand_id", "product_id", "title", "vendor", "product_type", "tags", "image_urls",
+    "atc_delta", "full_data", "generated_content", "result_summary", "uploaded_at", "processed",
+    "processed_at", "flagged", "shopify_id", "shopify_handle", "shopify_status", "shopify_raw_data",
+    "last_synced_at", "metafield_synced_at", "push_status", "pushed_at"
+}
+
+# What the product grid shows. The raw Shopify/CSV payloads and the result
+# document are left out unless asked for with ?fields=
+LIST_FIELDS = [
+    "id", "product_id", "shopify_id", "shopify_handle", "title", "vendor", "product_type",
+    "image_urls", "uploaded_at", "processed", "processed_at", "flagged", "push_status",
+    "pushed_at", "result_summary"
+]
+
+
+def select_fields(fields: Optional[str], default: List[str]) -> List[str]:
+    """
+    Columns for a ?fields= parameter: comma-separated names, or '*' for all.
+    Without it the default projection is used. Unknown names are a 400.
+    """
+    if not fields:
+        return list(default)
+    if fields.strip() == "*":
+        return ["*"]
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in PRODUCT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # Rows are addressed by id everywhere in the UI
+    return requested if "id" in requested else ["id"] + requested
+
 class PushPayload(BaseModel):
     product_id: str
     brand_id: str
@@ -18,13 +57,13 @@ async def push_to_shopify(payload: PushPayload, user=Depends(get_current_user)):
     """
     try:
         # 1. Fetch Product
-        p_res = supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id).execute()
+        p_res = await execute(supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id))
         if not p_res.data:
             raise HTTPException(status_code=404, detail="Product not found")
-        product = p_res.data[0]
+        product = await ProductResults.attach(p_res.data[0])
 
         # 2. Fetch Brand Config (Shopify Creds)
-        b_res = supabase.table("brands").select("*").eq("id", payload.brand_id).execute()
+        b_res = await execute(supabase.table("brands").select("*").eq("id", payload.brand_id))
         if not b_res.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         brand_config = b_res.data[0].get("shopify_config", {})
@@ -39,11 +78,13 @@ async def push_to_shopify(payload: PushPayload, user=Depends(get_current_user)):
             "metafield_synced_at": "now()"
         }
         
-        # If CDN URLs were added, update generated_content
+        # If CDN URLs were added, store the updated document
         if result.get("updated_generated_content"):
-            update_data["generated_content"] = result["updated_generated_content"]
+            await ProductResults.save(payload.product_id, payload.brand_id, result["updated_generated_content"])
+            update_data["generated_content"] = None
         
-        supabase.table("products").update(update_data).eq("id", payload.product_id).execute()
+        await execute(supabase.table("products").update(update_data).eq("id", payload.product_id))
+        invalidate_brand(payload.brand_id)
 
         return {"success": True, "details": result}
     except Exception as e:
@@ -51,9 +92,94 @@ async def push_to_shopify(payload: PushPayload, user=Depends(get_current_user)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def encode_cursor(*position) -> str:
+    """
+    Opaque cursor. List pages use ("after" | "before", uploaded_at, id);
+    search results, which are ordered by rank, use ("offset", n).
+    """
+    raw = json.dumps(list(position), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(position, list):
+            if len(position) == 3 and position[0] in ("after", "before") and position[1] and position[2]:
+                return position
+            if len(position) == 2 and position[0] == "offset" and isinstance(position[1], int) and position[1] >= 0:
+                return position
+    except (ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def apply_product_filters(query, vendor, product_type, processed, push_status):
+    if vendor:
+        query = query.eq("vendor", vendor)
+    if product_type:
+        query = query.eq("product_type", product_type)
+    if processed is not None:
+        query = query.eq("processed", processed)
+    if push_status:
+        if push_status == 'pending':
+            # Pending can be explicit 'pending' or NULL (default)
+            query = query.or_("push_status.eq.pending,push_status.is.null")
+        else:
+            query = query.eq("push_status", push_status)
+    return query
+
+
+async def count_products(brand_id: str, vendor, product_type, processed, push_status) -> int:
+    """Total for a filter set, cached per brand for PRODUCT_COUNT_CACHE_SECONDS."""
+    key = (vendor, product_type, processed, push_status)
+    total = product_counts.get(brand_id, key)
+    if total is None:
+        query = supabase.table("products").select("id", count="exact", head=True).eq("brand_id", brand_id)
+        response = await execute(apply_product_filters(query, *key))
+        total = response.count
+        product_counts.set(brand_id, total, key)
+    return total
+
+
+async def search_products(brand_id: str, search: str, columns: List[str], limit: int, offset: int,
+                          vendor, product_type, processed, push_status) -> dict:
+    """
+    Ranked search through the search_products RPC (indexed; see
+    migrations/013_add_product_search.sql), then one query for the rows.
+    """
+    response = await execute(supabase.rpc("search_products", {
+        "p_brand_id": brand_id,
+        "p_query": search,
+        "p_vendor": vendor or None,
+        "p_product_type": product_type or None,
+        "p_processed": processed,
+        "p_push_status": push_status or None,
+        "p_limit": limit + 1,
+        "p_offset": offset
+    }))
+    hits = response.data or []
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    ids = [hit["id"] for hit in hits]
+
+    rows = []
+    if ids:
+        rows_response = await execute(supabase.table("products").select(",".join(columns)).in_("id", ids))
+        by_id = {row["id"]: row for row in (rows_response.data or [])}
+        rows = [by_id[i] for i in ids if i in by_id]
+    return {
+        "products": rows,
+        "total": hits[0]["total"] if hits else (0 if offset == 0 else None),
+        "next_cursor": encode_cursor("offset", offset + limit) if has_more else None,
+        "prev_cursor": encode_cursor("offset", max(0, offset - limit)) if offset > 0 else None
+    }
+
+
 @router.get("")
 async def list_products(
     brand_id: str,
+    request: Request,
     page: int = 1,
     limit: int = 50,
     search: Optional[str] = None,
@@ -61,56 +187,130 @@ async def list_products(
     product_type: Optional[str] = None, # Was 'collection'
     processed: Optional[bool] = None,
     push_status: Optional[str] = None, # NEW
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     user=Depends(get_current_user)
 ):
     """
-    List products with filtering and pagination.
+    List products with filtering and pagination, newest first.
+    Returns the grid columns (LIST_FIELDS) unless ?fields= names others.
+
+    Pages are keyed on (uploaded_at, id): pass next_cursor / prev_cursor
+    from a response as ?cursor= to move on, at the same cost however deep.
+    ?page= (offset paging) still works without a cursor. The total is
+    cached briefly per filter set; include_total=false skips it.
+
+    ?search= matches title, handle, vendor, type and tags (word prefixes
+    and close spellings) and orders by relevance instead.
+
+    Pages carry an ETag; a matching If-None-Match gets a 304 (still queried).
     """
+    columns = select_fields(fields, LIST_FIELDS)
+    if "generated_content" in columns:
+        raise HTTPException(status_code=400, detail="generated_content is only returned by GET /api/products/{product_id}")
+    # Cursors are built from these
+    columns += [c for c in ("id", "uploaded_at") if c not in columns and "*" not in columns]
+    limit = max(1, min(limit, 500))
+    position = decode_cursor(cursor) if cursor else None
+    search = (search or "").strip()
+    if position and (position[0] == "offset") != bool(search):
+        raise HTTPException(status_code=400, detail="Cursor does not match this listing")
     try:
-        query = supabase.table("products").select("*", count="exact").eq("brand_id", brand_id)
-        
         if search:
-            query = query.ilike("title", f"%{search}%")
-        if vendor:
-            query = query.eq("vendor", vendor)
-        if product_type:
-            query = query.eq("product_type", product_type)
-        if processed is not None:
-            query = query.eq("processed", processed)
-        if push_status:
-            if push_status == 'pending':
-                # Pending can be explicit 'pending' or NULL (default)
-                query = query.or_("push_status.eq.pending,push_status.is.null")
-            else:
-                query = query.eq("push_status", push_status)
-            
-        # Pagination
-        start = (page - 1) * limit
-        end = start + limit - 1
-        query = query.range(start, end).order("uploaded_at", desc=True)
-        
-        response = query.execute()
-        
-        return {
-            "products": response.data,
-            "total": response.count,
+            offset = position[1] if position else max(0, (page - 1) * limit)
+            result = await search_products(
+                brand_id, search, columns, limit, offset, vendor, product_type, processed, push_status
+            )
+            return conditional_response(request, {**result, "page": page, "limit": limit})
+
+        query = supabase.table("products").select(",".join(columns)).eq("brand_id", brand_id)
+        query = apply_product_filters(query, vendor, product_type, processed, push_status)
+
+        # "before" pages are read in ascending order from the cursor, then flipped
+        direction = position[0] if position else None
+        ascending = direction == "before"
+        if direction:
+            op = "gt" if ascending else "lt"
+            uploaded_at, row_id = position[1], position[2]
+            query = query.or_(f'uploaded_at.{op}."{uploaded_at}",and(uploaded_at.eq."{uploaded_at}",id.{op}.{row_id})')
+        query = query.order("uploaded_at", desc=not ascending).order("id", desc=not ascending)
+        # One row more than asked for tells whether another page follows
+        if direction or page <= 1:
+            query = query.limit(limit + 1)
+        else:
+            start = (page - 1) * limit
+            query = query.range(start, start + limit)
+
+        if include_total:
+            response, total = await asyncio.gather(
+                execute(query),
+                count_products(brand_id, vendor, product_type, processed, push_status)
+            )
+        else:
+            response, total = await execute(query), None
+
+        rows = response.data or []
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if ascending:
+            rows.reverse()
+        # Coming back from a later page, there is always a next one
+        has_next = has_more if not ascending else True
+        has_prev = has_more if ascending else bool(direction) or page > 1
+
+        return conditional_response(request, {
+            "products": rows,
+            "total": total,
             "page": page,
-            "limit": limit
-        }
+            "limit": limit,
+            "next_cursor": encode_cursor("after", rows[-1]["uploaded_at"], rows[-1]["id"]) if rows and has_next else None,
+            "prev_cursor": encode_cursor("before", rows[0]["uploaded_at"], rows[0]["id"]) if rows and has_prev else None
+        })
+    except HTTPException:
+        raise
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/facets")
+async def get_product_facets(brand_id: str, user=Depends(get_current_user)):
+    """
+    Values for the filter controls: distinct vendor, product_type,
+    push_status and processed values of the brand with product counts,
+    each list as [{"value": ..., "count": n}], most common first.
+    One grouped query (product_facets RPC), cached per brand for
+    FACETS_CACHE_SECONDS; syncs, uploads and pipeline/push writes drop it.
+    """
+    try:
+        facets = facets_cache.get(brand_id)
+        if facets is None:
+            response = await execute(supabase.rpc("product_facets", {"p_brand_id": brand_id}))
+            facets = response.data
+            facets_cache.set(brand_id, facets)
+        return facets
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{product_id}")
-async def get_product(product_id: str, brand_id: str, user=Depends(get_current_user)):
+async def get_product(product_id: str, brand_id: str, request: Request, fields: Optional[str] = None, user=Depends(get_current_user)):
     """
-    Get single product details.
+    Get single product details: every column plus the full pipeline result
+    as generated_content, or only the columns named in ?fields=.
+    Answers If-None-Match with 304 (see app/etags.py). Always queried, since
+    pipeline workers in other processes write products too.
     """
+    columns = select_fields(fields, ["*"])
     try:
-        response = supabase.table("products").select("*").eq("product_id", product_id).execute()
+        response = await execute(supabase.table("products").select(",".join(columns)).eq("product_id", product_id))
         if not response.data:
             raise HTTPException(status_code=404, detail="Product not found")
-        return response.data[0]
+        product = response.data[0]
+        if "*" in columns or "generated_content" in columns:
+            # Detail view: include the full pipeline result
+            await ProductResults.attach(product)
+        return conditional_response(request, product)
     except HTTPException:
         raise
     except Exception as e:
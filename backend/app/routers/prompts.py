@@ -1,35 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from typing import List, Dict, Any
 from ..auth import get_current_user
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute
 from ..services.prompt_service import PromptService
+from ..etags import conditional_response
 
 router = APIRouter(prefix="/api/prompts", tags=["prompts"])
 
 @router.get("/")
-async def get_prompts(brand_id: str, user=Depends(get_current_user)):
+async def get_prompts(brand_id: str, request: Request, user=Depends(get_current_user)):
     """
     Get all prompts for a brand.
     """
     try:
-        response = supabase.table("prompts").select("*").eq("brand_id", brand_id).execute()
-        return {"prompts": response.data}
+        response = await execute(supabase.table("prompts").select("*").eq("brand_id", brand_id))
+        return conditional_response(request, {"prompts": response.data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{name}")
-async def get_prompt(brand_id: str, name: str, user=Depends(get_current_user)):
+async def get_prompt(brand_id: str, name: str, request: Request, user=Depends(get_current_user)):
     """
     Get specific prompt.
     """
     try:
-        response = supabase.table("prompts").select("*").eq("brand_id", brand_id).eq("name", name).execute()
+        response = await execute(supabase.table("prompts").select("*").eq("brand_id", brand_id).eq("name", name))
         if not response.data:
             # Return empty skeleton if not found, or error?
             # Legacy returned default prompts from file.
             pass
             raise HTTPException(status_code=404, detail="Prompt not found")
-        return response.data[0]
+        return conditional_response(request, response.data[0])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -48,7 +49,7 @@ async def update_prompt(
         raise HTTPException(status_code=400, detail="Content required")
         
     try:
-        PromptService.save_prompt(brand_id, name, content)
+        await PromptService.save_prompt(brand_id, name, content)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
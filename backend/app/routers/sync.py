@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from typing import Dict, Any
 from pydantic import BaseModel
 from ..auth import get_current_user
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute
 from ..services.shopify_sync_service import ShopifySyncService
+from ..services.product_results import ProductResults
 
 
 router = APIRouter(prefix="/api/sync", tags=["sync"])
@@ -33,7 +34,7 @@ async def sync_product(payload: SyncProductRequest, user=Depends(get_current_use
     """
     try:
         # Fetch brand configuration
-        brand_response = supabase.table("brands").select("*").eq("id", payload.brand_id).execute()
+        brand_response = await execute(supabase.table("brands").select("*").eq("id", payload.brand_id))
         if not brand_response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         
@@ -69,7 +70,7 @@ async def batch_sync_products(payload: BatchSyncProductRequest, user=Depends(get
     """
     try:
         # Fetch brand configuration
-        brand_response = supabase.table("brands").select("*").eq("id", payload.brand_id).execute()
+        brand_response = await execute(supabase.table("brands").select("*").eq("id", payload.brand_id))
         if not brand_response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         
@@ -140,7 +141,7 @@ async def refresh_product(
     """
     try:
         # Fetch existing product to get shopify_id
-        product_response = supabase.table("products").select("*").eq("id", product_id).eq("brand_id", brand_id).execute()
+        product_response = await execute(supabase.table("products").select("*").eq("id", product_id).eq("brand_id", brand_id))
         if not product_response.data:
             raise HTTPException(status_code=404, detail="Product not found")
         
@@ -151,7 +152,7 @@ async def refresh_product(
             raise HTTPException(status_code=400, detail="Product does not have a Shopify ID")
         
         # Fetch brand configuration
-        brand_response = supabase.table("brands").select("*").eq("id", brand_id).execute()
+        brand_response = await execute(supabase.table("brands").select("*").eq("id", brand_id))
         if not brand_response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         
@@ -180,11 +181,11 @@ async def push_metafield(payload: MetafieldRequest, user=Depends(get_current_use
     """
     try:
         # Fetch product from Supabase
-        product_response = supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id).execute()
+        product_response = await execute(supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id))
         if not product_response.data:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        product = product_response.data[0]
+        product = await ProductResults.attach(product_response.data[0])
         shopify_id = product.get("shopify_id")
         generated_content = product.get("generated_content")
         
@@ -195,7 +196,7 @@ async def push_metafield(payload: MetafieldRequest, user=Depends(get_current_use
             raise HTTPException(status_code=400, detail="Product does not have generated content to push")
         
         # Fetch brand configuration
-        brand_response = supabase.table("brands").select("*").eq("id", payload.brand_id).execute()
+        brand_response = await execute(supabase.table("brands").select("*").eq("id", payload.brand_id))
         if not brand_response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         
@@ -210,9 +211,9 @@ async def push_metafield(payload: MetafieldRequest, user=Depends(get_current_use
         
         # Update metafield_synced_at in Supabase
         from datetime import datetime
-        supabase.table("products").update({
+        await execute(supabase.table("products").update({
             "metafield_synced_at": datetime.utcnow().isoformat()
-        }).eq("id", payload.product_id).execute()
+        }).eq("id", payload.product_id))
         
         return {
             "success": True,
@@ -231,7 +232,7 @@ async def pull_metafield(payload: MetafieldRequest, user=Depends(get_current_use
     """
     try:
         # Fetch product from Supabase
-        product_response = supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id).execute()
+        product_response = await execute(supabase.table("products").select("*").eq("id", payload.product_id).eq("brand_id", payload.brand_id))
         if not product_response.data:
             raise HTTPException(status_code=404, detail="Product not found")
         
@@ -242,7 +243,7 @@ async def pull_metafield(payload: MetafieldRequest, user=Depends(get_current_use
             raise HTTPException(status_code=400, detail="Product does not have a Shopify ID")
         
         # Fetch brand configuration
-        brand_response = supabase.table("brands").select("*").eq("id", payload.brand_id).execute()
+        brand_response = await execute(supabase.table("brands").select("*").eq("id", payload.brand_id))
         if not brand_response.data:
             raise HTTPException(status_code=404, detail="Brand not found")
         
@@ -263,10 +264,11 @@ async def pull_metafield(payload: MetafieldRequest, user=Depends(get_current_use
         
         # Update generated_content in Supabase
         from datetime import datetime
-        supabase.table("products").update({
-            "generated_content": metafield_content,
+        await ProductResults.save(payload.product_id, payload.brand_id, metafield_content)
+        await execute(supabase.table("products").update({
+            "generated_content": None,
             "metafield_synced_at": datetime.utcnow().isoformat()
-        }).eq("id", payload.product_id).execute()
+        }).eq("id", payload.product_id))
         
         return {
             "success": True,
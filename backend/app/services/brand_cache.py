@@ -0,0 +1,52 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class BrandCache:
+    """
+    Small in-process cache of per-brand query results (counts, aggregates).
+    Entries expire after ttl seconds; writes that change a brand's catalog
+    call invalidate(brand_id) so this process never serves stale values for
+    its own changes. Other processes catch up when their entries expire.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # brand_id -> key -> (stored_at, value)
+        self._entries: Dict[str, Dict[Hashable, Tuple[float, Any]]] = {}
+
+    def get(self, brand_id: str, key: Hashable = None) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(brand_id, {}).get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def set(self, brand_id: str, value: Any, key: Hashable = None):
+        with self._lock:
+            self._entries.setdefault(brand_id, {})[key] = (time.monotonic(), value)
+
+    def invalidate(self, brand_id: str):
+        with self._lock:
+            self._entries.pop(brand_id, None)
+
+
+# Product totals per (brand, filters) for the product list
+product_counts = BrandCache(ttl=float(os.environ.get("PRODUCT_COUNT_CACHE_SECONDS", 60)))
+
+# /api/dashboard/stats per brand
+dashboard_cache = BrandCache(ttl=float(os.environ.get("DASHBOARD_CACHE_SECONDS", 15)))
+
+# Filter values with counts (/api/products/facets) per brand
+facets_cache = BrandCache(ttl=float(os.environ.get("FACETS_CACHE_SECONDS", 300)))
+
+_caches = [product_counts, dashboard_cache, facets_cache]
+
+
+def invalidate_brand(brand_id: str):
+    """Drop everything cached for a brand; call after writes to its products."""
+    for cache in _caches:
+        cache.invalidate(brand_id)
@@ -0,0 +1,66 @@
+import time
+import asyncio
+from typing import Any, Dict, Optional, Set
+
+
+class Subscription:
+    """One listener's queue of events, optionally filtered to a brand and/or job."""
+
+    def __init__(self, brand_id: Optional[str], job_id: Optional[str], max_queue: int):
+        self.brand_id = brand_id
+        self.job_id = job_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.brand_id and event.get("brand_id") != self.brand_id:
+            return False
+        if self.job_id and event.get("job_id") != self.job_id:
+            return False
+        return True
+
+    def put(self, event: Dict[str, Any]):
+        # A slow consumer loses its oldest events rather than stalling publishers
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+
+
+class EventBus:
+    """
+    In-process pub/sub for pipeline progress.
+
+    Publishers (job queue, pipeline worker, step graph) call publish() with a
+    plain dict; it never blocks. Subscribers (the SSE endpoint) get their own
+    bounded queue. Only work done in this process is seen here; jobs run by
+    other worker processes show up through the job rows.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: Set[Subscription] = set()
+
+    def subscribe(self, brand_id: Optional[str] = None, job_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(brand_id, job_id, self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event_type: str, **fields):
+        event = {"type": event_type, "ts": time.time(), **fields}
+        for subscription in list(self._subscribers):
+            if subscription.matches(event):
+                subscription.put(event)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+event_bus = EventBus()
@@ -5,7 +5,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from typing import Optional
 from ..auth import get_current_user
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute
+from .product_results import ProductResults
+from .brand_cache import invalidate_brand
 
 
 class FlagImagePayload(BaseModel):
@@ -41,13 +43,13 @@ async def flag_product_image(
         )
     
     # Fetch product
-    response = supabase.table("products").select("*").eq("id", product_id).eq("brand_id", brand_id).execute()
+    response = await execute(supabase.table("products").select("*").eq("id", product_id).eq("brand_id", brand_id))
     
     if not response.data:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product = response.data[0]
-    generated_content = product.get("generated_content", {})
+    product = await ProductResults.attach(response.data[0])
+    generated_content = product.get("generated_content") or {}
     
     if not generated_content:
         raise HTTPException(status_code=400, detail="Product has no generated content")
@@ -95,20 +97,23 @@ async def flag_product_image(
                 has_flagged_images = True
                 break
     
-    # Update product in database
-    update_data = {
-        "generated_content": generated_content,
-        "flagged": has_flagged_images
-    }
-    
-    update_response = supabase.table("products").update(update_data).eq("id", product_id).execute()
+    # Update product in database (the document first; its trigger refreshes the summary)
+    await ProductResults.save(product_id, brand_id, generated_content)
+    update_response = await execute(supabase.table("products").update({
+        "flagged": has_flagged_images,
+        # Clears a copy left inline by rows written before product_results
+        "generated_content": None
+    }).eq("id", product_id))
     
     if not update_response.data:
         raise HTTPException(status_code=500, detail="Failed to update product")
+    invalidate_brand(brand_id)
     
+    updated_product = update_response.data[0]
+    updated_product["generated_content"] = generated_content
     return {
         "success": True,
         "message": f"Image {'flagged' if payload.flagged else 'unflagged'} successfully",
-        "product": update_response.data[0],
+        "product": updated_product,
         "has_flagged_images": has_flagged_images
     }
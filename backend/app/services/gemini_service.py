@@ -1,18 +1,59 @@
 import os
 import json
+import time
 import asyncio
-import httpx
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 import google.generativeai as genai
-from PIL import Image
-import io
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute, run_blocking
 from .prompt_service import PromptService
+from .step_graph import StepGraph, StepListener
+from .response_cache import response_cache
+from .image_fetcher import image_fetcher
+from .upload_queue import upload_queue
+from .product_results import ProductResults
+from .brand_cache import invalidate_brand
+from .image_derivatives import make_derivatives_async
+from .image_preprocess import prepare_images
+from .rate_limiter import gemini_limiters, is_rate_limit_error, backoff_delay
+from ..tracing import tracer
+from ..metrics import gemini_requests_total, gemini_request_seconds, gemini_cache_total, pipeline_step_seconds
+
+# Bookkeeping columns of a products row that change on every run. They are
+# left out of the prompt context so identical products produce identical
+# prompts (and hit the response cache).
+VOLATILE_PRODUCT_FIELDS = {
+    "generated_content", "result_summary", "processed", "processed_at", "flagged",
+    "push_status", "pushed_at", "pushed_to_shopify",
+    "last_synced_at", "metafield_synced_at", "uploaded_at",
+    # Generated search columns (migration 013): derived, token-heavy noise
+    "search_vector", "search_text"
+}
+
+# What the pipeline reads of a products row: the source data only, never the
+# previous run's output (result_summary, generated_content) or bookkeeping
+PIPELINE_PRODUCT_COLUMNS = (
+    "id, brand_id, product_id, title, vendor, product_type, tags, image_urls, atc_delta, "
+    "full_data, shopify_id, shopify_handle, shopify_status, shopify_raw_data"
+)
 
 class GeminiService:
-    def __init__(self, brand_id: str):
+    def __init__(
+        self,
+        brand_id: str,
+        bypass_cache: bool = False,
+        prompts: Optional[Dict[str, str]] = None,
+        on_step: Optional[StepListener] = None
+    ):
         self.brand_id = brand_id
+        # When set, cached responses are ignored (fresh results still refresh the cache)
+        self.bypass_cache = bypass_cache
+        # Prompt snapshot taken when the job was queued; None means use the live prompts
+        self.prompts = prompts
+        # Notified when each pipeline step starts and ends (progress events)
+        self.on_step = on_step
+        # (image entry, field, upload task); awaited before the result is saved
+        self._uploads: List[tuple] = []
         api_key = os.environ.get("GOOGLE_API_KEY")
         if not api_key:
             print("Warning: GOOGLE_API_KEY not found")
@@ -21,19 +62,6 @@ class GeminiService:
             self.text_model = genai.GenerativeModel('gemini-3-pro-preview') # Or 2.0-flash-exp if available
             self.image_model = genai.GenerativeModel('gemini-3-pro-image-preview') # For image gen if needed on specific model
 
-    async def download_image(self, url: str) -> Optional[Image.Image]:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=10.0)
-                response.raise_for_status()
-                img = Image.open(io.BytesIO(response.content))
-                if img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
-                return img
-        except Exception as e:
-            print(f"Failed to download image {url}: {e}")
-            return None
-
     def extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
         if not response_text:
             return {}
@@ -50,23 +78,93 @@ class GeminiService:
             return {"error": "Failed to parse JSON", "raw": response_text}
 
     async def generate_content_with_retry(self, content: list, generation_config: Optional[Dict[str, Any]] = None) -> str:
-        # Simple retry logic with optional generation config for strict output formatting
-        for attempt in range(3):
-            try:
-                # Run sync generate_content in thread for async compat
-                if generation_config:
-                    response = await asyncio.to_thread(
-                        self.text_model.generate_content, 
-                        content,
-                        generation_config=generation_config
-                    )
-                else:
-                    response = await asyncio.to_thread(self.text_model.generate_content, content)
-                return response.text
-            except Exception as e:
-                print(f"Generation attempt {attempt+1} failed: {e}")
-                await asyncio.sleep(2 * (attempt + 1))
-        return ""
+        # Identical model, config, prompt and images -> reuse the previous response
+        model_name = getattr(self.text_model, 'model_name', 'text-model')
+        cache_key = None
+        if response_cache.enabled:
+            cache_key = response_cache.key(model_name, generation_config, content)
+            if not self.bypass_cache:
+                cached = await response_cache.aget(cache_key)
+                gemini_cache_total.labels(result="hit" if cached is not None else "miss").inc()
+                if cached is not None:
+                    print(f"Response cache hit ({cache_key[:12]})")
+                    return cached
+
+        try:
+            text = await self._call_model(
+                self.text_model, content, generation_config,
+                extract=lambda response: response.text
+            )
+        except Exception as e:
+            print(f"Generation failed after retries: {e}")
+            return ""
+        if cache_key and text:
+            await response_cache.aset(cache_key, model_name, text)
+        return text
+
+    async def _call_model(
+        self,
+        model,
+        content: list,
+        generation_config: Optional[Dict[str, Any]] = None,
+        attempts: int = 3,
+        retry_all_errors: bool = True,
+        extract: Callable[[Any], Any] = lambda response: response
+    ) -> Any:
+        """
+        Call model.generate_content through the per-model rate limiter.
+
+        429/quota errors slow the limiter down and are always retried (with
+        jittered exponential backoff); other errors are retried only when
+        retry_all_errors is set. The last error is re-raised.
+        """
+        limiter = gemini_limiters.get(getattr(model, 'model_name', 'gemini-model'))
+        for attempt in range(attempts):
+            with tracer.start_as_current_span("gemini generate_content") as span:
+                span.set_attribute("gemini.model", limiter.name)
+                span.set_attribute("gemini.attempt", attempt + 1)
+                waited = time.perf_counter()
+                await limiter.acquire()
+                span.set_attribute("gemini.rate_limit_wait_ms", round((time.perf_counter() - waited) * 1000))
+                started = time.perf_counter()
+                try:
+                    # Run sync generate_content in thread for async compat
+                    if generation_config:
+                        response = await asyncio.to_thread(
+                            model.generate_content,
+                            content,
+                            generation_config=generation_config
+                        )
+                    else:
+                        response = await asyncio.to_thread(model.generate_content, content)
+                    result = extract(response)
+                    limiter.on_success()
+                    self._record_call(limiter.name, "success", attempt, started)
+                    span.set_attribute("gemini.outcome", "success")
+                    return result
+                except Exception as e:
+                    throttled = is_rate_limit_error(e)
+                    if throttled:
+                        limiter.on_throttle()
+                    outcome = "rate_limited" if throttled else "error"
+                    self._record_call(limiter.name, outcome, attempt, started)
+                    span.set_attribute("gemini.outcome", outcome)
+                    print(f"Generation attempt {attempt+1} failed{' (rate limited)' if throttled else ''}: {e}")
+                    if attempt == attempts - 1 or not (throttled or retry_all_errors):
+                        raise
+                    span.record_exception(e)
+            await asyncio.sleep(backoff_delay(attempt))
+
+    @staticmethod
+    def _record_call(model_name: str, outcome: str, attempt: int, started: float):
+        gemini_requests_total.labels(model=model_name, outcome=outcome, retry="true" if attempt else "false").inc()
+        gemini_request_seconds.labels(model=model_name, outcome=outcome).observe(time.perf_counter() - started)
+
+    def _on_step(self, step: str, timing: Dict[str, Any]):
+        if timing["status"] != "running":
+            pipeline_step_seconds.labels(step=step, status=timing["status"]).observe(timing["duration_ms"] / 1000)
+        if self.on_step:
+            self.on_step(step, timing)
 
     async def _cleanup_previous_data(self, product_id: str):
         """
@@ -80,7 +178,7 @@ class GeminiService:
             images_path = f"{self.brand_id}/{product_id}"
             try:
                 # List all files in the images bucket for this product
-                files_response = supabase.storage.from_("images").list(images_path)
+                files_response = await run_blocking(supabase.storage.from_("images").list, images_path)
                 
                 # Build list of file paths to delete
                 files_to_delete = []
@@ -99,7 +197,7 @@ class GeminiService:
                 # Delete all files at once
                 if files_to_delete:
                     print(f"Deleting {len(files_to_delete)} files from images bucket")
-                    supabase.storage.from_("images").remove(files_to_delete)
+                    await run_blocking(supabase.storage.from_("images").remove, files_to_delete)
                     print(f"Deleted images: {files_to_delete}")
                 else:
                     print("No images to delete")
@@ -109,7 +207,7 @@ class GeminiService:
             
             # 2. Delete all files from output bucket for this product
             try:
-                files_response = supabase.storage.from_("output").list(images_path)
+                files_response = await run_blocking(supabase.storage.from_("output").list, images_path)
                 
                 # Build list of file paths to delete
                 files_to_delete = []
@@ -128,7 +226,7 @@ class GeminiService:
                 # Delete all files at once
                 if files_to_delete:
                     print(f"Deleting {len(files_to_delete)} files from output bucket")
-                    supabase.storage.from_("output").remove(files_to_delete)
+                    await run_blocking(supabase.storage.from_("output").remove, files_to_delete)
                     print(f"Deleted outputs: {files_to_delete}")
                 else:
                     print("No output files to delete")
@@ -143,40 +241,40 @@ class GeminiService:
                 # First, check if the product exists
                 # NOTE: product_id variable actually contains shopify_handle value
                 # The database product_id field contains the numeric Shopify ID
-                check_result = supabase.table("products").select("id, product_id, shopify_handle, generated_content, processed").eq(
+                check_result = await execute(supabase.table("products").select("id, product_id, shopify_handle, result_summary, processed").eq(
                     "brand_id", self.brand_id
-                ).eq("shopify_handle", product_id).execute()
+                ).eq("shopify_handle", product_id))
                 
                 if not check_result.data:
                     print(f"WARNING: No product found with brand_id='{self.brand_id}' and shopify_handle='{product_id}'")
                     print(f"DEBUG: Trying to find product by other fields...")
                     # Try to find by product_id if shopify_handle doesn't match
-                    alt_check = supabase.table("products").select("id, product_id, shopify_handle").eq(
+                    alt_check = await execute(supabase.table("products").select("id, product_id, shopify_handle").eq(
                         "brand_id", self.brand_id
-                    ).eq("product_id", product_id).execute()
+                    ).eq("product_id", product_id))
                     
                     if alt_check.data:
                         print(f"DEBUG: Found product by product_id field instead")
                         print(f"  - product_id: {alt_check.data[0].get('product_id')}, shopify_handle: {alt_check.data[0].get('shopify_handle')}")
                     else:
                         # Show all products for debugging
-                        all_products = supabase.table("products").select("id, product_id, shopify_handle").eq(
+                        all_products = await execute(supabase.table("products").select("id, product_id, shopify_handle").eq(
                             "brand_id", self.brand_id
-                        ).execute()
+                        ))
                         print(f"DEBUG: Found {len(all_products.data) if all_products.data else 0} products for this brand")
                         if all_products.data:
                             for p in all_products.data[:3]:  # Show first 3
                                 print(f"  - product_id: {p.get('product_id')}, shopify_handle: {p.get('shopify_handle')}")
                 else:
-                    print(f"DEBUG: Found product: id={check_result.data[0].get('id')}, product_id={check_result.data[0].get('product_id')}, has_generated_content={bool(check_result.data[0].get('generated_content'))}, processed={check_result.data[0].get('processed')}")
+                    print(f"DEBUG: Found product: id={check_result.data[0].get('id')}, product_id={check_result.data[0].get('product_id')}, has_result={bool(check_result.data[0].get('result_summary'))}, processed={check_result.data[0].get('processed')}")
                 
                 # Perform the update using shopify_handle
-                result = supabase.table("products").update({
+                result = await execute(supabase.table("products").update({
                     "generated_content": None,
                     "processed": False,
                     "push_status": None,
                     "pushed_at": None
-                }).eq("brand_id", self.brand_id).eq("shopify_handle", product_id).execute()
+                }).eq("brand_id", self.brand_id).eq("shopify_handle", product_id))
                 
                 affected_rows = len(result.data) if result.data else 0
                 print(f"Cleared generated_content for product: {product_id} (affected rows: {affected_rows})")
@@ -184,14 +282,18 @@ class GeminiService:
                 if affected_rows == 0:
                     print(f"WARNING: Database update affected 0 rows - trying with product_id field as fallback")
                     # Fallback: try using product_id field
-                    result = supabase.table("products").update({
+                    result = await execute(supabase.table("products").update({
                         "generated_content": None,
                         "processed": False,
                         "push_status": None,
                         "pushed_at": None
-                    }).eq("brand_id", self.brand_id).eq("product_id", product_id).execute()
+                    }).eq("brand_id", self.brand_id).eq("product_id", product_id))
                     affected_rows = len(result.data) if result.data else 0
                     print(f"Fallback attempt affected {affected_rows} rows")
+
+                # The result document lives in its own table
+                await ProductResults.delete([row["id"] for row in (result.data or [])])
+                invalidate_brand(self.brand_id)
                     
             except Exception as e:
                 print(f"ERROR: Could not clear generated_content in database: {e}")
@@ -207,12 +309,17 @@ class GeminiService:
         print(f"Processing Product: {product_id}")
         
         # Clean up previous data before starting new processing
-        await self._cleanup_previous_data(product_id)
-        
+        with tracer.start_as_current_span("cleanup_previous_data"):
+            await self._cleanup_previous_data(product_id)
+
+        # Without a job snapshot, load the brand's prompts once for all steps
+        if self.prompts is None:
+            self.prompts = await PromptService.get_prompts(self.brand_id)
+
         # Fetch brand name from database
         brand_name = "Unknown"
         try:
-            brand_res = supabase.table("brands").select("name").eq("id", self.brand_id).execute()
+            brand_res = await execute(supabase.table("brands").select("name").eq("id", self.brand_id))
             if brand_res.data:
                 brand_name = brand_res.data[0].get("name", "Unknown")
         except Exception as e:
@@ -240,14 +347,17 @@ class GeminiService:
             "pipeline_outputs": {}
         }
         
+        graph = StepGraph(listener=self._on_step)
         try:
             # 0. Download Images - Download ALL product images
             image_urls = product_data.get('image_urls', [])
-            images = []
-            for url in image_urls:  # Process all images
-                img = await self.download_image(url)
-                if img:
-                    images.append(img)
+            # Fetched in parallel through the shared image fetcher; order is preserved.
+            # Each image is downsized and encoded once, and the same blobs are
+            # reused by every step below.
+            with tracer.start_as_current_span("fetch_images") as span:
+                span.set_attribute("images.requested", len(image_urls))
+                downloaded = await image_fetcher.fetch_many(image_urls)
+                images = await prepare_images(downloaded)
             
             if not images:
                 raise Exception("No valid images found for product")
@@ -255,253 +365,61 @@ class GeminiService:
             # Update images_processed count
             result["images_processed"] = len(images)
 
-            # Step 1: Metadata
-            print("Step 1: Metadata")
-            prompt1_template = PromptService.get_prompt(self.brand_id, "step1_metadata.txt")
-            # Fill template (simplified)
-            prompt1 = prompt1_template.replace("{product_title}", product_data.get('title', '')) \
-                                      .replace("{product_id}", product_id)
-            # Just append the whole product data as context if prompt expects it
-            prompt1 += f"\n\nContext Product Data: {json.dumps(product_data, default=str)}"
-            
-            step1_content = [prompt1] + images
-            # Enforce JSON output for metadata step
-            step1_res_text = await self.generate_content_with_retry(
-                step1_content, 
-                generation_config={"response_mime_type": "application/json"}
-            )
-            step1_json = self.extract_json_from_response(step1_res_text)
-            result['pipeline_outputs']['step1_metadata'] = step1_json
-            
-            # Step 2: Attributes (Only for Ecommerce)
+            # Build the step graph. The ecommerce branch (2 -> 3 -> 4) and the
+            # lookbook branch (5 -> 6) only need step 1, so they run side by side;
+            # QA waits for everything.
+            outputs = result['pipeline_outputs']
+
+            async def metadata(done):
+                outputs['step1_metadata'] = await self._step_metadata(product_data, product_id, images)
+                return outputs['step1_metadata']
+
+            graph.add("step1_metadata", metadata)
+
             if 'ecommerce' in modes:
-                print("Step 2: Attributes")
-                prompt2_template = PromptService.get_prompt(self.brand_id, "step2_attributes.txt")
-                prompt2 = prompt2_template + f"\n\nMetadata so far: {json.dumps(step1_json)}"
-                
-                step2_content = [prompt2] + images
-                # Enforce JSON output for attributes step
-                step2_res_text = await self.generate_content_with_retry(
-                    step2_content,
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                step2_json = self.extract_json_from_response(step2_res_text)
-                result['pipeline_outputs']['step2_attributes'] = step2_json
-                
-                # Step 3: E-commerce Prompts
-                print("Step 3: E-commerce Prompts")
-                prompt3_template = PromptService.get_prompt(self.brand_id, "step3_ecommerce_prompts.txt")
-                prompt3 = prompt3_template.replace("{attributes_json}", json.dumps(step2_json)) \
-                                          .replace("{metadata_json}", json.dumps(step1_json))
-                
-                step3_content = [prompt3] + images
-                # Enforce JSON output for ecommerce prompts step
-                step3_res_text = await self.generate_content_with_retry(
-                    step3_content,
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                step3_json = self.extract_json_from_response(step3_res_text)
-                result['pipeline_outputs']['step3_ecommerce_prompts'] = step3_json
-                
-                # Step 4: E-commerce Image Generation
-                print("Step 4: E-commerce Images")
-                prompt4_template = PromptService.get_prompt(self.brand_id, "ecommerce_image_generation.txt")
-                
-                # Track which model is used for image generation
-                image_generation_model = self.image_model.model_name if hasattr(self.image_model, 'model_name') else "gemini-image-model"
-                
-                # Generate images in parallel
-                image_tasks = []
-                
-                # Step 3 Loop with Debug
-                generated_images_list = []
-                
-                # Handle potential list response
-                if isinstance(step3_json, list):
-                    ecommerce_prompts = step3_json
-                else:
-                    ecommerce_prompts = step3_json.get("image_prompts", [])
-
-                print(f"DEBUG Step 3 Prompts Type: {type(ecommerce_prompts)}")
-                print(f"DEBUG Step 3 Prompts Content: {ecommerce_prompts}")
-
-                for item_data in ecommerce_prompts:
-                     if not isinstance(item_data, dict):
-                         print(f"SKIPPING INVALID ITEM (Not a dict): {item_data}")
-                         continue
-
-                     async def gen_image_task(item_data):
-                          attr_name = item_data.get('prompt_for_attribute', 'unknown')
-                          detailed_prompt = item_data.get('setting', '') + " " + item_data.get('model_description', '')
-                          
-                          full_prompt = prompt4_template.replace("{detailed_prompt}", detailed_prompt) \
-                                                        .replace("{focus_attribute}", attr_name)
-                          
-                          # 2 Ref Images + Prompt
-                          content = images[:2] + [full_prompt]
-                          
-                          try:
-                              # Generate Image (using same chat-like interface but for image model)
-                              # Note: Current Gemini API for Python returns generic 'Image Generation' via distinct method?
-                              # The legacy code called `generate_content` on `image_gen_model`.
-                              response = await asyncio.to_thread(self.image_model.generate_content, content)
-                              
-                              # Check for image parts
-                              if response.parts:
-                                  part = response.parts[0]
-                                  if hasattr(part, 'inline_data'):
-                                      img_data = part.inline_data.data
-                                      filename = f"ecommerce_{attr_name.replace(' ', '_')}.png"
-                                      path = f"{self.brand_id}/{product_id}/{filename}"
-                                      
-                                      # Upload to Supabase Storage
-                                      supabase.storage.from_("images").upload(path, img_data, file_options={"upsert": "true"})
-                                      
-                                      # Return public URL (assuming bucket is public or signed URL needed)
-                                      public_url = supabase.storage.from_("images").get_public_url(path)
-                                      return {
-                                          "attribute": attr_name,
-                                          "image_path": public_url,
-                                          "status": "generated"
-                                      }
-                          except Exception as e:
-                              print(f"Image Gen Failed for {attr_name}: {e}")
-                              return {
-                                  "attribute": attr_name,
-                                  "error": str(e),
-                                  "status": "failed"
-                              }
-                     
-                     image_tasks.append(gen_image_task(item_data))
-                     
-                # Execute all image tasks
-                generated_images_results = await asyncio.gather(*image_tasks)
-                result['pipeline_outputs']['step4_ecommerce_images'] = {
-                    "product_id": product_id,
-                    "ecommerce_images": generated_images_results,
-                    "generation_method": image_generation_model
-                }
-
-            # Step 5: Lookbook Prompts
+                async def attributes(done):
+                    outputs['step2_attributes'] = await self._step_attributes(images, done["step1_metadata"])
+                    return outputs['step2_attributes']
+
+                async def ecommerce_prompts(done):
+                    outputs['step3_ecommerce_prompts'] = await self._step_ecommerce_prompts(
+                        images, done["step1_metadata"], done["step2_attributes"]
+                    )
+                    return outputs['step3_ecommerce_prompts']
+
+                async def ecommerce_images(done):
+                    outputs['step4_ecommerce_images'] = await self._step_ecommerce_images(
+                        images, product_id, done["step3_ecommerce_prompts"]
+                    )
+                    return outputs['step4_ecommerce_images']
+
+                graph.add("step2_attributes", attributes, ["step1_metadata"])
+                graph.add("step3_ecommerce_prompts", ecommerce_prompts, ["step2_attributes"])
+                graph.add("step4_ecommerce_images", ecommerce_images, ["step3_ecommerce_prompts"])
+
             if 'lookbook' in modes:
-                print("Step 5: Lookbook Prompts")
-                prompt5_template = PromptService.get_prompt(self.brand_id, "step5_lookbook_prompts.txt")
-                prompt5 = prompt5_template.replace("{metadata_json}", json.dumps(step1_json)) \
-                                          .replace("{product_title}", product_data.get('title', ''))
-                
-                step5_content = [prompt5] + images
-                # Enforce JSON output for lookbook prompts step
-                step5_res_text = await self.generate_content_with_retry(
-                    step5_content,
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                step5_json = self.extract_json_from_response(step5_res_text)
-                result['pipeline_outputs']['step5_lookbook_prompts'] = step5_json
-                
-                # Step 6: Lookbook Image Generation
-                print("Step 6: Lookbook Images")
-                prompt6_template = PromptService.get_prompt(self.brand_id, "lookbook_image_generation.txt")
-                
-                lookbook_tasks = []
-                
-                # Handle potential list response
-                if isinstance(step5_json, list):
-                    lookbook_prompts = step5_json
-                else:
-                    lookbook_prompts = step5_json.get("lookbook_prompts", [])
-
-                print(f"DEBUG Step 5 Prompts Type: {type(lookbook_prompts)}")
-                print(f"DEBUG Step 5 Prompts Content: {lookbook_prompts}")
-
-                for i, item_data in enumerate(lookbook_prompts):
-                    if not isinstance(item_data, dict):
-                         print(f"SKIPPING INVALID ITEM (Not a dict): {item_data}")
-                         continue
-
-                    async def gen_lookbook_task(item_data, index):
-                         scenario_name = item_data.get('scenario_name', f"Scenario {index+1}")
-                         # Construct detailed prompt
-                         full_prompt_parts = [
-                            f"Scenario: {item_data.get('scenario_description', '')}",
-                            f"Model & Mood: {item_data.get('model_action_and_mood', '')}",
-                            f"Wearing: Product shown in reference images",
-                            "Style: Natural lighting, candid moment, high-end fashion photography",
-                            "Requirements: Photorealistic, no text or logos"
-                         ]
-                         detailed_prompt = " ".join(full_prompt_parts)
-                         
-                         full_prompt = prompt6_template.replace("{detailed_prompt}", detailed_prompt) \
-                                                       .replace("{scenario_name}", scenario_name)
-
-                         content = images[:2] + [full_prompt]
-                         
-                         try:
-                             response = await asyncio.to_thread(self.image_model.generate_content, content)
-                             
-                             if response.parts:
-                                 part = response.parts[0]
-                                 if hasattr(part, 'inline_data'):
-                                     img_data = part.inline_data.data
-                                     filename = f"lookbook_{index}_{scenario_name.replace(' ', '_')}.png"
-                                     path = f"{self.brand_id}/{product_id}/{filename}"
-                                     
-                                     supabase.storage.from_("images").upload(path, img_data, file_options={"upsert": "true"})
-                                     public_url = supabase.storage.from_("images").get_public_url(path)
-                                     
-                                     return {
-                                         "scenario": scenario_name,
-                                         "image_path": public_url,
-                                         "status": "generated"
-                                     }
-                         except Exception as e:
-                             print(f"Lookbook Gen Failed for {scenario_name}: {e}")
-                             return {
-                                 "scenario": scenario_name,
-                                 "error": str(e),
-                                 "status": "failed"
-                             }
-                    
-                    lookbook_tasks.append(gen_lookbook_task(item_data, i))
-                
-                lookbook_results = await asyncio.gather(*lookbook_tasks)
-                result['pipeline_outputs']['step6_lookbook_images'] = {
-                    "lookbook_images": lookbook_results
-                }
-            
-            # Step 7: QA Report
-            print("Step 7: QA Report")
-            try:
-                prompt7_template = PromptService.get_prompt(self.brand_id, "step7_qa.txt")
-                
-                # Prepare guardrails summary
-                guardrails_summary = "All generated content must be factually accurate, visually consistent, benefit-focused, and adhere to specified formatting rules."
-                
-                # Build QA prompt with all generated assets
-                prompt7 = prompt7_template.replace("{source_product_data}", json.dumps(result.get("source_data", {}))) \
-                                          .replace("{guardrails_summary}", guardrails_summary) \
-                                          .replace("{metadata_json}", json.dumps(result['pipeline_outputs'].get('step1_metadata', {}))) \
-                                          .replace("{attributes_json}", json.dumps(result['pipeline_outputs'].get('step2_attributes', {}))) \
-                                          .replace("{ecommerce_prompts_json}", json.dumps(result['pipeline_outputs'].get('step3_ecommerce_prompts', {}))) \
-                                          .replace("{lookbook_prompts_json}", json.dumps(result['pipeline_outputs'].get('step5_lookbook_prompts', {}))) \
-                                          .replace("{product_id}", product_id)
-                
-                step7_content = [prompt7] + images
-                step7_res_text = await self.generate_content_with_retry(
-                    step7_content,
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                step7_json = self.extract_json_from_response(step7_res_text)
-                result['pipeline_outputs']['step7_qa_report'] = step7_json
-            except Exception as e:
-                print(f"QA Report generation failed: {e}")
-                # Add a default QA report if generation fails
-                result['pipeline_outputs']['step7_qa_report'] = {
-                    "qa_report_id": f"QA_{product_id}",
-                    "overall_status": "Error",
-                    "summary": f"QA report generation failed: {str(e)}",
-                    "checks": []
-                }
-            
+                async def lookbook_prompts(done):
+                    outputs['step5_lookbook_prompts'] = await self._step_lookbook_prompts(
+                        images, product_data, done["step1_metadata"]
+                    )
+                    return outputs['step5_lookbook_prompts']
+
+                async def lookbook_images(done):
+                    outputs['step6_lookbook_images'] = await self._step_lookbook_images(
+                        images, product_id, done["step5_lookbook_prompts"]
+                    )
+                    return outputs['step6_lookbook_images']
+
+                graph.add("step5_lookbook_prompts", lookbook_prompts, ["step1_metadata"])
+                graph.add("step6_lookbook_images", lookbook_images, ["step5_lookbook_prompts"])
+
+            async def qa_report(done):
+                outputs['step7_qa_report'] = await self._step_qa_report(result, product_id, images)
+                return outputs['step7_qa_report']
+
+            graph.add("step7_qa_report", qa_report, graph.steps)
+
+            await graph.run()
             result['status'] = 'completed'
             
         except Exception as e:
@@ -510,22 +428,315 @@ class GeminiService:
             result['error'] = str(e)
             
         finally:
-            self._save_result(product_id, result)
+            result['step_timings'] = graph.timings
+            with tracer.start_as_current_span("await_uploads"):
+                await self._await_uploads()
+            with tracer.start_as_current_span("save_result"):
+                await self._save_result(product_id, result)
             return result
 
-    def _save_result(self, product_id: str, result: dict):
+    async def _step_metadata(self, product_data: dict, product_id: str, images: list) -> Dict[str, Any]:
+        # Step 1: Metadata
+        print("Step 1: Metadata")
+        prompt1_template = await PromptService.get_prompt(self.brand_id, "step1_metadata.txt", self.prompts)
+        # Fill template (simplified)
+        prompt1 = prompt1_template.replace("{product_title}", product_data.get('title', '')) \
+                                  .replace("{product_id}", product_id)
+        # Just append the whole product data as context if prompt expects it
+        context_data = {k: v for k, v in product_data.items() if k not in VOLATILE_PRODUCT_FIELDS}
+        prompt1 += f"\n\nContext Product Data: {json.dumps(context_data, default=str)}"
+        
+        step1_content = [prompt1] + images
+        # Enforce JSON output for metadata step
+        step1_res_text = await self.generate_content_with_retry(
+            step1_content, 
+            generation_config={"response_mime_type": "application/json"}
+        )
+        return self.extract_json_from_response(step1_res_text)
+
+    async def _step_attributes(self, images: list, step1_json: Dict[str, Any]) -> Dict[str, Any]:
+        # Step 2: Attributes (Only for Ecommerce)
+        print("Step 2: Attributes")
+        prompt2_template = await PromptService.get_prompt(self.brand_id, "step2_attributes.txt", self.prompts)
+        prompt2 = prompt2_template + f"\n\nMetadata so far: {json.dumps(step1_json)}"
+        
+        step2_content = [prompt2] + images
+        # Enforce JSON output for attributes step
+        step2_res_text = await self.generate_content_with_retry(
+            step2_content,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        return self.extract_json_from_response(step2_res_text)
+
+    async def _step_ecommerce_prompts(self, images: list, step1_json: Dict[str, Any], step2_json: Dict[str, Any]) -> Dict[str, Any]:
+        # Step 3: E-commerce Prompts
+        print("Step 3: E-commerce Prompts")
+        prompt3_template = await PromptService.get_prompt(self.brand_id, "step3_ecommerce_prompts.txt", self.prompts)
+        prompt3 = prompt3_template.replace("{attributes_json}", json.dumps(step2_json)) \
+                                  .replace("{metadata_json}", json.dumps(step1_json))
+        
+        step3_content = [prompt3] + images
+        # Enforce JSON output for ecommerce prompts step
+        step3_res_text = await self.generate_content_with_retry(
+            step3_content,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        return self.extract_json_from_response(step3_res_text)
+
+    async def _step_ecommerce_images(self, images: list, product_id: str, step3_json: Any) -> Dict[str, Any]:
+        # Step 4: E-commerce Image Generation
+        print("Step 4: E-commerce Images")
+        prompt4_template = await PromptService.get_prompt(self.brand_id, "ecommerce_image_generation.txt", self.prompts)
+        
+        # Track which model is used for image generation
+        image_generation_model = self.image_model.model_name if hasattr(self.image_model, 'model_name') else "gemini-image-model"
+        
+        # Generate images in parallel
+        image_tasks = []
+        
+        # Handle potential list response
+        if isinstance(step3_json, list):
+            ecommerce_prompts = step3_json
+        else:
+            ecommerce_prompts = step3_json.get("image_prompts", [])
+
+        print(f"DEBUG Step 3 Prompts Type: {type(ecommerce_prompts)}")
+        print(f"DEBUG Step 3 Prompts Content: {ecommerce_prompts}")
+
+        for item_data in ecommerce_prompts:
+             if not isinstance(item_data, dict):
+                 print(f"SKIPPING INVALID ITEM (Not a dict): {item_data}")
+                 continue
+
+             async def gen_image_task(item_data):
+                  attr_name = item_data.get('prompt_for_attribute', 'unknown')
+                  detailed_prompt = item_data.get('setting', '') + " " + item_data.get('model_description', '')
+                  
+                  full_prompt = prompt4_template.replace("{detailed_prompt}", detailed_prompt) \
+                                                .replace("{focus_attribute}", attr_name)
+                  
+                  # 2 Ref Images + Prompt
+                  content = images[:2] + [full_prompt]
+                  
+                  try:
+                      # Generate Image (using same chat-like interface but for image model)
+                      # Note: Current Gemini API for Python returns generic 'Image Generation' via distinct method?
+                      # The legacy code called `generate_content` on `image_gen_model`.
+                      response = await self._call_model(self.image_model, content, retry_all_errors=False)
+                      
+                      # Check for image parts
+                      if response.parts:
+                          part = response.parts[0]
+                          if hasattr(part, 'inline_data'):
+                              img_data = part.inline_data.data
+                              entry = {
+                                  "attribute": attr_name,
+                                  "status": "generated"
+                              }
+                              await self._store_generated_image(
+                                  entry, product_id, f"ecommerce_{attr_name.replace(' ', '_')}", img_data
+                              )
+                              return entry
+                  except Exception as e:
+                      print(f"Image Gen Failed for {attr_name}: {e}")
+                      return {
+                          "attribute": attr_name,
+                          "error": str(e),
+                          "status": "failed"
+                      }
+             
+             image_tasks.append(gen_image_task(item_data))
+             
+        # Execute all image tasks
+        generated_images_results = await asyncio.gather(*image_tasks)
+        return {
+            "product_id": product_id,
+            "ecommerce_images": generated_images_results,
+            "generation_method": image_generation_model
+        }
+
+    async def _step_lookbook_prompts(self, images: list, product_data: dict, step1_json: Dict[str, Any]) -> Dict[str, Any]:
+        # Step 5: Lookbook Prompts
+        print("Step 5: Lookbook Prompts")
+        prompt5_template = await PromptService.get_prompt(self.brand_id, "step5_lookbook_prompts.txt", self.prompts)
+        prompt5 = prompt5_template.replace("{metadata_json}", json.dumps(step1_json)) \
+                                  .replace("{product_title}", product_data.get('title', ''))
+        
+        step5_content = [prompt5] + images
+        # Enforce JSON output for lookbook prompts step
+        step5_res_text = await self.generate_content_with_retry(
+            step5_content,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        return self.extract_json_from_response(step5_res_text)
+
+    async def _step_lookbook_images(self, images: list, product_id: str, step5_json: Any) -> Dict[str, Any]:
+        # Step 6: Lookbook Image Generation
+        print("Step 6: Lookbook Images")
+        prompt6_template = await PromptService.get_prompt(self.brand_id, "lookbook_image_generation.txt", self.prompts)
+        
+        lookbook_tasks = []
+        
+        # Handle potential list response
+        if isinstance(step5_json, list):
+            lookbook_prompts = step5_json
+        else:
+            lookbook_prompts = step5_json.get("lookbook_prompts", [])
+
+        print(f"DEBUG Step 5 Prompts Type: {type(lookbook_prompts)}")
+        print(f"DEBUG Step 5 Prompts Content: {lookbook_prompts}")
+
+        for i, item_data in enumerate(lookbook_prompts):
+            if not isinstance(item_data, dict):
+                 print(f"SKIPPING INVALID ITEM (Not a dict): {item_data}")
+                 continue
+
+            async def gen_lookbook_task(item_data, index):
+                 scenario_name = item_data.get('scenario_name', f"Scenario {index+1}")
+                 # Construct detailed prompt
+                 full_prompt_parts = [
+                    f"Scenario: {item_data.get('scenario_description', '')}",
+                    f"Model & Mood: {item_data.get('model_action_and_mood', '')}",
+                    f"Wearing: Product shown in reference images",
+                    "Style: Natural lighting, candid moment, high-end fashion photography",
+                    "Requirements: Photorealistic, no text or logos"
+                 ]
+                 detailed_prompt = " ".join(full_prompt_parts)
+                 
+                 full_prompt = prompt6_template.replace("{detailed_prompt}", detailed_prompt) \
+                                               .replace("{scenario_name}", scenario_name)
+
+                 content = images[:2] + [full_prompt]
+                 
+                 try:
+                     response = await self._call_model(self.image_model, content, retry_all_errors=False)
+                     
+                     if response.parts:
+                         part = response.parts[0]
+                         if hasattr(part, 'inline_data'):
+                             img_data = part.inline_data.data
+                             entry = {
+                                 "scenario": scenario_name,
+                                 "status": "generated"
+                             }
+                             await self._store_generated_image(
+                                 entry, product_id, f"lookbook_{index}_{scenario_name.replace(' ', '_')}", img_data
+                             )
+                             return entry
+                 except Exception as e:
+                     print(f"Lookbook Gen Failed for {scenario_name}: {e}")
+                     return {
+                         "scenario": scenario_name,
+                         "error": str(e),
+                         "status": "failed"
+                     }
+            
+            lookbook_tasks.append(gen_lookbook_task(item_data, i))
+        
+        lookbook_results = await asyncio.gather(*lookbook_tasks)
+        return {
+            "lookbook_images": lookbook_results
+        }
+
+    async def _step_qa_report(self, result: dict, product_id: str, images: list) -> Dict[str, Any]:
+        # Step 7: QA Report
+        print("Step 7: QA Report")
+        try:
+            prompt7_template = await PromptService.get_prompt(self.brand_id, "step7_qa.txt", self.prompts)
+            
+            # Prepare guardrails summary
+            guardrails_summary = "All generated content must be factually accurate, visually consistent, benefit-focused, and adhere to specified formatting rules."
+            
+            # Build QA prompt with all generated assets
+            prompt7 = prompt7_template.replace("{source_product_data}", json.dumps(result.get("source_data", {}))) \
+                                      .replace("{guardrails_summary}", guardrails_summary) \
+                                      .replace("{metadata_json}", json.dumps(result['pipeline_outputs'].get('step1_metadata', {}))) \
+                                      .replace("{attributes_json}", json.dumps(result['pipeline_outputs'].get('step2_attributes', {}))) \
+                                      .replace("{ecommerce_prompts_json}", json.dumps(result['pipeline_outputs'].get('step3_ecommerce_prompts', {}))) \
+                                      .replace("{lookbook_prompts_json}", json.dumps(result['pipeline_outputs'].get('step5_lookbook_prompts', {}))) \
+                                      .replace("{product_id}", product_id)
+            
+            step7_content = [prompt7] + images
+            step7_res_text = await self.generate_content_with_retry(
+                step7_content,
+                generation_config={"response_mime_type": "application/json"}
+            )
+            return self.extract_json_from_response(step7_res_text)
+        except Exception as e:
+            print(f"QA Report generation failed: {e}")
+            # Add a default QA report if generation fails
+            return {
+                "qa_report_id": f"QA_{product_id}",
+                "overall_status": "Error",
+                "summary": f"QA report generation failed: {str(e)}",
+                "checks": []
+            }
+
+    async def _store_generated_image(self, entry: Dict[str, Any], product_id: str, name: str, img_data: bytes):
+        """
+        Queue a generated PNG and its WebP derivatives (full-size master plus
+        thumbnails) for upload, and record their URLs on the image entry:
+        image_path, webp_path and thumbnails {size: url}.
+        """
+        base = f"{self.brand_id}/{product_id}/{name}"
+        # Uploads run in the background; the URLs are known up front
+        entry["image_path"] = upload_queue.public_url("images", f"{base}.png")
+        self._uploads.append((entry, None, upload_queue.submit("images", f"{base}.png", img_data, "image/png")))
+
+        try:
+            derivatives = await make_derivatives_async(img_data)
+        except Exception as e:
+            print(f"Could not create WebP derivatives for {base}: {e}")
+            await image_fetcher.prime(entry["image_path"], img_data)
+            return
+
+        entry["webp_path"] = upload_queue.public_url("images", f"{base}.webp")
+        self._uploads.append((entry, "webp_path", upload_queue.submit("images", f"{base}.webp", derivatives["webp"], "image/webp")))
+        entry["thumbnails"] = {}
+        for size, thumb in derivatives["thumbnails"].items():
+            path = f"{base}_{size}.webp"
+            entry["thumbnails"][str(size)] = upload_queue.public_url("images", path)
+            self._uploads.append((entry, f"thumbnails.{size}", upload_queue.submit("images", path, thumb, "image/webp")))
+        # The Shopify push re-reads the master; keep a local copy
+        await image_fetcher.prime(entry["webp_path"], derivatives["webp"])
+
+    async def _await_uploads(self):
+        """
+        Wait for this product's image uploads. An image whose PNG could not be
+        stored is marked failed; a derivative that could not be stored is
+        dropped from its entry.
+        """
+        uploads, self._uploads = self._uploads, []
+        if not uploads:
+            return
+        outcomes = await asyncio.gather(*(task for _, _, task in uploads), return_exceptions=True)
+        for (entry, field, _), outcome in zip(uploads, outcomes):
+            if not isinstance(outcome, BaseException):
+                continue
+            if field is None:
+                entry["status"] = "failed"
+                entry["error"] = f"Upload failed: {outcome}"
+            elif field.startswith("thumbnails."):
+                entry.get("thumbnails", {}).pop(field.split(".", 1)[1], None)
+            else:
+                entry.pop(field, None)
+
+    async def _save_result(self, product_id: str, result: dict):
         # 1. Update DB
         # NOTE: product_id variable actually contains shopify_handle value
         # The database product_id field contains the numeric Shopify ID
         try:
             print(f"DEBUG: Saving result for shopify_handle='{product_id}'")
             
-            # Use shopify_handle to match the product
-            update_result = supabase.table("products").update({
-                "generated_content": result,
+            # Use shopify_handle to match the product. The row only gets the
+            # processed flags; the document goes to product_results
+            row_update = {
                 "processed": True if result['status'] == 'completed' else False,
                 "processed_at": datetime.now().isoformat()
-            }).eq("brand_id", self.brand_id).eq("shopify_handle", product_id).execute()
+            }
+            update_result = await execute(supabase.table("products").update(row_update).eq(
+                "brand_id", self.brand_id
+            ).eq("shopify_handle", product_id))
             
             affected_rows = len(update_result.data) if update_result.data else 0
             print(f"DEBUG: Database update affected {affected_rows} rows")
@@ -533,22 +744,23 @@ class GeminiService:
             if affected_rows == 0:
                 print(f"WARNING: Failed to save result - trying with product_id field as fallback")
                 # Fallback: try using product_id field
-                update_result = supabase.table("products").update({
-                    "generated_content": result,
-                    "processed": True if result['status'] == 'completed' else False,
-                    "processed_at": datetime.now().isoformat()
-                }).eq("brand_id", self.brand_id).eq("product_id", product_id).execute()
+                update_result = await execute(supabase.table("products").update(row_update).eq(
+                    "brand_id", self.brand_id
+                ).eq("product_id", product_id))
                 affected_rows = len(update_result.data) if update_result.data else 0
                 print(f"DEBUG: Fallback attempt affected {affected_rows} rows")
+
+            await ProductResults.save_many(self.brand_id, {row["id"]: result for row in (update_result.data or [])})
+            invalidate_brand(self.brand_id)
                 
         except Exception as e:
             print(f"Error updating DB: {e}")
             import traceback
             traceback.print_exc()
         
-        # 2. Save to Storage
+        # 2. Save to Storage (a copy of the DB row; nothing waits for it)
         try:
-            json_content = json.dumps(result, indent=2)
-            supabase.storage.from_("output").upload(f"{self.brand_id}/{product_id}/product_data.json", json_content.encode(), file_options={"upsert": "true"})
+            json_content = json.dumps(result, separators=(",", ":"))
+            upload_queue.submit("output", f"{self.brand_id}/{product_id}/product_data.json", json_content.encode(), "application/json")
         except Exception as e:
             print(f"Error updating Storage: {e}")
@@ -0,0 +1,42 @@
+import io
+import os
+import asyncio
+from typing import Dict, List
+from PIL import Image
+
+WEBP_QUALITY = int(os.environ.get("DERIVATIVE_WEBP_QUALITY", 82))
+# Longest edge, in pixels, of each thumbnail
+THUMBNAIL_SIZES = [
+    int(size) for size in os.environ.get("DERIVATIVE_THUMBNAIL_SIZES", "256,768").split(",") if size.strip()
+]
+
+
+def _encode_webp(img: Image.Image, quality: int) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format="WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def make_derivatives(data: bytes, quality: int = WEBP_QUALITY, sizes: List[int] = THUMBNAIL_SIZES) -> Dict[str, object]:
+    """
+    Encode a generated image as a full-size WebP master plus one WebP
+    thumbnail per size. Returns {"webp": bytes, "thumbnails": {size: bytes}}.
+    """
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+    thumbnails = {}
+    for size in sorted(set(sizes)):
+        if size >= max(img.size):
+            continue  # No upscaled copies; the master covers it
+        thumb = img.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        thumbnails[size] = _encode_webp(thumb, quality)
+    return {"webp": _encode_webp(img, quality), "thumbnails": thumbnails}
+
+
+async def make_derivatives_async(data: bytes) -> Dict[str, object]:
+    """make_derivatives off the event loop."""
+    return await asyncio.to_thread(make_derivatives, data)
@@ -0,0 +1,210 @@
+import os
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from typing import Dict, List, Optional
+import httpx
+from .response_cache import cache_dir
+from ..tracing import instrument_client
+
+
+class ImageFetcher:
+    """
+    Shared image downloader for the pipeline and the Shopify push.
+
+    - one pooled httpx.AsyncClient for all downloads
+    - at most IMAGE_FETCH_CONCURRENCY downloads in flight
+    - local disk cache (LRU, capped at IMAGE_CACHE_MAX_BYTES). Entries checked
+      within IMAGE_CACHE_FRESH_SECONDS are served as-is; older entries are
+      revalidated with If-None-Match / If-Modified-Since and reused on 304.
+    """
+
+    def __init__(self, root: str, max_bytes: int, concurrency: int, fresh_seconds: float, timeout: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.fresh_seconds = fresh_seconds
+        self.timeout = timeout
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    # --- HTTP -------------------------------------------------------------
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = instrument_client(httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            ))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # --- Disk index -------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    url_hash TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    size INTEGER NOT NULL,
+                    validated_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_images_last_access ON images(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _blob_path(self, url_hash: str) -> str:
+        return os.path.join(self.root, "blobs", url_hash)
+
+    @staticmethod
+    def _hash(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _lookup(self, url: str) -> Optional[Dict]:
+        url_hash = self._hash(url)
+        with self._lock:
+            row = self._db().execute(
+                "SELECT etag, last_modified, validated_at FROM images WHERE url_hash = ?", (url_hash,)
+            ).fetchone()
+        if row is None or not os.path.exists(self._blob_path(url_hash)):
+            return None
+        return {"url_hash": url_hash, "etag": row[0], "last_modified": row[1], "validated_at": row[2]}
+
+    def _read(self, url_hash: str, revalidated: bool = False) -> Optional[bytes]:
+        try:
+            with open(self._blob_path(url_hash), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            if revalidated:
+                db.execute("UPDATE images SET last_access = ?, validated_at = ? WHERE url_hash = ?", (now, now, url_hash))
+            else:
+                db.execute("UPDATE images SET last_access = ? WHERE url_hash = ?", (now, url_hash))
+            db.commit()
+        return data
+
+    def _store(self, url: str, data: bytes, etag: Optional[str], last_modified: Optional[str]):
+        url_hash = self._hash(url)
+        tmp_path = self._blob_path(url_hash) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._blob_path(url_hash))
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO images (url_hash, url, etag, last_modified, size, validated_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url_hash, url, etag, last_modified, len(data), now, now)
+            )
+            db.commit()
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for url_hash, size in db.execute("SELECT url_hash, size FROM images ORDER BY last_access"):
+            stale.append(url_hash)
+            freed += size
+            if freed >= excess:
+                break
+        for url_hash in stale:
+            try:
+                os.remove(self._blob_path(url_hash))
+            except OSError:
+                pass
+        db.executemany("DELETE FROM images WHERE url_hash = ?", [(h,) for h in stale])
+        db.commit()
+
+    # --- Public API -------------------------------------------------------
+
+    async def fetch(self, url: str) -> bytes:
+        """Return the bytes at url, from disk when still valid. Raises on HTTP errors."""
+        client = self.client
+        meta = await asyncio.to_thread(self._lookup, url)
+
+        if meta and time.time() - meta["validated_at"] < self.fresh_seconds:
+            data = await asyncio.to_thread(self._read, meta["url_hash"])
+            if data is not None:
+                return data
+            meta = None
+
+        headers = {}
+        if meta:
+            if meta["etag"]:
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"]:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self._semaphore:
+            response = await client.get(url, headers=headers)
+
+        if response.status_code == 304 and meta:
+            data = await asyncio.to_thread(self._read, meta["url_hash"], True)
+            if data is not None:
+                return data
+            # Blob vanished between lookup and read; fetch unconditionally
+            async with self._semaphore:
+                response = await client.get(url)
+
+        response.raise_for_status()
+        data = response.content
+        try:
+            await asyncio.to_thread(
+                self._store, url, data, response.headers.get("etag"), response.headers.get("last-modified")
+            )
+        except Exception as e:
+            print(f"Image cache write failed for {url}: {e}")
+        return data
+
+    async def fetch_many(self, urls: List[str]) -> List[Optional[bytes]]:
+        """Fetch several URLs in parallel (bounded). Failed downloads come back as None."""
+        async def fetch_one(url: str) -> Optional[bytes]:
+            try:
+                return await self.fetch(url)
+            except Exception as e:
+                print(f"Failed to download image {url}: {e}")
+                return None
+
+        return await asyncio.gather(*(fetch_one(url) for url in urls))
+
+    async def prime(self, url: str, data: bytes):
+        """Seed the cache with bytes we just uploaded, so the next read of url skips the network."""
+        try:
+            await asyncio.to_thread(self._store, url, data, None, None)
+        except Exception as e:
+            print(f"Image cache write failed for {url}: {e}")
+
+
+image_fetcher = ImageFetcher(
+    root=os.path.join(cache_dir(), "images"),
+    max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024)),
+    concurrency=int(os.environ.get("IMAGE_FETCH_CONCURRENCY", 16)),
+    fresh_seconds=float(os.environ.get("IMAGE_CACHE_FRESH_SECONDS", 300)),
+    timeout=float(os.environ.get("IMAGE_FETCH_TIMEOUT", 30)),
+)
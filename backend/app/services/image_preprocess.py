@@ -0,0 +1,57 @@
+import io
+import os
+import asyncio
+from typing import Dict, List, Optional
+from PIL import Image
+
+MAX_EDGE = int(os.environ.get("GEMINI_IMAGE_MAX_EDGE", 1536))
+FORMAT = os.environ.get("GEMINI_IMAGE_FORMAT", "JPEG").upper()
+QUALITY = int(os.environ.get("GEMINI_IMAGE_QUALITY", 85))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def prepare_image(data: bytes, max_edge: int = MAX_EDGE, fmt: str = FORMAT, quality: int = QUALITY) -> Dict[str, object]:
+    """
+    Downsize an image so its longest edge is at most max_edge and encode it
+    once. Returns a Gemini blob part ({"mime_type", "data"}) that can be
+    passed to any number of generate_content calls without re-encoding.
+    """
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if fmt == "JPEG":
+        # JPEG has no alpha channel; flatten transparent images onto white
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+    out = io.BytesIO()
+    if fmt == "PNG":
+        img.save(out, format=fmt, optimize=True)
+    else:
+        img.save(out, format=fmt, quality=quality)
+    return {"mime_type": MIME_TYPES.get(fmt, "application/octet-stream"), "data": out.getvalue()}
+
+
+async def prepare_images(raw_images: List[Optional[bytes]]) -> List[Dict[str, object]]:
+    """Prepare several images off the event loop. Missing or undecodable images are dropped."""
+    async def prepare_one(data: Optional[bytes]):
+        if not data:
+            return None
+        try:
+            return await asyncio.to_thread(prepare_image, data)
+        except Exception as e:
+            print(f"Failed to prepare image: {e}")
+            return None
+
+    prepared = await asyncio.gather(*(prepare_one(data) for data in raw_images))
+    return [blob for blob in prepared if blob]
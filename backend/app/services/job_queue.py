@@ -0,0 +1,157 @@
+from typing import List, Dict, Any, Optional
+from ..supabase_client import supabase, execute
+from .prompt_service import PromptService
+from .event_bus import event_bus
+from .brand_cache import invalidate_brand
+from ..tracing import current_trace_context
+
+
+class JobQueue:
+    """
+    Durable pipeline queue backed by pipeline_jobs and pipeline_job_items.
+    Leasing, heartbeats and re-claiming are done by the RPCs in
+    migrations/004_add_pipeline_job_items.sql.
+    """
+
+    @staticmethod
+    async def enqueue(brand_id: str, product_ids: List[str], modes: List[str], bypass_cache: bool = False) -> str:
+        """Create a job and one pending item per product. Returns the job id."""
+        # Drop duplicates but keep the order the products were selected in
+        product_ids = list(dict.fromkeys(product_ids))
+        # Every product of the job uses the prompts as they were at enqueue time
+        prompt_snapshot = await PromptService.get_prompts(brand_id)
+        job_data = {
+            "brand_id": brand_id,
+            "status": "pending",
+            "total_products": len(product_ids),
+            "progress": 0,
+            "product_ids": product_ids,
+            "modes": modes,
+            "bypass_cache": bypass_cache,
+            "prompt_snapshot": prompt_snapshot,
+            # Lets the worker continue the request's trace
+            "trace_context": current_trace_context()
+        }
+        response = await execute(supabase.table("pipeline_jobs").insert(job_data))
+        job_id = response.data[0]['id']
+
+        items = [
+            {
+                "job_id": job_id,
+                "brand_id": brand_id,
+                "product_id": pid,
+                "position": i,
+                "status": "pending"
+            }
+            for i, pid in enumerate(product_ids)
+        ]
+        try:
+            await execute(supabase.table("pipeline_job_items").insert(items))
+        except Exception as e:
+            await execute(supabase.table("pipeline_jobs").update({"status": "failed", "error": f"Failed to enqueue items: {e}"}).eq("id", job_id))
+            raise
+        invalidate_brand(brand_id)
+        event_bus.publish("job.queued", job_id=job_id, brand_id=brand_id, total_products=len(product_ids), modes=modes)
+        return job_id
+
+    @staticmethod
+    async def claim(
+        worker_id: str,
+        limit: int,
+        lease_seconds: int,
+        max_attempts: int,
+        exclude_brands: Optional[List[str]] = None,
+        brand_capacity: Optional[Dict[str, int]] = None,
+        default_capacity: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Lease up to limit items, at most brand_capacity[brand] of a brand
+        (default_capacity for brands not listed; unlimited if None).
+        """
+        response = await execute(supabase.rpc("claim_pipeline_job_items", {
+            "p_worker_id": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+            "p_exclude_brands": exclude_brands or [],
+            "p_brand_capacity": brand_capacity or {},
+            "p_default_capacity": default_capacity
+        }))
+        return response.data or []
+
+    @staticmethod
+    async def heartbeat(worker_id: str, item_ids: List[str], lease_seconds: int) -> List[str]:
+        """Extend leases. Returns the ids this worker still owns."""
+        if not item_ids:
+            return []
+        response = await execute(supabase.rpc("heartbeat_pipeline_job_items", {
+            "p_worker_id": worker_id,
+            "p_item_ids": item_ids,
+            "p_lease_seconds": lease_seconds
+        }))
+        # SETOF uuid comes back as a list of scalars
+        return [row if isinstance(row, str) else next(iter(row.values())) for row in (response.data or [])]
+
+    @staticmethod
+    async def finish(
+        item_id: str,
+        worker_id: str,
+        status: str,
+        error: Optional[str] = None,
+        steps: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Mark an item completed/failed and store its step timings.
+        False if the lease was lost to another worker.
+        """
+        response = await execute(supabase.rpc("finish_pipeline_job_item", {
+            "p_item_id": item_id,
+            "p_worker_id": worker_id,
+            "p_status": status,
+            "p_error": error,
+            "p_steps": steps
+        }))
+        return bool(response.data)
+
+    @staticmethod
+    async def refresh_progress(job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Write progress of the given jobs (coalesced by the worker). Returns their current rows."""
+        if not job_ids:
+            return []
+        response = await execute(supabase.rpc("refresh_pipeline_jobs", {"p_job_ids": job_ids}))
+        return response.data or []
+
+    @staticmethod
+    async def release(worker_id: str, item_ids: List[str]) -> int:
+        """Return unfinished items to the queue (graceful shutdown)."""
+        if not item_ids:
+            return 0
+        response = await execute(supabase.rpc("release_pipeline_job_items", {
+            "p_worker_id": worker_id,
+            "p_item_ids": item_ids
+        }))
+        return response.data or 0
+
+    @staticmethod
+    async def retry(job_id: str, include_stalled: bool = True) -> int:
+        """Re-queue the failed (and stalled) items of a job. Returns how many were re-queued."""
+        response = await execute(supabase.rpc("retry_pipeline_job_items", {
+            "p_job_id": job_id,
+            "p_include_stalled": include_stalled
+        }))
+        return response.data or 0
+
+    @staticmethod
+    async def items(job_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = supabase.table("pipeline_job_items").select(
+            "id, product_id, position, status, attempts, error, steps, lease_owner, lease_expires_at, started_at, finished_at"
+        ).eq("job_id", job_id)
+        if status:
+            query = query.eq("status", status)
+        response = await execute(query.order("position"))
+        return response.data or []
+
+    @staticmethod
+    async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+        response = await execute(supabase.table("pipeline_jobs").select("id, brand_id, modes, bypass_cache, prompt_snapshot, trace_context, status").eq("id", job_id))
+        return response.data[0] if response.data else None
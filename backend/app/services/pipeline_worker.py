@@ -0,0 +1,278 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+from typing import Dict, Any, Optional, Set, Tuple
+from ..supabase_client import supabase, execute
+from .gemini_service import GeminiService, PIPELINE_PRODUCT_COLUMNS
+from .job_queue import JobQueue
+from .event_bus import event_bus
+from .brand_cache import invalidate_brand
+from ..metrics import pipeline_products_total
+from ..tracing import tracer, context_from
+from .worker_pool import ProductWorkerPool, product_pool
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class PipelineWorker:
+    """
+    Pulls job items from the durable queue and processes them through the
+    product pool. Every claimed item is leased; the lease is renewed by a
+    heartbeat while the product runs and handed back on graceful shutdown.
+    Items whose worker disappears are re-claimed once the lease expires.
+
+    Progress is published on the event bus as it happens; the job rows are
+    only rewritten every PIPELINE_PROGRESS_SECONDS for the jobs that moved
+    (a job is still closed the moment its last item finishes).
+    """
+
+    BRAND_SETTINGS_TTL = 300
+
+    def __init__(self, pool: ProductWorkerPool, worker_id: Optional[str] = None):
+        self.pool = pool
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = int(_env_number("PIPELINE_LEASE_SECONDS", 120))
+        self.max_attempts = int(_env_number("PIPELINE_MAX_ATTEMPTS", 3))
+        self.poll_seconds = _env_number("PIPELINE_POLL_SECONDS", 5)
+        self.progress_seconds = _env_number("PIPELINE_PROGRESS_SECONDS", 5)
+        self._tasks: Dict[str, asyncio.Task] = {}  # item id -> task
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._brand_limits: Dict[str, Tuple[int, float]] = {}
+        self._dirty_jobs: Set[str] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._loops: list = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._loops)
+
+    @property
+    def claimed(self) -> int:
+        return len(self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._loops = [
+            asyncio.create_task(self._claim_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._progress_loop()),
+        ]
+        print(f"Pipeline worker {self.worker_id} started (lease {self.lease_seconds}s, max attempts {self.max_attempts})")
+
+    async def stop(self):
+        """Stop claiming, cancel running items and release their leases."""
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+
+        item_ids = list(self._tasks.keys())
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        try:
+            released = await JobQueue.release(self.worker_id, item_ids)
+            print(f"Pipeline worker {self.worker_id} stopped, released {released} items")
+        except Exception as e:
+            print(f"Error releasing job items on shutdown: {e}")
+        await self._flush_progress()
+
+    def wake(self):
+        """Claim immediately instead of waiting for the next poll (e.g. after enqueue)."""
+        if self._wake:
+            self._wake.set()
+
+    async def _brand_limit(self, brand_id: str) -> int:
+        cached = self._brand_limits.get(brand_id)
+        if cached and time.monotonic() - cached[1] < self.BRAND_SETTINGS_TTL:
+            return cached[0]
+        settings = {}
+        try:
+            brand_res = await execute(supabase.table("brands").select("settings").eq("id", brand_id))
+            if brand_res.data:
+                settings = brand_res.data[0].get("settings") or {}
+        except Exception as e:
+            print(f"Warning: Could not fetch brand settings: {e}")
+        limit = self.pool.brand_limit(settings)
+        self._brand_limits[brand_id] = (limit, time.monotonic())
+        return limit
+
+    async def _job(self, job_id: str) -> Dict[str, Any]:
+        if job_id not in self._jobs:
+            self._jobs[job_id] = await JobQueue.get_job(job_id) or {}
+        return self._jobs[job_id]
+
+    async def _claim(self):
+        capacity = self.pool.global_limit - len(self._tasks)
+        if capacity <= 0:
+            return
+
+        # Claim no more of a brand than it may still run here, so the rest
+        # stays free for other workers. Brands not seen yet get the default
+        # limit; their own is looked up once their first items arrive.
+        per_brand: Dict[str, int] = {}
+        for item in self._items.values():
+            per_brand[item["brand_id"]] = per_brand.get(item["brand_id"], 0) + 1
+        for brand_id in self._brand_limits:
+            per_brand.setdefault(brand_id, 0)
+        brand_capacity = {b: await self._brand_limit(b) - n for b, n in per_brand.items()}
+        saturated = [b for b, free in brand_capacity.items() if free <= 0]
+
+        items = await JobQueue.claim(
+            self.worker_id, capacity, self.lease_seconds, self.max_attempts, saturated,
+            brand_capacity=brand_capacity, default_capacity=self.pool.brand_limit({})
+        )
+        for item in items:
+            self._items[item["id"]] = item
+            task = asyncio.create_task(self._run_item(item))
+            self._tasks[item["id"]] = task
+            task.add_done_callback(lambda _t, item_id=item["id"]: self._forget(item_id))
+        if items:
+            print(f"Worker {self.worker_id} claimed {len(items)} items")
+
+    def _forget(self, item_id: str):
+        self._tasks.pop(item_id, None)
+        item = self._items.pop(item_id, None)
+        if item and not any(i["job_id"] == item["job_id"] for i in self._items.values()):
+            self._jobs.pop(item["job_id"], None)
+        # Freed capacity: look for more work straight away
+        self.wake()
+
+    async def _claim_loop(self):
+        while True:
+            try:
+                await self._claim()
+            except Exception as e:
+                print(f"Error claiming job items: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _flush_progress(self):
+        job_ids, self._dirty_jobs = list(self._dirty_jobs), set()
+        if not job_ids:
+            return
+        try:
+            jobs = await JobQueue.refresh_progress(job_ids)
+        except Exception as e:
+            print(f"Error writing job progress: {e}")
+            self._dirty_jobs.update(job_ids)
+            return
+        for job in jobs:
+            invalidate_brand(job.get("brand_id"))
+            status = job.get("status")
+            event_type = f"job.{status}" if status in ("completed", "failed") else "job.progress"
+            event_bus.publish(
+                event_type,
+                job_id=job.get("id"),
+                brand_id=job.get("brand_id"),
+                status=status,
+                progress=job.get("progress"),
+                total_products=job.get("total_products"),
+                error=job.get("error")
+            )
+
+    async def _progress_loop(self):
+        while True:
+            await asyncio.sleep(self.progress_seconds)
+            await self._flush_progress()
+
+    async def _heartbeat_loop(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            item_ids = list(self._tasks.keys())
+            if not item_ids:
+                continue
+            try:
+                owned = set(await JobQueue.heartbeat(self.worker_id, item_ids, self.lease_seconds))
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+                continue
+            # Lease taken over by another worker: stop duplicating its work
+            for item_id in item_ids:
+                if item_id not in owned and item_id in self._tasks:
+                    print(f"Lost lease on item {item_id}, cancelling")
+                    self._tasks[item_id].cancel()
+
+    async def _run_item(self, item: Dict[str, Any]):
+        # Continue the trace of the request that queued the job
+        try:
+            parent = context_from((await self._job(item["job_id"])).get("trace_context"))
+        except Exception:
+            parent = None
+        attributes = {
+            "pipeline.job_id": item["job_id"],
+            "pipeline.brand_id": item["brand_id"],
+            "pipeline.product_id": item["product_id"],
+            "pipeline.attempt": item.get("attempts") or 0,
+        }
+        with tracer.start_as_current_span("pipeline.product", context=parent, attributes=attributes):
+            await self._process_item(item)
+
+    async def _process_item(self, item: Dict[str, Any]):
+        brand_id = item["brand_id"]
+        pid = item["product_id"]
+        status, error, steps = "completed", None, None
+        context = {"job_id": item["job_id"], "brand_id": brand_id, "product_id": pid, "item_id": item["id"]}
+
+        def on_step(step: str, timing: Dict[str, Any]):
+            state = "started" if timing["status"] == "running" else timing["status"]
+            event_bus.publish(f"step.{state}", step=step, duration_ms=timing.get("duration_ms"), **context)
+
+        try:
+            job = await self._job(item["job_id"])
+            modes = job.get("modes") or ['ecommerce', 'lookbook']
+
+            async with self.pool.slot(brand_id, await self._brand_limit(brand_id)):
+                event_bus.publish("product.started", attempt=item.get("attempts"), **context)
+                # Fetch the product's source data (not last run's results)
+                p_response = await execute(
+                    supabase.table("products").select(PIPELINE_PRODUCT_COLUMNS).eq("brand_id", brand_id).eq("product_id", pid)
+                )
+                if not p_response.data:
+                    raise Exception(f"Product {pid} not found")
+
+                service = GeminiService(
+                    brand_id,
+                    bypass_cache=bool(job.get("bypass_cache")),
+                    prompts=job.get("prompt_snapshot"),
+                    on_step=on_step
+                )
+                result = await service.process_product(p_response.data[0], modes)
+                steps = result.get("step_timings")
+                if result.get("status") == "failed":
+                    status, error = "failed", result.get("error")
+        except asyncio.CancelledError:
+            # Shutdown or lost lease; the item is released or re-claimed elsewhere
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            status, error = "failed", str(e)
+
+        try:
+            if not await JobQueue.finish(item["id"], self.worker_id, status, error, steps):
+                print(f"Item {item['id']} was re-claimed by another worker; result not recorded")
+                return
+        except Exception as e:
+            print(f"Error finishing job item {item['id']}: {e}")
+            return
+        event_bus.publish(f"product.{status}", error=error, **context)
+        pipeline_products_total.labels(status=status).inc()
+        self._dirty_jobs.add(item["job_id"])
+
+
+pipeline_worker = PipelineWorker(product_pool)
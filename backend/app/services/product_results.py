@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from ..supabase_client import supabase, execute
+
+
+class ProductResults:
+    """
+    Full pipeline result documents, kept in product_results instead of the
+    products row. products.result_summary is derived from them by a trigger
+    (migrations/011_add_product_results.sql), so list views never load the
+    document; only the detail, flag and push paths do.
+    """
+
+    @staticmethod
+    async def save(product_id: str, brand_id: str, content: Dict[str, Any]):
+        """Store the document of a product (by products.id)."""
+        await execute(supabase.table("product_results").upsert({
+            "product_id": product_id,
+            "brand_id": brand_id,
+            "content": content,
+            "updated_at": datetime.utcnow().isoformat()
+        }, on_conflict="product_id"))
+
+    @staticmethod
+    async def save_many(brand_id: str, documents: Dict[str, Dict[str, Any]]):
+        """Store several documents at once: {products.id: content}."""
+        if not documents:
+            return
+        now = datetime.utcnow().isoformat()
+        await execute(supabase.table("product_results").upsert([
+            {"product_id": product_id, "brand_id": brand_id, "content": content, "updated_at": now}
+            for product_id, content in documents.items()
+        ], on_conflict="product_id"))
+
+    @staticmethod
+    async def load(product_id: str) -> Optional[Dict[str, Any]]:
+        response = await execute(supabase.table("product_results").select("content").eq("product_id", product_id))
+        return response.data[0]["content"] if response.data else None
+
+    @staticmethod
+    async def delete(product_ids: List[str]):
+        if product_ids:
+            await execute(supabase.table("product_results").delete().in_("product_id", product_ids))
+
+    @staticmethod
+    async def attach(product: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Put the full document on a products row as generated_content, the
+        shape the detail page, flagging and the Shopify push work with.
+        Rows written before the move still carry it inline.
+        """
+        if product and product.get("id") and not product.get("generated_content"):
+            product["generated_content"] = await ProductResults.load(product["id"])
+        return product
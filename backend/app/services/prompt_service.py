@@ -1,30 +1,63 @@
-from ..supabase_client import supabase
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from ..supabase_client import supabase, execute, run_blocking
+
+# brand_id -> (loaded_at, {prompt name: content})
+_prompt_cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+_prompt_cache_lock = threading.Lock()
+PROMPT_CACHE_TTL = float(os.environ.get("PROMPT_CACHE_TTL_SECONDS", 300))
+
 
 class PromptService:
     @staticmethod
-    def get_prompt(brand_id: str, prompt_name: str) -> str:
+    async def get_prompts(brand_id: str) -> Dict[str, str]:
+        """
+        All prompt templates of a brand, loaded in one query and cached for
+        PROMPT_CACHE_TTL_SECONDS. Writes through save_prompt invalidate the
+        brand's entry; other processes pick up changes when their TTL expires.
+        """
+        with _prompt_cache_lock:
+            cached = _prompt_cache.get(brand_id)
+        if cached and time.monotonic() - cached[0] < PROMPT_CACHE_TTL:
+            return cached[1]
+
+        response = await execute(supabase.table("prompts").select("name, content").eq("brand_id", brand_id))
+        prompts = {row['name']: row['content'] for row in (response.data or [])}
+        with _prompt_cache_lock:
+            _prompt_cache[brand_id] = (time.monotonic(), prompts)
+        return prompts
+
+    @staticmethod
+    async def get_prompt(brand_id: str, prompt_name: str, snapshot: Optional[Dict[str, str]] = None) -> str:
         """
         Get prompt content from DB or Storage.
+        When a job snapshot is given, it is used instead of the live prompts.
         """
-        # Try DB first
-        response = supabase.table("prompts").select("content").eq("brand_id", brand_id).eq("name", prompt_name).execute()
-        
-        if response.data:
-            return response.data[0]['content']
-            
+        prompts = snapshot if snapshot is not None else await PromptService.get_prompts(brand_id)
+        if prompt_name in prompts:
+            return prompts[prompt_name]
+
         # Fallback to defaults (could be in code or storage global)
         # For now return empty or raise
         return ""
 
     @staticmethod
-    def save_prompt(brand_id: str, prompt_name: str, content: str):
+    def invalidate(brand_id: str):
+        with _prompt_cache_lock:
+            _prompt_cache.pop(brand_id, None)
+
+    @staticmethod
+    async def save_prompt(brand_id: str, prompt_name: str, content: str):
          # Upsert to DB
          data = {
              "brand_id": brand_id,
              "name": prompt_name,
              "content": content
          }
-         supabase.table("prompts").upsert(data, on_conflict="brand_id, name").execute()
-         
+         await execute(supabase.table("prompts").upsert(data, on_conflict="brand_id, name"))
+         PromptService.invalidate(brand_id)
+
          # Sync to Storage
-         supabase.storage.from_("prompts").upload(f"{brand_id}/{prompt_name}.txt", content.encode(), file_options={"upsert": "true"})
+         await run_blocking(supabase.storage.from_("prompts").upload, f"{brand_id}/{prompt_name}.txt", content.encode(), file_options={"upsert": "true"})
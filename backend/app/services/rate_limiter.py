@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import random
+import asyncio
+from typing import Dict, Any, Optional
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for 429 / quota errors from the Gemini client."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    code = getattr(error, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource exhausted" in message or "rate limit" in message
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket for one model with AIMD rate control.
+
+    Calls take a token before going out. Every success raises the rate by
+    increase_rpm (up to max_rpm); a 429/quota error halves it (down to
+    min_rpm), at most once per cooldown so a burst of failures from requests
+    already in flight only counts once. Waiters are served in arrival order
+    and their sleeps carry a little jitter.
+    """
+
+    def __init__(self, name: str, max_rpm: float, min_rpm: float = 1.0, burst: Optional[float] = None,
+                 increase_rpm: float = 1.0, decrease_factor: float = 0.5, cooldown: float = 10.0):
+        self.name = name
+        self.max_rpm = max_rpm
+        self.min_rpm = min(min_rpm, max_rpm)
+        self.rpm = max_rpm
+        self.burst = burst if burst is not None else max(1.0, max_rpm / 10)
+        self.increase_rpm = increase_rpm
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.tokens = self.burst
+        self.waiting = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rpm / 60.0)
+        self._updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) * 60.0 / self.rpm
+                    await asyncio.sleep(wait + random.uniform(0, 0.1 * wait))
+        finally:
+            self.waiting -= 1
+
+    def on_success(self):
+        self.rpm = min(self.max_rpm, self.rpm + self.increase_rpm)
+
+    def on_throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.rpm = max(self.min_rpm, self.rpm * self.decrease_factor)
+        # Drop any saved-up burst so the slower rate takes effect immediately
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+        print(f"Rate limited on {self.name}: slowing to {self.rpm:.1f} rpm")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model": self.name,
+            "current_rpm": round(self.rpm, 2),
+            "max_rpm": self.max_rpm,
+            "queue_depth": self.waiting,
+            "throttled_total": self.throttled
+        }
+
+
+class RateLimiterRegistry:
+    """
+    One limiter per model name, created on first use.
+
+    Limits (requests per minute) come from GEMINI_RATE_LIMITS, a JSON object
+    keyed by model name, falling back to GEMINI_DEFAULT_RPM. When several
+    worker processes share one API quota, GEMINI_RATE_LIMIT_WORKERS divides
+    every limit so the workers together stay under it.
+    """
+
+    def __init__(self):
+        try:
+            self.limits: Dict[str, float] = json.loads(os.environ.get("GEMINI_RATE_LIMITS", "{}"))
+        except json.JSONDecodeError:
+            print("Warning: GEMINI_RATE_LIMITS is not valid JSON, using defaults")
+            self.limits = {}
+        self.default_rpm = float(os.environ.get("GEMINI_DEFAULT_RPM", 60))
+        self.workers = max(1, int(os.environ.get("GEMINI_RATE_LIMIT_WORKERS", 1)))
+        self._limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+    def get(self, model_name: str) -> AdaptiveRateLimiter:
+        # The SDK reports names as "models/<name>"; config uses the bare name
+        model_name = model_name.split("/", 1)[1] if model_name.startswith("models/") else model_name
+        if model_name not in self._limiters:
+            rpm = float(self.limits.get(model_name, self.default_rpm)) / self.workers
+            self._limiters[model_name] = AdaptiveRateLimiter(model_name, max_rpm=rpm)
+        return self._limiters[model_name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: limiter.snapshot() for name, limiter in self._limiters.items()}
+
+
+gemini_limiters = RateLimiterRegistry()
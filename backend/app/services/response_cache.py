@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+
+def cache_dir() -> str:
+    """Root directory for local on-disk caches (CACHE_DIR)."""
+    path = os.environ.get("CACHE_DIR") or os.path.join(tempfile.gettempdir(), "whybuy-cache")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of Gemini text responses.
+
+    Entries are keyed by a hash of the model name, the generation config and
+    every content part (prompt text and image bytes), so a step is only
+    re-sent to Gemini when one of its inputs actually changed. Entries expire
+    after GEMINI_CACHE_TTL_SECONDS; once the stored responses exceed
+    GEMINI_CACHE_MAX_BYTES the least recently used ones are evicted.
+    """
+
+    EVICT_EVERY = 100  # writes between size checks
+
+    def __init__(self, path: str, ttl_seconds: int, max_bytes: int, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._conn.commit()
+            self._evict()
+        return self._conn
+
+    @staticmethod
+    def key(model_name: str, generation_config: Optional[Dict[str, Any]], content: List[Any]) -> str:
+        h = hashlib.sha256()
+        h.update(model_name.encode())
+        h.update(json.dumps(generation_config or {}, sort_keys=True, default=str).encode())
+        for part in content:
+            if isinstance(part, str):
+                h.update(b"\x00text:")
+                h.update(part.encode())
+            elif isinstance(part, dict) and "data" in part:
+                # Encoded image blob
+                h.update(b"\x00blob:")
+                h.update(str(part.get("mime_type")).encode())
+                h.update(hashlib.sha256(part["data"]).digest())
+            else:
+                h.update(b"\x00other:")
+                h.update(repr(part).encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            return row[0]
+
+    def set(self, key: str, model_name: str, value: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, value, len(value.encode()), now, now + self.ttl_seconds, now)
+            )
+            db.commit()
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        db = self._conn
+        db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # Walk from least recently used until enough space is freed
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                stale.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        db.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        try:
+            return await asyncio.to_thread(self.get, key)
+        except Exception as e:
+            print(f"Response cache read failed: {e}")
+            return None
+
+    async def aset(self, key: str, model_name: str, value: str):
+        try:
+            await asyncio.to_thread(self.set, key, model_name, value)
+        except Exception as e:
+            print(f"Response cache write failed: {e}")
+
+
+response_cache = ResponseCache(
+    path=os.environ.get("GEMINI_CACHE_PATH") or os.path.join(cache_dir(), "gemini_responses.sqlite3"),
+    ttl_seconds=int(os.environ.get("GEMINI_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+    max_bytes=int(os.environ.get("GEMINI_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    enabled=os.environ.get("GEMINI_CACHE_ENABLED", "true").lower() != "false",
+)
@@ -1,6 +1,9 @@
 import os
 import httpx
 from typing import Dict, Any
+from .image_fetcher import image_fetcher
+from ..metrics import shopify_event_hooks
+from ..tracing import instrument_client
 
 class ShopifyService:
     @staticmethod
@@ -34,7 +37,7 @@ class ShopifyService:
         if not shopify_id:
             raise Exception("Could not determine Shopify ID for product")
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
+        async with instrument_client(httpx.AsyncClient(timeout=60.0, event_hooks=shopify_event_hooks())) as client:
             # Get references to the actual image arrays in generated_content
             ecom_images = outputs.get("step4_ecommerce_images", {}).get("ecommerce_images", [])
             lookbook_images = outputs.get("step6_lookbook_images", {}).get("lookbook_images", [])
@@ -50,8 +53,9 @@ class ShopifyService:
                         continue
                         
                     if img.get("status") == "generated" and img.get("image_path"):
+                        # The WebP master is a fraction of the PNG's size
                         cdn_url = await ShopifyService._upload_image_to_shopify(
-                            client, base_url, headers, shopify_id, img.get("image_path")
+                            client, base_url, headers, shopify_id, img.get("webp_path") or img.get("image_path")
                         )
                         if cdn_url:
                             # Update the image object in the original structure
@@ -69,8 +73,9 @@ class ShopifyService:
                         continue
                         
                     if img.get("status") == "generated" and img.get("image_path"):
+                        # The WebP master is a fraction of the PNG's size
                         cdn_url = await ShopifyService._upload_image_to_shopify(
-                            client, base_url, headers, shopify_id, img.get("image_path")
+                            client, base_url, headers, shopify_id, img.get("webp_path") or img.get("image_path")
                         )
                         if cdn_url:
                             # Update the image object in the original structure
@@ -148,15 +153,14 @@ class ShopifyService:
         try:
             # Step 1: Get image data and filename
             if image_path.startswith("http://") or image_path.startswith("https://"):
-                # Remote image - download it first
-                print(f"Downloading remote image: {image_path}")
-                download_res = await client.get(image_path)
-                
-                if download_res.status_code != 200:
-                    print(f"Failed to download image from {image_path}: {download_res.status_code}")
+                # Remote image - usually still in the local image cache from generation
+                print(f"Fetching remote image: {image_path}")
+                try:
+                    image_data = await image_fetcher.fetch(image_path)
+                except Exception as e:
+                    print(f"Failed to download image from {image_path}: {e}")
                     return None
                 
-                image_data = download_res.content
                 filename = os.path.basename(image_path.split('?')[0]) or "image.png"
             else:
                 # Local file - read it
@@ -172,7 +176,8 @@ class ShopifyService:
             # Determine MIME type
             mime_type, _ = mimetypes.guess_type(filename)
             if not mime_type:
-                mime_type = "image/png"  # Default fallback
+                # Older Pythons do not map .webp
+                mime_type = "image/webp" if filename.lower().endswith(".webp") else "image/png"  # Default fallback
             
             file_size = len(image_data)
             
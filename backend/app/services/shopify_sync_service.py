@@ -2,6 +2,11 @@ import httpx
 import json
 from typing import Dict, Any, Optional
 from datetime import datetime
+from ..supabase_client import execute
+from ..metrics import shopify_event_hooks
+from ..tracing import instrument_client
+from .product_results import ProductResults
+from .brand_cache import invalidate_brand
 
 
 class ShopifySyncService:
@@ -15,7 +20,7 @@ class ShopifySyncService:
         json_data: Optional[dict] = None
     ) -> dict:
         """Helper for Shopify API requests with error handling."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with instrument_client(httpx.AsyncClient(timeout=30.0, event_hooks=shopify_event_hooks())) as client:
             try:
                 if method == "GET":
                     response = await client.get(url, headers=headers)
@@ -225,14 +230,23 @@ class ShopifySyncService:
         # Use shopify_id as product_id if product_id doesn't exist
         if "product_id" not in product_data:
             product_data["product_id"] = str(product_data["shopify_id"])
+
+        # Content from the metafield is stored in product_results, not on the row
+        generated_content = product_data.pop("generated_content", None)
+        if generated_content:
+            product_data["generated_content"] = None
         
         # Upsert based on brand_id + shopify_id
-        response = supabase.table("products").upsert(
+        response = await execute(supabase.table("products").upsert(
             product_data,
             on_conflict="brand_id,shopify_id"
-        ).execute()
-        
-        return response.data[0] if response.data else None
+        ))
+        saved = response.data[0] if response.data else None
+        invalidate_brand(brand_id)
+
+        if saved and generated_content:
+            await ProductResults.save(saved["id"], brand_id, generated_content)
+        return saved
     
     @staticmethod
     async def read_metafield(shopify_id: int, brand_config: dict) -> Optional[dict]:
@@ -341,9 +355,9 @@ class ShopifySyncService:
         
         # Check if this is a refresh (product already exists)
         shopify_id = raw_product.get("id")
-        existing_product = supabase.table("products").select("id, generated_content, processed").eq(
+        existing_product = await execute(supabase.table("products").select("id, processed").eq(
             "brand_id", brand_id
-        ).eq("shopify_id", shopify_id).execute()
+        ).eq("shopify_id", shopify_id))
         
         is_refresh = len(existing_product.data) > 0
         
@@ -0,0 +1,92 @@
+import time
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from ..tracing import tracer
+
+StepFn = Callable[[Dict[str, Any]], Awaitable[Any]]
+# Called with (step name, timing) when a step starts and when it ends
+StepListener = Callable[[str, Dict[str, Any]], None]
+
+
+class StepGraph:
+    """
+    Dependency graph of async pipeline steps.
+
+    Each step starts as soon as all of its dependencies have finished, so
+    independent branches run at the same time. A step receives the results of
+    the steps finished so far (keyed by step name). If any step raises, the
+    remaining steps are cancelled and the error is re-raised.
+    """
+
+    def __init__(self, listener: Optional[StepListener] = None):
+        self.listener = listener
+        self._steps: Dict[str, Tuple[StepFn, Tuple[str, ...]]] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, fn: StepFn, depends_on: Iterable[str] = ()) -> "StepGraph":
+        deps = tuple(depends_on)
+        for dep in deps:
+            if dep not in self._steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+        if name in self._steps:
+            raise ValueError(f"Duplicate step '{name}'")
+        self._steps[name] = (fn, deps)
+        return self
+
+    @property
+    def steps(self) -> List[str]:
+        return list(self._steps.keys())
+
+    async def _run_step(self, name: str, tasks: Dict[str, asyncio.Task]) -> Any:
+        fn, deps = self._steps[name]
+        if deps:
+            await asyncio.gather(*(tasks[dep] for dep in deps))
+
+        started = time.perf_counter()
+        timing = {"started_at": datetime.now().isoformat(), "status": "running"}
+        self.timings[name] = timing
+        self._notify(name, timing)
+        try:
+            with tracer.start_as_current_span(f"step {name}"):
+                result = await fn(self.results)
+            timing["status"] = "completed"
+        except asyncio.CancelledError:
+            timing["status"] = "cancelled"
+            raise
+        except Exception:
+            timing["status"] = "failed"
+            raise
+        finally:
+            timing["ended_at"] = datetime.now().isoformat()
+            timing["duration_ms"] = round((time.perf_counter() - started) * 1000)
+            self._notify(name, timing)
+
+        self.results[name] = result
+        return result
+
+    def _notify(self, name: str, timing: Dict[str, Any]):
+        if self.listener is None:
+            return
+        try:
+            self.listener(name, dict(timing))
+        except Exception as e:
+            print(f"Step listener failed: {e}")
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every step and return their results keyed by step name."""
+        # Steps can only depend on steps added before them, so insertion order
+        # is already a valid topological order.
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._steps:
+            tasks[name] = asyncio.create_task(self._run_step(name, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return self.results
@@ -0,0 +1,77 @@
+import os
+import asyncio
+from typing import Optional, Set
+from ..supabase_client import supabase, run_blocking
+from .rate_limiter import backoff_delay
+
+
+class UploadQueue:
+    """
+    Background uploads to Supabase Storage.
+
+    submit() schedules an upload and returns its task straight away, so the
+    caller keeps working while the bytes go out. At most
+    STORAGE_UPLOAD_CONCURRENCY uploads run at once; failed uploads are retried
+    STORAGE_UPLOAD_ATTEMPTS times with backoff. Await the returned task only
+    where the stored object must exist; drain() waits for everything still
+    queued (shutdown).
+    """
+
+    def __init__(self, concurrency: int, attempts: int):
+        self.concurrency = concurrency
+        self.attempts = max(1, attempts)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def public_url(bucket: str, path: str) -> str:
+        # Built locally from the project URL; no request is made
+        return supabase.storage.from_(bucket).get_public_url(path)
+
+    async def _upload(self, bucket: str, path: str, data: bytes, content_type: Optional[str]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        file_options = {"upsert": "true"}
+        if content_type:
+            file_options["content-type"] = content_type
+        async with self._semaphore:
+            for attempt in range(self.attempts):
+                try:
+                    await run_blocking(supabase.storage.from_(bucket).upload, path, data, file_options=file_options)
+                    return
+                except Exception as e:
+                    print(f"Upload attempt {attempt+1} of {bucket}/{path} failed: {e}")
+                    if attempt == self.attempts - 1:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt, base=1.0, cap=10.0))
+
+    def submit(self, bucket: str, path: str, data: bytes, content_type: Optional[str] = None) -> asyncio.Task:
+        task = asyncio.create_task(self._upload(bucket, path, data, content_type))
+        self._pending.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task):
+        self._pending.discard(task)
+        # Nobody may await fire-and-forget uploads; retrieve the error so it is not lost
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Upload failed: {task.exception()}")
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait for queued uploads to finish (e.g. before shutdown)."""
+        if not self._pending:
+            return
+        print(f"Waiting for {len(self._pending)} pending uploads")
+        done, not_done = await asyncio.wait(set(self._pending), timeout=timeout)
+        if not_done:
+            print(f"{len(not_done)} uploads did not finish before shutdown")
+
+
+upload_queue = UploadQueue(
+    concurrency=int(os.environ.get("STORAGE_UPLOAD_CONCURRENCY", 8)),
+    attempts=int(os.environ.get("STORAGE_UPLOAD_ATTEMPTS", 3)),
+)
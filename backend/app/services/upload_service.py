@@ -3,7 +3,8 @@ import io
 import json
 from datetime import datetime
 from fastapi import UploadFile
-from ..supabase_client import supabase
+from ..supabase_client import supabase, execute, run_blocking
+from .brand_cache import invalidate_brand
 
 class UploadService:
     @staticmethod
@@ -13,7 +14,7 @@ class UploadService:
         
         # 2. Upload raw file to Supabase Storage 'uploads' bucket
         filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        supabase.storage.from_("uploads").upload(f"{brand_id}/{filename}", content)
+        await run_blocking(supabase.storage.from_("uploads").upload, f"{brand_id}/{filename}", content)
         
         # 3. Parse Excel
         df = pd.read_excel(io.BytesIO(content))
@@ -49,14 +50,16 @@ class UploadService:
             
             # 5. Insert/Update in DB (Upsert)
             # Using upsert to handle re-uploads
-            supabase.table("products").upsert(product_data, on_conflict="brand_id, product_id").execute()
+            await execute(supabase.table("products").upsert(product_data, on_conflict="brand_id, product_id"))
             new_products_count += 1
             
             products.append(product_data)
+
+        invalidate_brand(brand_id)
             
         # 6. Parity: Update products.json in Storage 'data' bucket
         # Fetch ALL products for brand to rebuild the file
-        all_products_response = supabase.table("products").select("product_id", "full_data").eq("brand_id", brand_id).execute()
+        all_products_response = await execute(supabase.table("products").select("product_id", "full_data").eq("brand_id", brand_id))
         
         # Reconstruct the dictionary format expected by legacy code: {product_id: product_data}
         legacy_db = {}
@@ -68,10 +71,10 @@ class UploadService:
         
         # Upsert file to storage
         try:
-            supabase.storage.from_("data").update(f"{brand_id}/products.json", json_content.encode())
+            await run_blocking(supabase.storage.from_("data").update, f"{brand_id}/products.json", json_content.encode())
         except:
              # If update fails (file doesn't exist), try upload
-            supabase.storage.from_("data").upload(f"{brand_id}/products.json", json_content.encode())
+            await run_blocking(supabase.storage.from_("data").upload, f"{brand_id}/products.json", json_content.encode())
             
         return {
             "success": True,
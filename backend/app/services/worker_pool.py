@@ -0,0 +1,88 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class ProductWorkerPool:
+    """
+    Concurrency limits for products of pipeline jobs.
+
+    Two limits apply to every product: a process-wide cap shared by all jobs
+    (PIPELINE_MAX_CONCURRENCY) and a per-brand cap, taken from the brand's
+    settings.pipeline_concurrency or PIPELINE_BRAND_CONCURRENCY.
+    """
+
+    def __init__(self, global_limit: int, default_brand_limit: int):
+        self.global_limit = global_limit
+        self.default_brand_limit = default_brand_limit
+        self._global = asyncio.Semaphore(global_limit)
+        self._brands: Dict[str, asyncio.Semaphore] = {}
+        self._brand_limits: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+
+    def brand_limit(self, brand_settings: Optional[Dict[str, Any]]) -> int:
+        """Resolve the per-brand limit from a brands.settings document."""
+        value = (brand_settings or {}).get("pipeline_concurrency")
+        try:
+            limit = int(value) if value is not None else self.default_brand_limit
+        except (TypeError, ValueError):
+            limit = self.default_brand_limit
+        return max(1, min(limit, self.global_limit))
+
+    def _brand_semaphore(self, brand_id: str, limit: int) -> asyncio.Semaphore:
+        # Replace the semaphore only when the limit changes and the brand is idle,
+        # so queued and running products never end up on two different semaphores.
+        idle = not self._waiting.get(brand_id) and not self._in_flight.get(brand_id)
+        if self._brand_limits.get(brand_id) != limit and idle:
+            self._brands[brand_id] = asyncio.Semaphore(limit)
+            self._brand_limits[brand_id] = limit
+        return self._brands[brand_id]
+
+    @asynccontextmanager
+    async def slot(self, brand_id: str, brand_limit: Optional[int] = None):
+        """Hold one product slot for a brand (brand cap first, then global cap)."""
+        brand_sem = self._brand_semaphore(brand_id, brand_limit or self.default_brand_limit)
+        self._waiting[brand_id] = self._waiting.get(brand_id, 0) + 1
+        acquired = False
+        try:
+            async with brand_sem:
+                async with self._global:
+                    self._waiting[brand_id] -= 1
+                    self._in_flight[brand_id] = self._in_flight.get(brand_id, 0) + 1
+                    acquired = True
+                    try:
+                        yield
+                    finally:
+                        self._in_flight[brand_id] -= 1
+        finally:
+            if not acquired:
+                self._waiting[brand_id] -= 1
+
+    def waiting(self, brand_id: Optional[str] = None) -> int:
+        if brand_id is not None:
+            return self._waiting.get(brand_id, 0)
+        return sum(self._waiting.values())
+
+    def brands(self) -> List[str]:
+        """Brands that have run or queued products in this process."""
+        return sorted(set(self._waiting) | set(self._in_flight))
+
+    def in_flight(self, brand_id: Optional[str] = None) -> int:
+        if brand_id is not None:
+            return self._in_flight.get(brand_id, 0)
+        return sum(self._in_flight.values())
+
+
+product_pool = ProductWorkerPool(
+    global_limit=_env_int("PIPELINE_MAX_CONCURRENCY", 8),
+    default_brand_limit=_env_int("PIPELINE_BRAND_CONCURRENCY", 4),
+)
@@ -1,10 +1,67 @@
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
 import os
+import time
+import asyncio
+import functools
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
 from dotenv import load_dotenv
+from .metrics import supabase_request_seconds
+from .tracing import tracer
+from opentelemetry import trace
 
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL", "")
 key: str = os.environ.get("SUPABASE_SERVICE_KEY") or os.environ.get("SUPABASE_KEY", "")
 
-supabase: Client = create_client(url, key)
+# Request timeout for PostgREST and Storage calls
+SUPABASE_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", 30))
+# Max Supabase calls in flight at once from async code
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", 16))
+
+supabase: Client = create_client(url, key, options=ClientOptions(
+    postgrest_client_timeout=SUPABASE_TIMEOUT,
+    storage_client_timeout=int(SUPABASE_TIMEOUT)
+))
+
+# The client is synchronous; async handlers hand its calls to this bounded
+# pool so a slow query never blocks the event loop.
+_executor = ThreadPoolExecutor(max_workers=SUPABASE_POOL_SIZE, thread_name_prefix="supabase")
+
+
+async def _timed(operation: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    started = time.perf_counter()
+    outcome = "error"
+    # Only traced as part of a request or product; the worker's polling would be noise
+    parent = trace.get_current_span()
+    span_context = tracer.start_as_current_span(f"supabase {operation}") if parent.is_recording() else nullcontext(parent)
+    with span_context as span:
+        try:
+            # The HTTP timeout bounds the call itself; this only guards against a hung thread
+            result = await asyncio.wait_for(loop.run_in_executor(_executor, call), timeout=SUPABASE_TIMEOUT * 2)
+            outcome = "success"
+            return result
+        finally:
+            span.set_attribute("supabase.outcome", outcome)
+            supabase_request_seconds.labels(operation=operation, outcome=outcome).observe(time.perf_counter() - started)
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking Supabase call (storage, auth, or any sync helper) on the
+    Supabase thread pool and await its result.
+    """
+    return await _timed(getattr(fn, "__name__", "call"), fn, *args, **kwargs)
+
+
+async def execute(query) -> Any:
+    """
+    Await a PostgREST query built on the sync client:
+
+        response = await execute(supabase.table("products").select("*").eq("id", product_id))
+    """
+    return await _timed("query", query.execute)
@@ -0,0 +1,113 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Optional, Sequence
+from opentelemetry import trace, propagate, context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, ReadableSpan
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+# none | console | file | otlp (comma-separated for several)
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+SERVICE_NAME = os.environ.get("TRACING_SERVICE_NAME", "whybuy-backend")
+
+tracer = trace.get_tracer("whybuy")
+
+_configured = False
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line (offline use)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        try:
+            lines = [json.dumps(json.loads(span.to_json())) for span in spans]
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            print(f"Writing traces to {self.path} failed: {e}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+
+def _exporter(name: str) -> Optional[SpanExporter]:
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        return JsonFileSpanExporter(TRACING_FILE)
+    if name == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    print(f"Warning: unknown TRACING_EXPORTER '{name}' ignored")
+    return None
+
+
+def setup_tracing():
+    """
+    Install the tracer provider and exporters chosen by TRACING_EXPORTER.
+    With 'none' nothing is installed and spans cost next to nothing.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    names = [n.strip() for n in TRACING_EXPORTER.split(",") if n.strip() and n.strip() != "none"]
+    if not names:
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    for name in names:
+        exporter = _exporter(name)
+        if exporter is None:
+            continue
+        # Console output is easiest to follow when written as spans end
+        processor = SimpleSpanProcessor(exporter) if name == "console" else BatchSpanProcessor(exporter)
+        provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+    print(f"Tracing enabled ({', '.join(names)})")
+
+
+def instrument_client(client):
+    """
+    Trace every request of an httpx client (Shopify, image downloads) and
+    send traceparent along. Supabase's internal clients are left alone; their
+    calls are already spanned by supabase_client.
+    """
+    if isinstance(trace.get_tracer_provider(), TracerProvider):
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+        HTTPXClientInstrumentor.instrument_client(client)
+    return client
+
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def current_trace_context() -> Dict[str, str]:
+    """W3C trace context of the current span, to hand to background work."""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def context_from(carrier: Optional[Dict[str, Any]]) -> context.Context:
+    """Rebuild a parent context from current_trace_context() output (e.g. stored on a job)."""
+    return propagate.extract(carrier or {})
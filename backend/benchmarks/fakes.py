@@ -0,0 +1,516 @@
+"""
+Local stand-ins for the services the pipeline talks to, for benchmarking
+without network access:
+
+- a fake Supabase (PostgREST tables and RPCs, Storage) and a fake Shopify
+  image CDN, served over real HTTP by one FastAPI app in a child process
+- FakeGenerativeModel, a drop-in for genai.GenerativeModel
+
+Every fake takes a mean latency and an error rate so slow or flaky
+upstreams can be reproduced.
+"""
+import io
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+
+BRAND_ID = "00000000-0000-4000-8000-00000000b3c4"
+BRAND_NAME = "Benchmark Brand"
+JITTER = 0.3  # latencies are drawn uniformly from mean * (1 +/- JITTER)
+
+# Prompt templates seeded for the benchmark brand. The marker on the first
+# line tells the fake model which step a request belongs to.
+PROMPTS = {
+    "step1_metadata.txt": "[[step1_metadata]] Describe {product_title} ({product_id}).",
+    "step2_attributes.txt": "[[step2_attributes]] List the attributes.",
+    "step3_ecommerce_prompts.txt": "[[step3_ecommerce_prompts]] {metadata_json} {attributes_json}",
+    "ecommerce_image_generation.txt": "[[step4_ecommerce_images]] {detailed_prompt} / {focus_attribute}",
+    "step5_lookbook_prompts.txt": "[[step5_lookbook_prompts]] {product_title} {metadata_json}",
+    "lookbook_image_generation.txt": "[[step6_lookbook_images]] {detailed_prompt} / {scenario_name}",
+    "step7_qa.txt": "[[step7_qa_report]] {source_product_data} {metadata_json} {guardrails_summary}",
+}
+
+# Column defaults the pipeline relies on (see migrations/)
+TABLE_DEFAULTS = {
+    "pipeline_jobs": {"status": "pending", "progress": 0, "error": None, "completed_at": None},
+    "pipeline_job_items": {"status": "pending", "attempts": 0, "error": None, "steps": None,
+                           "lease_owner": None, "lease_expires_at": None, "started_at": None, "finished_at": None},
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _delay(mean: float) -> float:
+    return max(0.0, mean * random.uniform(1 - JITTER, 1 + JITTER))
+
+
+def make_image(seed: int, size: int, fmt: str = "JPEG") -> bytes:
+    """A noisy test image; noise keeps encoders from taking shortcuts on flat colour."""
+    rng = random.Random(seed)
+    small = Image.frombytes("RGB", (64, 64), bytes(rng.getrandbits(8) for _ in range(64 * 64 * 3)))
+    out = io.BytesIO()
+    small.resize((size, size), Image.BILINEAR).save(out, format=fmt)
+    return out.getvalue()
+
+
+# --- Fake Gemini -----------------------------------------------------------
+
+class _Blob:
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class _Part:
+    def __init__(self, data: bytes):
+        self.inline_data = _Blob(data)
+
+
+class _Response:
+    def __init__(self, text: str = "", image: Optional[bytes] = None):
+        self.text = text
+        self.parts = [_Part(image)] if image is not None else []
+
+
+class FakeRateLimitError(Exception):
+    """Raised like the SDK's ResourceExhausted so the rate limiter reacts to it."""
+
+    code = 429
+
+
+class FakeGenerativeModel:
+    """
+    Answers generate_content with canned JSON per pipeline step (recognised
+    by the prompt marker) or a generated PNG for the image model. Blocks for
+    the configured latency, like the SDK's synchronous call.
+    """
+
+    # Set by configure() before the service creates its models
+    settings: Dict[str, Any] = {}
+    _png: Optional[bytes] = None
+
+    def __init__(self, model_name: str, **kwargs):
+        self.model_name = f"models/{model_name}"
+        self.is_image_model = "image" in model_name
+
+    @classmethod
+    def configure(cls, text_latency: float, image_latency: float, error_rate: float,
+                  rate_limit_rate: float, images_per_step: int, image_size: int):
+        cls.settings = {
+            "text_latency": text_latency,
+            "image_latency": image_latency,
+            "error_rate": error_rate,
+            "rate_limit_rate": rate_limit_rate,
+            "images_per_step": images_per_step,
+        }
+        cls._png = make_image(7, image_size, "PNG")
+
+    def generate_content(self, content: list, generation_config: Optional[Dict[str, Any]] = None) -> _Response:
+        settings = self.settings
+        time.sleep(_delay(settings["image_latency"] if self.is_image_model else settings["text_latency"]))
+        roll = random.random()
+        if roll < settings["rate_limit_rate"]:
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+            raise RuntimeError("500 Internal error encountered.")
+        if self.is_image_model:
+            return _Response(image=self._png)
+        return _Response(text=json.dumps(self._answer(self._step(content))))
+
+    @staticmethod
+    def _step(content: list) -> str:
+        for part in content:
+            if isinstance(part, str) and "[[" in part:
+                return part.split("[[", 1)[1].split("]]", 1)[0]
+        return ""
+
+    def _answer(self, step: str) -> Any:
+        count = self.settings["images_per_step"]
+        if step == "step1_metadata":
+            return {"title": "Benchmark product", "category": "Apparel", "colour": "Indigo", "fit": "Regular"}
+        if step == "step2_attributes":
+            return {"attributes": [{"name": f"attribute_{i}", "value": "value"} for i in range(count)]}
+        if step == "step3_ecommerce_prompts":
+            return {"image_prompts": [
+                {"prompt_for_attribute": f"attribute {i}", "setting": "Studio, soft light", "model_description": "Model facing camera"}
+                for i in range(count)
+            ]}
+        if step == "step5_lookbook_prompts":
+            return {"lookbook_prompts": [
+                {"scenario_name": f"Scenario {i}", "scenario_description": "City street at dusk", "model_action_and_mood": "Walking, relaxed"}
+                for i in range(count)
+            ]}
+        if step == "step7_qa_report":
+            return {"overall_status": "Pass", "summary": "All checks passed", "checks": []}
+        return {}
+
+
+# --- Fake Supabase / Shopify store -------------------------------------------
+
+class FakeStore:
+    """In-memory tables and buckets with just enough PostgREST semantics for the pipeline."""
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        # bucket -> path -> size in bytes (contents are not kept)
+        self.objects: Dict[str, Dict[str, int]] = {}
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        return self.tables.setdefault(table, [])
+
+    def seed(self, products: int, images_per_product: int, base_url: str):
+        self.rows("brands").append({"id": BRAND_ID, "name": BRAND_NAME, "settings": {}})
+        for name, content in PROMPTS.items():
+            self.rows("prompts").append({"id": str(uuid.uuid4()), "brand_id": BRAND_ID, "name": name, "content": content})
+        for n in range(products):
+            handle = f"bench-product-{n}"
+            self.rows("products").append({
+                "id": str(uuid.uuid4()),
+                "brand_id": BRAND_ID,
+                "product_id": str(9000000000 + n),
+                "shopify_handle": handle,
+                "title": f"Benchmark Product {n}",
+                "description": "A soft cotton shirt with a relaxed fit. " * 8,
+                "tags": "shirts, cotton, summer",
+                "vendor": BRAND_NAME,
+                "product_type": "Shirt",
+                "category": "Apparel",
+                "url": f"{base_url}/shopify/products/{handle}",
+                "image_urls": [f"{base_url}/shopify/cdn/{handle}/{i}.jpg" for i in range(images_per_product)],
+                "metafields": {},
+                "generated_content": None,
+                "processed": False,
+                "uploaded_at": _now().isoformat(),
+            })
+
+    # --- PostgREST query semantics ---
+
+    @staticmethod
+    def _parse_filter(raw: str) -> Tuple[bool, str, Any]:
+        negate = raw.startswith("not.")
+        if negate:
+            raw = raw[4:]
+        op, _, value = raw.partition(".")
+        if op == "in":
+            value = [v.strip().strip('"') for v in value.strip("()").split(",") if v.strip()]
+        return negate, op, value
+
+    @staticmethod
+    def _text(value: Any) -> str:
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return "" if value is None else str(value)
+
+    def _matches(self, row: Dict[str, Any], filters: List[Tuple[str, str]]) -> bool:
+        for column, raw in filters:
+            negate, op, expected = self._parse_filter(raw)
+            actual = row.get(column)
+            if op == "eq":
+                ok = self._text(actual) == expected
+            elif op == "neq":
+                ok = self._text(actual) != expected
+            elif op == "in":
+                ok = self._text(actual) in expected
+            elif op == "is":
+                ok = (actual is None) if expected == "null" else self._text(actual) == expected
+            elif op in ("gt", "gte", "lt", "lte"):
+                if actual is None:
+                    ok = False
+                else:
+                    a, b = self._text(actual), expected
+                    try:
+                        a, b = float(a), float(b)
+                    except ValueError:
+                        pass
+                    ok = {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[op]
+            else:
+                ok = True  # unsupported operators don't filter
+            if ok == negate:
+                return False
+        return True
+
+    @staticmethod
+    def _project(row: Dict[str, Any], select: str) -> Dict[str, Any]:
+        columns = [c.strip() for c in select.split(",") if c.strip()]
+        if not columns or "*" in columns:
+            return dict(row)
+        # Embedded resources (table(...)) are not modelled
+        return {c: row.get(c) for c in columns if "(" not in c}
+
+    def select(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        select, order, limit, offset, filters = "*", None, None, 0, []
+        for key, value in params:
+            if key == "select":
+                select = value
+            elif key == "order":
+                order = value
+            elif key == "limit":
+                limit = int(value)
+            elif key == "offset":
+                offset = int(value)
+            else:
+                filters.append((key, value))
+        rows = [r for r in self.rows(table) if self._matches(r, filters)]
+        if order:
+            for term in reversed(order.split(",")):
+                column, _, direction = term.partition(".")
+                rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+        rows = rows[offset:]
+        if limit is not None:
+            rows = rows[:limit]
+        return [self._project(r, select) for r in rows]
+
+    def insert(self, table: str, body: Any, on_conflict: Optional[str] = None) -> List[Dict[str, Any]]:
+        records = body if isinstance(body, list) else [body]
+        keys = [k.strip() for k in on_conflict.split(",")] if on_conflict else None
+        inserted = []
+        for record in records:
+            existing = None
+            if keys:
+                existing = next((r for r in self.rows(table) if all(r.get(k) == record.get(k) for k in keys)), None)
+            if existing is not None:
+                existing.update(record)
+                inserted.append(dict(existing))
+                continue
+            row = {"id": str(uuid.uuid4()), "created_at": _now().isoformat(), **TABLE_DEFAULTS.get(table, {})}
+            row.update(record)
+            self.rows(table).append(row)
+            inserted.append(dict(row))
+        return inserted
+
+    def delete(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        filters = [(k, v) for k, v in params if k not in ("select", "order", "limit", "offset")]
+        kept, deleted = [], []
+        for row in self.rows(table):
+            (deleted if self._matches(row, filters) else kept).append(row)
+        self.tables[table] = kept
+        return deleted
+
+    def update(self, table: str, params: List[Tuple[str, str]], body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        filters = [(k, v) for k, v in params if k not in ("select", "order", "limit", "offset")]
+        updated = []
+        for row in self.rows(table):
+            if self._matches(row, filters):
+                row.update(body)
+                updated.append(dict(row))
+        return updated
+
+    # --- Queue RPCs (mirror migrations/004_add_pipeline_job_items.sql and follow-ups) ---
+
+    def _job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return next((j for j in self.rows("pipeline_jobs") if j["id"] == job_id), None)
+
+    def _refresh_job(self, job_id: str):
+        job = self._job(job_id)
+        items = [i for i in self.rows("pipeline_job_items") if i["job_id"] == job_id]
+        if not job:
+            return
+        done = [i for i in items if i["status"] in ("completed", "failed")]
+        failed = [i for i in done if i["status"] == "failed"]
+        job["progress"] = len(done)
+        if len(done) == len(items):
+            job["status"] = "failed" if failed else "completed"
+            if failed:
+                job["error"] = f"{len(failed)} of {len(items)} products failed"
+            job["completed_at"] = _now().isoformat()
+
+    def _expired(self, item: Dict[str, Any]) -> bool:
+        expires = item.get("lease_expires_at")
+        return bool(expires) and datetime.fromisoformat(expires) < _now()
+
+    def rpc(self, name: str, args: Dict[str, Any]) -> Any:
+        items = self.rows("pipeline_job_items")
+        now = _now()
+
+        if name == "claim_pipeline_job_items":
+            for item in items:
+                if item["status"] == "running" and self._expired(item) and item["attempts"] >= args["p_max_attempts"]:
+                    item.update(status="failed", error=f"Lease expired after {item['attempts']} attempts",
+                                lease_owner=None, lease_expires_at=None, finished_at=now.isoformat())
+                    self._refresh_job(item["job_id"])
+            exclude = set(args.get("p_exclude_brands") or [])
+            candidates = [
+                i for i in items
+                if (i["status"] == "pending" or (i["status"] == "running" and self._expired(i)))
+                and i["attempts"] < args["p_max_attempts"] and i["brand_id"] not in exclude
+            ]
+            candidates.sort(key=lambda i: (i["created_at"], i["position"]))
+            capacity = dict(args.get("p_brand_capacity") or {})
+            default = args.get("p_default_capacity")
+            taken: Dict[str, int] = {}
+            picked = []
+            for item in candidates:
+                brand = item["brand_id"]
+                cap = capacity.get(brand, default)
+                if len(picked) >= args["p_limit"] or (cap is not None and taken.get(brand, 0) >= cap):
+                    continue
+                taken[brand] = taken.get(brand, 0) + 1
+                picked.append(item)
+            claimed = []
+            for item in picked:
+                item.update(status="running", attempts=item["attempts"] + 1, lease_owner=args["p_worker_id"],
+                            lease_expires_at=(now + timedelta(seconds=args["p_lease_seconds"])).isoformat(),
+                            heartbeat_at=now.isoformat(), started_at=now.isoformat(), error=None)
+                job = self._job(item["job_id"])
+                if job and job["status"] == "pending":
+                    job["status"] = "running"
+                claimed.append(dict(item))
+            return claimed
+
+        if name == "heartbeat_pipeline_job_items":
+            owned = []
+            for item in items:
+                if item["id"] in args["p_item_ids"] and item["lease_owner"] == args["p_worker_id"] and item["status"] == "running":
+                    item.update(lease_expires_at=(now + timedelta(seconds=args["p_lease_seconds"])).isoformat(),
+                                heartbeat_at=now.isoformat())
+                    owned.append(item["id"])
+            return owned
+
+        if name == "finish_pipeline_job_item":
+            item = next((i for i in items if i["id"] == args["p_item_id"]), None)
+            if not item or item["lease_owner"] != args["p_worker_id"] or item["status"] != "running":
+                return False
+            item.update(status=args["p_status"], error=args.get("p_error"), lease_owner=None,
+                        lease_expires_at=None, finished_at=now.isoformat())
+            if args.get("p_steps") is not None:
+                item["steps"] = args["p_steps"]
+            if not any(i["job_id"] == item["job_id"] and i["status"] in ("pending", "running") for i in items):
+                self._refresh_job(item["job_id"])
+            return True
+
+        if name == "refresh_pipeline_jobs":
+            result = []
+            for job_id in args["p_job_ids"]:
+                job = self._job(job_id)
+                if not job:
+                    continue
+                if job["status"] in ("pending", "running"):
+                    self._refresh_job(job_id)
+                result.append({k: job.get(k) for k in ("id", "brand_id", "status", "progress", "total_products", "error")})
+            return result
+
+        if name == "release_pipeline_job_items":
+            released = 0
+            for item in items:
+                if item["id"] in args["p_item_ids"] and item["lease_owner"] == args["p_worker_id"] and item["status"] == "running":
+                    item.update(status="pending", attempts=max(item["attempts"] - 1, 0), lease_owner=None, lease_expires_at=None)
+                    released += 1
+            return released
+
+        raise KeyError(name)
+
+
+# --- HTTP app ----------------------------------------------------------------
+
+def create_app(store: FakeStore, settings: Dict[str, Any]):
+    """
+    One app for all fakes, split by path prefix:
+    /rest/v1 (PostgREST), /storage/v1 (Storage), /shopify (product images).
+    """
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    images = [make_image(seed, settings["source_image_size"]) for seed in range(8)]
+    stats: Dict[str, int] = {}
+
+    def service(path: str) -> Optional[str]:
+        for prefix, name in (("/rest/", "db"), ("/storage/", "storage"), ("/shopify/", "shopify")):
+            if path.startswith(prefix):
+                return name
+        return None
+
+    @app.middleware("http")
+    async def latency_and_errors(request: Request, call_next):
+        name = service(request.url.path)
+        if name:
+            stats[name] = stats.get(name, 0) + 1
+            await asyncio.sleep(_delay(settings[f"{name}_latency"]))
+            if random.random() < settings[f"{name}_error_rate"]:
+                stats[f"{name}_errors"] = stats.get(f"{name}_errors", 0) + 1
+                return JSONResponse({"message": "Injected failure", "code": "503", "details": None, "hint": None}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "requests": stats,
+            "objects": sum(len(paths) for paths in store.objects.values()),
+            "object_bytes": sum(sum(paths.values()) for paths in store.objects.values()),
+        }
+
+    @app.get("/rest/v1/{table}")
+    async def rest_select(table: str, request: Request):
+        return JSONResponse(store.select(table, list(request.query_params.multi_items())))
+
+    @app.post("/rest/v1/rpc/{name}")
+    async def rest_rpc(name: str, request: Request):
+        try:
+            return JSONResponse(store.rpc(name, await request.json()))
+        except KeyError:
+            return JSONResponse({"message": f"Unknown function {name}", "code": "PGRST202", "details": None, "hint": None}, status_code=404)
+
+    @app.post("/rest/v1/{table}")
+    async def rest_insert(table: str, request: Request):
+        rows = store.insert(table, await request.json(), request.query_params.get("on_conflict"))
+        return JSONResponse(rows, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def rest_update(table: str, request: Request):
+        return JSONResponse(store.update(table, list(request.query_params.multi_items()), await request.json()))
+
+    @app.delete("/rest/v1/{table}")
+    async def rest_delete(table: str, request: Request):
+        return JSONResponse(store.delete(table, list(request.query_params.multi_items())))
+
+    @app.post("/storage/v1/object/list/{bucket}")
+    async def storage_list(bucket: str, request: Request):
+        prefix = ((await request.json()) or {}).get("prefix", "").strip("/")
+        names = {
+            path[len(prefix) + 1:].split("/", 1)[0]
+            for path in store.objects.get(bucket, {})
+            if path.startswith(prefix + "/")
+        }
+        return [{"name": name, "id": None, "metadata": {}} for name in sorted(names)]
+
+    @app.delete("/storage/v1/object/{bucket}")
+    async def storage_remove(bucket: str, request: Request):
+        removed = []
+        for path in ((await request.json()) or {}).get("prefixes", []):
+            if store.objects.get(bucket, {}).pop(path, None) is not None:
+                removed.append({"name": path, "bucket_id": bucket})
+        return removed
+
+    @app.api_route("/storage/v1/object/{bucket}/{path:path}", methods=["POST", "PUT"])
+    async def storage_upload(bucket: str, path: str, request: Request):
+        body = await request.body()
+        store.objects.setdefault(bucket, {})[path] = len(body)
+        return {"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())}
+
+    @app.get("/shopify/cdn/{handle}/{name}")
+    async def shopify_image(handle: str, name: str):
+        data = images[zlib.crc32(f"{handle}/{name}".encode()) % len(images)]
+        return Response(data, media_type="image/jpeg", headers={"ETag": f'"{handle}-{name}"', "Cache-Control": "max-age=31536000"})
+
+    return app
+
+
+def serve(port: int, settings: Dict[str, Any]):
+    """Child-process entry point: seed the store and serve every fake on 127.0.0.1:port."""
+    import uvicorn
+
+    random.seed(settings.get("seed"))
+    store = FakeStore()
+    store.seed(settings["products"], settings["images_per_product"], f"http://127.0.0.1:{port}")
+    uvicorn.run(create_app(store, settings), host="127.0.0.1", port=port, log_level="warning", access_log=False)
@@ -0,0 +1,329 @@
+"""
+End-to-end pipeline benchmark against local fakes (no network needed).
+
+Runs N synthetic products through the real pipeline code - the durable
+queue and PipelineWorker (--mode worker, default) or
+GeminiService.process_product directly (--mode direct) - with Supabase,
+Shopify and Gemini replaced by the fakes in benchmarks/fakes.py. Reports
+products/minute, p50/p95 per pipeline step and peak memory.
+
+    cd backend
+    python benchmarks/pipeline_benchmark.py --products 50
+    python benchmarks/pipeline_benchmark.py --products 50 --json before.json
+    # ...change something...
+    python benchmarks/pipeline_benchmark.py --products 50 --baseline before.json
+
+Settings the app reads from the environment (SUPABASE_POOL_SIZE,
+STORAGE_UPLOAD_CONCURRENCY, IMAGE_FETCH_CONCURRENCY, ...) apply as usual.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import fakes
+
+# Any well-formed JWT; the fakes do not check it
+FAKE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the product pipeline against local fakes")
+    parser.add_argument("--products", type=int, default=20, help="number of synthetic products")
+    parser.add_argument("--mode", choices=["worker", "direct"], default="worker",
+                        help="worker: enqueue a job and run PipelineWorker; direct: call process_product")
+    parser.add_argument("--modes", default="ecommerce,lookbook", help="pipeline modes to run")
+    parser.add_argument("--concurrency", type=int, help="products in flight (PIPELINE_MAX/BRAND_CONCURRENCY)")
+    parser.add_argument("--images-per-product", type=int, default=4)
+    parser.add_argument("--images-per-step", type=int, default=3, help="images generated by steps 4 and 6")
+    parser.add_argument("--source-image-size", type=int, default=2048, help="edge of the Shopify images (px)")
+    parser.add_argument("--generated-image-size", type=int, default=1024, help="edge of generated images (px)")
+
+    fake = parser.add_argument_group("fake services (latencies in seconds, rates 0-1)")
+    fake.add_argument("--gemini-latency", type=float, default=1.5)
+    fake.add_argument("--gemini-image-latency", type=float, default=4.0)
+    fake.add_argument("--gemini-error-rate", type=float, default=0.0)
+    fake.add_argument("--gemini-429-rate", type=float, default=0.0)
+    fake.add_argument("--gemini-rpm", type=float, help="GEMINI_DEFAULT_RPM for the client-side limiter (default 6000)")
+    fake.add_argument("--db-latency", type=float, default=0.02)
+    fake.add_argument("--db-error-rate", type=float, default=0.0)
+    fake.add_argument("--storage-latency", type=float, default=0.08)
+    fake.add_argument("--storage-error-rate", type=float, default=0.0)
+    fake.add_argument("--shopify-latency", type=float, default=0.1)
+    fake.add_argument("--shopify-error-rate", type=float, default=0.0)
+
+    cache = parser.add_argument_group("caches")
+    cache.add_argument("--cache-dir", help="reuse this CACHE_DIR (warm caches); default is a fresh temp dir")
+    cache.add_argument("--response-cache", action="store_true", help="leave the Gemini response cache on")
+
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=3600, help="give up after this many seconds")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak Python heap (slower)")
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --json")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fakes(args: argparse.Namespace, port: int) -> multiprocessing.Process:
+    import httpx
+
+    settings = {
+        "seed": args.seed,
+        "products": args.products,
+        "images_per_product": args.images_per_product,
+        "source_image_size": args.source_image_size,
+        "db_latency": args.db_latency,
+        "db_error_rate": args.db_error_rate,
+        "storage_latency": args.storage_latency,
+        "storage_error_rate": args.storage_error_rate,
+        "shopify_latency": args.shopify_latency,
+        "shopify_error_rate": args.shopify_error_rate,
+    }
+    # Separate process, so the fakes use neither the pipeline's CPU nor its memory
+    process = multiprocessing.get_context("spawn").Process(target=fakes.serve, args=(port, settings), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Fake services did not start")
+
+
+def configure_environment(args: argparse.Namespace, port: int, cache_dir: str):
+    """Point the app at the fakes. Must run before anything from app is imported."""
+    os.environ.update({
+        "SUPABASE_URL": f"http://127.0.0.1:{port}",
+        "SUPABASE_KEY": FAKE_KEY,
+        "SUPABASE_SERVICE_KEY": FAKE_KEY,
+        "GOOGLE_API_KEY": "benchmark",
+        "CACHE_DIR": cache_dir,
+        "GEMINI_CACHE_ENABLED": "true" if args.response_cache else "false",
+        "GEMINI_RATE_LIMITS": "{}",
+        "TRACING_EXPORTER": "none",
+    })
+    if args.concurrency:
+        os.environ["PIPELINE_MAX_CONCURRENCY"] = str(args.concurrency)
+        os.environ["PIPELINE_BRAND_CONCURRENCY"] = str(args.concurrency)
+    if args.gemini_rpm:
+        os.environ["GEMINI_DEFAULT_RPM"] = str(args.gemini_rpm)
+    os.environ.setdefault("GEMINI_DEFAULT_RPM", "6000")
+    # Claim promptly; the default poll interval would only add idle time
+    os.environ.setdefault("PIPELINE_POLL_SECONDS", "0.5")
+
+
+def install_fake_gemini(args: argparse.Namespace):
+    from app.services import gemini_service
+
+    fakes.FakeGenerativeModel.configure(
+        text_latency=args.gemini_latency,
+        image_latency=args.gemini_image_latency,
+        error_rate=args.gemini_error_rate,
+        rate_limit_rate=args.gemini_429_rate,
+        images_per_step=args.images_per_step,
+        image_size=args.generated_image_size,
+    )
+    gemini_service.genai.configure = lambda **kwargs: None
+    gemini_service.genai.GenerativeModel = fakes.FakeGenerativeModel
+
+
+async def run_worker(args: argparse.Namespace, modes: List[str]) -> List[Dict[str, Any]]:
+    """Enqueue one job for every product and let the pipeline worker drain it."""
+    from app.supabase_client import supabase, execute
+    from app.services.job_queue import JobQueue
+    from app.services.pipeline_worker import pipeline_worker
+
+    response = await execute(supabase.table("products").select("product_id").eq("brand_id", fakes.BRAND_ID))
+    product_ids = [row["product_id"] for row in response.data]
+    job_id = await JobQueue.enqueue(fakes.BRAND_ID, product_ids, modes)
+
+    pipeline_worker.start()
+    pipeline_worker.wake()
+    deadline = time.monotonic() + args.timeout
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            job = await execute(supabase.table("pipeline_jobs").select("status").eq("id", job_id))
+            if job.data and job.data[0]["status"] in ("completed", "failed"):
+                break
+        else:
+            print(f"Timed out after {args.timeout}s")
+    finally:
+        await pipeline_worker.stop()
+
+    records = []
+    for item in await JobQueue.items(job_id):
+        duration = None
+        if item.get("started_at") and item.get("finished_at"):
+            duration = (datetime.fromisoformat(item["finished_at"]) - datetime.fromisoformat(item["started_at"])).total_seconds()
+        records.append({"status": item["status"], "seconds": duration, "steps": item.get("steps") or {}})
+    return records
+
+
+async def run_direct(args: argparse.Namespace, modes: List[str]) -> List[Dict[str, Any]]:
+    """Call process_product for every product, as many at a time as the pool allows."""
+    from app.supabase_client import supabase, execute
+    from app.services.gemini_service import GeminiService, PIPELINE_PRODUCT_COLUMNS
+    from app.services.prompt_service import PromptService
+    from app.services.worker_pool import product_pool
+
+    products = (await execute(supabase.table("products").select(PIPELINE_PRODUCT_COLUMNS).eq("brand_id", fakes.BRAND_ID))).data
+    prompts = await PromptService.get_prompts(fakes.BRAND_ID)
+    semaphore = asyncio.Semaphore(product_pool.global_limit)
+
+    async def run_one(product: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            result = await GeminiService(fakes.BRAND_ID, prompts=prompts).process_product(product, modes)
+            return {"status": result["status"], "seconds": time.perf_counter() - started, "steps": result.get("step_timings") or {}}
+
+    return await asyncio.wait_for(asyncio.gather(*(run_one(p) for p in products)), timeout=args.timeout)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(records: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    completed = [r for r in records if r["status"] == "completed"]
+    steps: Dict[str, List[float]] = {}
+    for record in records:
+        for name, timing in record["steps"].items():
+            if timing.get("status") == "completed" and timing.get("duration_ms") is not None:
+                steps.setdefault(name, []).append(timing["duration_ms"] / 1000)
+    product_seconds = [r["seconds"] for r in completed if r["seconds"] is not None]
+    return {
+        "products": len(records),
+        "completed": len(completed),
+        "failed": len(records) - len(completed),
+        "elapsed_seconds": round(elapsed, 2),
+        "products_per_minute": round(len(completed) / elapsed * 60, 2) if elapsed else 0.0,
+        "product_seconds": {"p50": percentile(product_seconds, 50), "p95": percentile(product_seconds, 95)},
+        "steps": {
+            name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+            for name, values in sorted(steps.items())
+        },
+    }
+
+
+def _change(current: Optional[float], before: Optional[float]) -> str:
+    if not current or not before:
+        return ""
+    return f"  ({(current - before) / before * 100:+.1f}%)"
+
+
+def report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    base_steps = (baseline or {}).get("steps", {})
+    print()
+    print(f"Products:        {results['completed']}/{results['products']} completed, {results['failed']} failed")
+    print(f"Elapsed:         {results['elapsed_seconds']}s")
+    print(f"Throughput:      {results['products_per_minute']} products/min"
+          f"{_change(results['products_per_minute'], (baseline or {}).get('products_per_minute'))}")
+    product = results["product_seconds"]
+    if product["p50"] is not None:
+        print(f"Per product:     p50 {product['p50']:.2f}s  p95 {product['p95']:.2f}s"
+              f"{_change(product['p95'], (baseline or {}).get('product_seconds', {}).get('p95'))}")
+    print(f"Peak RSS:        {results['peak_rss_mb']} MB"
+          f"{_change(results['peak_rss_mb'], (baseline or {}).get('peak_rss_mb'))}")
+    if results.get("peak_heap_mb") is not None:
+        print(f"Peak heap:       {results['peak_heap_mb']} MB")
+    print()
+    print(f"{'step':<26}{'n':>6}{'p50 (s)':>10}{'p95 (s)':>10}")
+    for name, stats in results["steps"].items():
+        print(f"{name:<26}{stats['count']:>6}{stats['p50']:>10.2f}{stats['p95']:>10.2f}"
+              f"{_change(stats['p95'], base_steps.get(name, {}).get('p95'))}")
+    fake_stats = results.get("fakes") or {}
+    if fake_stats:
+        print()
+        print(f"Fake services:   {json.dumps(fake_stats.get('requests', {}), sort_keys=True)}")
+
+
+async def main(args: argparse.Namespace, port: int) -> Dict[str, Any]:
+    import httpx
+    from app.services.upload_queue import upload_queue
+    from app.services.image_fetcher import image_fetcher
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    started = time.perf_counter()
+    if args.mode == "worker":
+        records = await run_worker(args, modes)
+    else:
+        records = await run_direct(args, modes)
+    # Result documents are uploaded in the background; they count towards the run
+    await upload_queue.drain(timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+    await image_fetcher.close()
+
+    results = summarize(records, elapsed)
+    async with httpx.AsyncClient() as client:
+        results["fakes"] = (await client.get(f"http://127.0.0.1:{port}/stats")).json()
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+    port = free_port()
+    server = start_fakes(args, port)
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="whybuy-bench-")
+    configure_environment(args, port, cache_dir)
+    install_fake_gemini(args)
+
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    try:
+        results = asyncio.run(main(args, port))
+    finally:
+        server.terminate()
+    results["peak_rss_mb"] = peak_rss_mb()
+    if args.tracemalloc:
+        results["peak_heap_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    results["settings"] = {k: v for k, v in vars(args).items() if k not in ("json_path", "baseline")}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
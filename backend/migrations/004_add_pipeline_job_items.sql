@@ -0,0 +1,219 @@
+-- Migration: Durable pipeline job queue
+-- Created: 2026-10-17
+-- Description: Adds per-product job items with leases so pipeline work survives
+-- restarts and can be shared by several worker processes without double-processing.
+
+-- Job-level columns used by the queue
+ALTER TABLE pipeline_jobs
+ADD COLUMN IF NOT EXISTS product_ids jsonb DEFAULT '[]'::jsonb,
+ADD COLUMN IF NOT EXISTS modes jsonb DEFAULT '["ecommerce", "lookbook"]'::jsonb;
+
+-- One row per product in a job
+CREATE TABLE IF NOT EXISTS public.pipeline_job_items (
+  id uuid PRIMARY KEY DEFAULT extensions.uuid_generate_v4(),
+  job_id uuid NOT NULL REFERENCES pipeline_jobs(id) ON DELETE CASCADE,
+  brand_id uuid NOT NULL REFERENCES brands(id) ON DELETE CASCADE,
+  product_id text NOT NULL,
+  position int NOT NULL DEFAULT 0,
+
+  status text NOT NULL DEFAULT 'pending',  -- 'pending', 'running', 'completed', 'failed'
+  attempts int NOT NULL DEFAULT 0,
+  error text NULL,
+
+  -- Lease held by the worker currently processing the item
+  lease_owner text NULL,
+  lease_expires_at timestamp with time zone NULL,
+  heartbeat_at timestamp with time zone NULL,
+
+  created_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now()),
+  started_at timestamp with time zone NULL,
+  finished_at timestamp with time zone NULL,
+
+  CONSTRAINT pipeline_job_items_job_product_key UNIQUE (job_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_job_items_job ON pipeline_job_items(job_id);
+CREATE INDEX IF NOT EXISTS idx_pipeline_job_items_claimable
+  ON pipeline_job_items(created_at, position)
+  WHERE status IN ('pending', 'running');
+
+ALTER TABLE pipeline_job_items ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all access for now" ON pipeline_job_items FOR ALL USING (true);
+
+COMMENT ON TABLE public.pipeline_job_items IS 'Per-product work items of pipeline jobs (durable queue)';
+COMMENT ON COLUMN public.pipeline_job_items.lease_expires_at IS 'Item may be re-claimed by another worker once this passes';
+
+
+-- Recompute a job's progress and close it once every item is finished
+CREATE OR REPLACE FUNCTION public.refresh_pipeline_job(p_job_id uuid)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_total int;
+  v_done int;
+  v_failed int;
+BEGIN
+  SELECT count(*),
+         count(*) FILTER (WHERE status IN ('completed', 'failed')),
+         count(*) FILTER (WHERE status = 'failed')
+    INTO v_total, v_done, v_failed
+    FROM pipeline_job_items
+   WHERE job_id = p_job_id;
+
+  UPDATE pipeline_jobs
+     SET progress = v_done,
+         status = CASE
+                    WHEN v_done < v_total THEN status
+                    WHEN v_failed > 0 THEN 'failed'
+                    ELSE 'completed'
+                  END,
+         error = CASE
+                   WHEN v_done = v_total AND v_failed > 0
+                   THEN v_failed || ' of ' || v_total || ' products failed'
+                   ELSE error
+                 END,
+         completed_at = CASE WHEN v_done = v_total THEN now() ELSE completed_at END
+   WHERE id = p_job_id;
+END;
+$$;
+
+
+-- Claim up to p_limit items for a worker. Pending items and items whose lease
+-- expired are both claimable; SKIP LOCKED keeps concurrent workers apart.
+CREATE OR REPLACE FUNCTION public.claim_pipeline_job_items(
+  p_worker_id text,
+  p_limit int,
+  p_lease_seconds int DEFAULT 120,
+  p_max_attempts int DEFAULT 3,
+  p_exclude_brands uuid[] DEFAULT '{}'
+)
+RETURNS SETOF pipeline_job_items
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+BEGIN
+  -- Items that keep losing their worker are given up on
+  FOR v_job_id IN
+    UPDATE pipeline_job_items
+       SET status = 'failed',
+           error = 'Lease expired after ' || attempts || ' attempts',
+           lease_owner = NULL,
+           lease_expires_at = NULL,
+           finished_at = now()
+     WHERE status = 'running'
+       AND lease_expires_at < now()
+       AND attempts >= p_max_attempts
+    RETURNING job_id
+  LOOP
+    PERFORM refresh_pipeline_job(v_job_id);
+  END LOOP;
+
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT id
+      FROM pipeline_job_items
+     WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < now()))
+       AND attempts < p_max_attempts
+       AND NOT (brand_id = ANY (p_exclude_brands))
+     ORDER BY created_at, position
+     LIMIT p_limit
+     FOR UPDATE SKIP LOCKED
+  ), claimed AS (
+    UPDATE pipeline_job_items i
+       SET status = 'running',
+           attempts = i.attempts + 1,
+           lease_owner = p_worker_id,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           heartbeat_at = now(),
+           started_at = now(),
+           error = NULL
+      FROM candidates c
+     WHERE i.id = c.id
+    RETURNING i.*
+  ), started AS (
+    UPDATE pipeline_jobs j
+       SET status = 'running'
+     WHERE j.id IN (SELECT job_id FROM claimed)
+       AND j.status = 'pending'
+  )
+  SELECT * FROM claimed;
+END;
+$$;
+
+
+-- Extend the leases a worker still holds; returns the ids it still owns
+CREATE OR REPLACE FUNCTION public.heartbeat_pipeline_job_items(
+  p_worker_id text,
+  p_item_ids uuid[],
+  p_lease_seconds int DEFAULT 120
+)
+RETURNS SETOF uuid
+LANGUAGE sql
+AS $$
+  UPDATE pipeline_job_items
+     SET lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+         heartbeat_at = now()
+   WHERE id = ANY (p_item_ids)
+     AND lease_owner = p_worker_id
+     AND status = 'running'
+  RETURNING id;
+$$;
+
+
+-- Record the outcome of an item. Only the current lease owner may finish it.
+CREATE OR REPLACE FUNCTION public.finish_pipeline_job_item(
+  p_item_id uuid,
+  p_worker_id text,
+  p_status text,
+  p_error text DEFAULT NULL
+)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+BEGIN
+  UPDATE pipeline_job_items
+     SET status = p_status,
+         error = p_error,
+         lease_owner = NULL,
+         lease_expires_at = NULL,
+         finished_at = now()
+   WHERE id = p_item_id
+     AND lease_owner = p_worker_id
+     AND status = 'running'
+  RETURNING job_id INTO v_job_id;
+
+  IF v_job_id IS NULL THEN
+    RETURN false;
+  END IF;
+
+  PERFORM refresh_pipeline_job(v_job_id);
+  RETURN true;
+END;
+$$;
+
+
+-- Hand items back to the queue on graceful shutdown, without using up an attempt
+CREATE OR REPLACE FUNCTION public.release_pipeline_job_items(
+  p_worker_id text,
+  p_item_ids uuid[]
+)
+RETURNS int
+LANGUAGE sql
+AS $$
+  WITH released AS (
+    UPDATE pipeline_job_items
+       SET status = 'pending',
+           attempts = greatest(attempts - 1, 0),
+           lease_owner = NULL,
+           lease_expires_at = NULL
+     WHERE id = ANY (p_item_ids)
+       AND lease_owner = p_worker_id
+       AND status = 'running'
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM released;
+$$;
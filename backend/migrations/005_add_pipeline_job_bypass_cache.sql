@@ -0,0 +1,8 @@
+-- Migration: Per-job Gemini response cache bypass
+-- Created: 2026-10-17
+-- Description: Lets a pipeline job ignore cached Gemini text responses and regenerate every step
+
+ALTER TABLE pipeline_jobs
+ADD COLUMN IF NOT EXISTS bypass_cache boolean DEFAULT false;
+
+COMMENT ON COLUMN pipeline_jobs.bypass_cache IS 'Ignore cached Gemini responses for this job (fresh responses still refresh the cache)';
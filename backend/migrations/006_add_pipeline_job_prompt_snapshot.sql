@@ -0,0 +1,9 @@
+-- Migration: Prompt snapshot per pipeline job
+-- Created: 2026-10-17
+-- Description: Stores the brand's prompt templates on the job when it is queued,
+-- so every product of a job uses the same prompt version
+
+ALTER TABLE pipeline_jobs
+ADD COLUMN IF NOT EXISTS prompt_snapshot jsonb NULL;
+
+COMMENT ON COLUMN pipeline_jobs.prompt_snapshot IS 'Prompt name -> content at enqueue time (NULL: use live prompts)';
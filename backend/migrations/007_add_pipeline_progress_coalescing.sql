@@ -0,0 +1,69 @@
+-- Migration: Coalesced pipeline job progress
+-- Created: 2026-10-17
+-- Description: Finishing an item no longer rewrites the job row every time.
+-- The job is closed as soon as its last item finishes; in between, workers
+-- flush progress for the jobs they touched on a fixed interval
+
+-- Record the outcome of an item. Only the current lease owner may finish it.
+CREATE OR REPLACE FUNCTION public.finish_pipeline_job_item(
+  p_item_id uuid,
+  p_worker_id text,
+  p_status text,
+  p_error text DEFAULT NULL
+)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+BEGIN
+  UPDATE pipeline_job_items
+     SET status = p_status,
+         error = p_error,
+         lease_owner = NULL,
+         lease_expires_at = NULL,
+         finished_at = now()
+   WHERE id = p_item_id
+     AND lease_owner = p_worker_id
+     AND status = 'running'
+  RETURNING job_id INTO v_job_id;
+
+  IF v_job_id IS NULL THEN
+    RETURN false;
+  END IF;
+
+  -- Last item: close the job right away
+  IF NOT EXISTS (
+    SELECT 1 FROM pipeline_job_items
+     WHERE job_id = v_job_id
+       AND status IN ('pending', 'running')
+  ) THEN
+    PERFORM refresh_pipeline_job(v_job_id);
+  END IF;
+  RETURN true;
+END;
+$$;
+
+
+-- Flush progress of several jobs at once and return their current state
+CREATE OR REPLACE FUNCTION public.refresh_pipeline_jobs(p_job_ids uuid[])
+RETURNS TABLE (id uuid, brand_id uuid, status text, progress int, total_products int, error text)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+BEGIN
+  FOR v_job_id IN
+    SELECT j.id FROM pipeline_jobs j
+     WHERE j.id = ANY (p_job_ids)
+       AND j.status IN ('pending', 'running')
+  LOOP
+    PERFORM refresh_pipeline_job(v_job_id);
+  END LOOP;
+
+  RETURN QUERY
+  SELECT j.id, j.brand_id, j.status::text, j.progress::int, j.total_products::int, j.error
+    FROM pipeline_jobs j
+   WHERE j.id = ANY (p_job_ids);
+END;
+$$;
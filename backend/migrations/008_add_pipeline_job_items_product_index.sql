@@ -0,0 +1,8 @@
+-- Migration: Active job lookup by product
+-- Created: 2026-10-17
+-- Description: Partial index so "is this product queued or running?" (one product
+-- or a whole product list page) is a single index lookup on pipeline_job_items
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_job_items_active_product
+  ON pipeline_job_items(brand_id, product_id)
+  WHERE status IN ('pending', 'running');
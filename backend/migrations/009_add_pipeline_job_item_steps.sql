@@ -0,0 +1,95 @@
+-- Migration: Per-step item records and retrying failed items
+-- Created: 2026-10-17
+-- Description: Stores each item's step timings/statuses, and adds an RPC that
+-- re-queues only the failed or stalled items of a job
+-- Requires 004 (pipeline_job_items) and 007, whose 4-argument
+-- finish_pipeline_job_item this replaces; apply migrations in file-number order
+
+ALTER TABLE pipeline_job_items
+ADD COLUMN IF NOT EXISTS steps jsonb NULL;
+
+COMMENT ON COLUMN public.pipeline_job_items.steps IS 'Per-step {status, started_at, ended_at, duration_ms} of the last attempt';
+
+-- finish_pipeline_job_item gains p_steps; drop the old signature so the call stays unambiguous
+DROP FUNCTION IF EXISTS public.finish_pipeline_job_item(uuid, text, text, text);
+
+-- Record the outcome of an item. Only the current lease owner may finish it.
+CREATE OR REPLACE FUNCTION public.finish_pipeline_job_item(
+  p_item_id uuid,
+  p_worker_id text,
+  p_status text,
+  p_error text DEFAULT NULL,
+  p_steps jsonb DEFAULT NULL
+)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+BEGIN
+  UPDATE pipeline_job_items
+     SET status = p_status,
+         error = p_error,
+         steps = coalesce(p_steps, steps),
+         lease_owner = NULL,
+         lease_expires_at = NULL,
+         finished_at = now()
+   WHERE id = p_item_id
+     AND lease_owner = p_worker_id
+     AND status = 'running'
+  RETURNING job_id INTO v_job_id;
+
+  IF v_job_id IS NULL THEN
+    RETURN false;
+  END IF;
+
+  -- Last item: close the job right away
+  IF NOT EXISTS (
+    SELECT 1 FROM pipeline_job_items
+     WHERE job_id = v_job_id
+       AND status IN ('pending', 'running')
+  ) THEN
+    PERFORM refresh_pipeline_job(v_job_id);
+  END IF;
+  RETURN true;
+END;
+$$;
+
+
+-- Put a job's failed items (and, optionally, running items whose lease ran
+-- out) back in the queue with a fresh attempt budget. Completed items are
+-- left alone. Returns the number of items re-queued.
+CREATE OR REPLACE FUNCTION public.retry_pipeline_job_items(
+  p_job_id uuid,
+  p_include_stalled boolean DEFAULT true
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count int;
+BEGIN
+  UPDATE pipeline_job_items
+     SET status = 'pending',
+         attempts = 0,
+         error = NULL,
+         lease_owner = NULL,
+         lease_expires_at = NULL,
+         started_at = NULL,
+         finished_at = NULL
+   WHERE job_id = p_job_id
+     AND (status = 'failed'
+          OR (p_include_stalled AND status = 'running' AND lease_expires_at < now()));
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  IF v_count > 0 THEN
+    UPDATE pipeline_jobs
+       SET status = 'running',
+           error = NULL,
+           completed_at = NULL
+     WHERE id = p_job_id;
+    PERFORM refresh_pipeline_job(p_job_id);
+  END IF;
+  RETURN v_count;
+END;
+$$;
@@ -0,0 +1,9 @@
+-- Migration: Trace context on pipeline jobs
+-- Created: 2026-10-17
+-- Description: Stores the W3C trace context of the request that queued a job so
+-- worker spans for its products join the same trace
+
+ALTER TABLE pipeline_jobs
+ADD COLUMN IF NOT EXISTS trace_context jsonb NULL;
+
+COMMENT ON COLUMN public.pipeline_jobs.trace_context IS 'traceparent/tracestate of the enqueueing request';
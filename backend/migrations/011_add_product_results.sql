@@ -0,0 +1,118 @@
+-- Migration: Move pipeline results out of the products row
+-- Created: 2026-10-17
+-- Description: Full pipeline result documents move from products.generated_content
+-- to product_results, loaded only by the detail, flag and push views. The
+-- products row keeps a compact result_summary (status, counts, image URLs,
+-- QA verdict) that a trigger derives from the side table.
+
+CREATE TABLE IF NOT EXISTS public.product_results (
+  product_id uuid PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+  brand_id uuid NOT NULL REFERENCES brands(id) ON DELETE CASCADE,
+  content jsonb NOT NULL,
+  updated_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now())
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_results_brand ON product_results(brand_id);
+
+ALTER TABLE product_results ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all access for now" ON product_results FOR ALL USING (true);
+
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS result_summary jsonb NULL;
+
+COMMENT ON TABLE public.product_results IS 'Full pipeline result document (product_data.json) per product';
+COMMENT ON COLUMN public.products.result_summary IS 'Compact summary of product_results.content, maintained by trigger';
+COMMENT ON COLUMN public.products.generated_content IS 'Deprecated: pipeline results live in product_results';
+
+
+-- The image fields a grid or badge needs, without prompts or step outputs
+CREATE OR REPLACE FUNCTION public.product_result_images(p_images jsonb)
+RETURNS jsonb
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT coalesce(jsonb_agg(
+           jsonb_strip_nulls(jsonb_build_object(
+             'attribute', img->'attribute',
+             'scenario', img->'scenario',
+             'status', img->'status',
+             'flagged', img->'flagged',
+             'image_path', img->'image_path',
+             'webp_path', img->'webp_path',
+             'thumbnails', img->'thumbnails',
+             'shopify_cdn_url', img->'shopify_cdn_url'
+           )) ORDER BY ord), '[]'::jsonb)
+    FROM jsonb_array_elements(
+           CASE WHEN jsonb_typeof(p_images) = 'array' THEN p_images ELSE '[]'::jsonb END
+         ) WITH ORDINALITY AS t(img, ord)
+   WHERE jsonb_typeof(img) = 'object';
+$$;
+
+
+-- Compact summary of a pipeline result document
+CREATE OR REPLACE FUNCTION public.product_result_summary(p_content jsonb)
+RETURNS jsonb
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  WITH images AS (
+    SELECT product_result_images(p_content #> '{pipeline_outputs,step4_ecommerce_images,ecommerce_images}') AS ecommerce,
+           product_result_images(p_content #> '{pipeline_outputs,step6_lookbook_images,lookbook_images}') AS lookbook
+  ), counts AS (
+    SELECT count(*) FILTER (WHERE img->>'status' = 'generated') AS generated,
+           count(*) FILTER (WHERE img->>'status' = 'failed') AS failed,
+           count(*) FILTER (WHERE (img->>'flagged')::boolean IS TRUE) AS flagged
+      FROM images, jsonb_array_elements(images.ecommerce || images.lookbook) AS img
+  )
+  SELECT CASE WHEN p_content IS NULL OR p_content = '{}'::jsonb THEN NULL ELSE
+    jsonb_strip_nulls(jsonb_build_object(
+      'status', p_content->'status',
+      'timestamp', p_content->'timestamp',
+      'error', p_content->'error',
+      'images_processed', p_content->'images_processed',
+      'qa_status', p_content #> '{pipeline_outputs,step7_qa_report,overall_status}',
+      'ecommerce_images', images.ecommerce,
+      'lookbook_images', images.lookbook,
+      'image_counts', jsonb_build_object('generated', counts.generated, 'failed', counts.failed, 'flagged', counts.flagged)
+    ))
+  END
+    FROM images, counts;
+$$;
+
+
+-- Keep products.result_summary in step with product_results
+CREATE OR REPLACE FUNCTION public.sync_product_result_summary()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    UPDATE products SET result_summary = NULL WHERE id = OLD.product_id;
+    RETURN OLD;
+  END IF;
+  UPDATE products
+     SET result_summary = product_result_summary(NEW.content)
+   WHERE id = NEW.product_id;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS product_results_summary ON product_results;
+CREATE TRIGGER product_results_summary
+AFTER INSERT OR UPDATE OF content OR DELETE ON product_results
+FOR EACH ROW EXECUTE FUNCTION sync_product_result_summary();
+
+
+-- Backfill: move existing documents and empty the old column
+INSERT INTO product_results (product_id, brand_id, content)
+SELECT id, brand_id, generated_content
+  FROM products
+ WHERE generated_content IS NOT NULL
+   AND generated_content <> '{}'::jsonb
+ON CONFLICT (product_id) DO UPDATE SET content = EXCLUDED.content, updated_at = now();
+
+UPDATE products
+   SET generated_content = NULL
+ WHERE generated_content IS NOT NULL;
+
+ALTER TABLE products ALTER COLUMN generated_content SET DEFAULT NULL;
@@ -0,0 +1,14 @@
+-- Migration: Keyset pagination for product listings
+-- Created: 2026-10-17
+-- Description: Product lists page on (uploaded_at, id) instead of OFFSET. The
+-- index serves every page of a brand straight from its position, and
+-- uploaded_at becomes NOT NULL so the key is total.
+
+UPDATE products
+   SET uploaded_at = coalesce(processed_at, last_synced_at, timezone('utc'::text, now()))
+ WHERE uploaded_at IS NULL;
+
+ALTER TABLE products ALTER COLUMN uploaded_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_products_brand_uploaded
+  ON products (brand_id, uploaded_at DESC, id DESC);
@@ -0,0 +1,72 @@
+-- Migration: Indexed product search
+-- Created: 2026-10-17
+-- Description: Search over title, handle, vendor, tags and product type. Words
+-- are matched as prefixes through a tsvector index, and typos and partial words
+-- through a trigram index. search_products ranks the matches and pages them.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+
+-- Title weighs most, then handle, then vendor/type, then tags
+ALTER TABLE products
+ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+  setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('simple', replace(coalesce(shopify_handle, ''), '-', ' ')), 'B') ||
+  setweight(to_tsvector('simple', coalesce(vendor, '') || ' ' || coalesce(product_type, '')), 'C') ||
+  setweight(to_tsvector('simple', coalesce(tags, '')), 'D')
+) STORED,
+ADD COLUMN IF NOT EXISTS search_text text GENERATED ALWAYS AS (
+  lower(
+    coalesce(title, '') || ' ' || coalesce(shopify_handle, '') || ' ' ||
+    coalesce(vendor, '') || ' ' || coalesce(product_type, '') || ' ' || coalesce(tags, '')
+  )
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS idx_products_search_trgm ON products USING gin (search_text extensions.gin_trgm_ops);
+
+COMMENT ON COLUMN public.products.search_vector IS 'Weighted words of title/handle/vendor/type/tags for search_products';
+COMMENT ON COLUMN public.products.search_text IS 'Lower-cased searchable text for trigram (fuzzy) matching';
+
+
+-- Ranked search within a brand. Every word of p_query must match as a word
+-- prefix, or the whole query must be close to some words of the product
+-- (trigram word similarity, which forgives typos). Returns ids in rank order
+-- with the total number of matches.
+CREATE OR REPLACE FUNCTION public.search_products(
+  p_brand_id uuid,
+  p_query text,
+  p_vendor text DEFAULT NULL,
+  p_product_type text DEFAULT NULL,
+  p_processed boolean DEFAULT NULL,
+  p_push_status text DEFAULT NULL,
+  p_limit int DEFAULT 50,
+  p_offset int DEFAULT 0
+)
+RETURNS TABLE (id uuid, rank real, total bigint)
+LANGUAGE sql
+STABLE
+SET search_path = public, extensions
+AS $$
+  WITH q AS (
+    SELECT lower(trim(p_query)) AS term,
+           (SELECT to_tsquery('simple', string_agg(word || ':*', ' & '))
+              FROM regexp_split_to_table(
+                     regexp_replace(lower(p_query), '[^[:alnum:]]+', ' ', 'g'), ' '
+                   ) AS word
+             WHERE word <> '') AS tsq
+  )
+  SELECT p.id,
+         (2 * coalesce(ts_rank(p.search_vector, q.tsq), 0) + word_similarity(q.term, p.search_text))::real AS rank,
+         count(*) OVER () AS total
+    FROM products p, q
+   WHERE p.brand_id = p_brand_id
+     AND ((q.tsq IS NOT NULL AND p.search_vector @@ q.tsq) OR q.term <% p.search_text)
+     AND (p_vendor IS NULL OR p.vendor = p_vendor)
+     AND (p_product_type IS NULL OR p.product_type = p_product_type)
+     AND (p_processed IS NULL OR p.processed = p_processed)
+     AND (p_push_status IS NULL
+          OR p.push_status = p_push_status
+          OR (p_push_status = 'pending' AND p.push_status IS NULL))
+   ORDER BY rank DESC, p.uploaded_at DESC, p.id DESC
+   LIMIT p_limit OFFSET p_offset;
+$$;
@@ -0,0 +1,53 @@
+-- Migration: Dashboard aggregates in one query
+-- Created: 2026-10-17
+-- Description: dashboard_stats returns every dashboard count for a brand in a
+-- single round trip: product totals, processed, flagged, a push_status
+-- breakdown, running jobs, and the five most recent jobs
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_jobs_brand_started
+  ON pipeline_jobs (brand_id, started_at DESC);
+
+CREATE OR REPLACE FUNCTION public.dashboard_stats(p_brand_id uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  WITH groups AS (
+    -- One pass over the brand's products, split by push status
+    SELECT coalesce(push_status, 'pending') AS push_status,
+           count(*) AS total,
+           count(*) FILTER (WHERE processed) AS processed,
+           count(*) FILTER (WHERE flagged) AS flagged
+      FROM products
+     WHERE brand_id = p_brand_id
+     GROUP BY 1
+  ), totals AS (
+    SELECT coalesce(sum(total), 0)::int AS total,
+           coalesce(sum(processed), 0)::int AS processed,
+           coalesce(sum(flagged), 0)::int AS flagged,
+           coalesce(jsonb_object_agg(push_status, total), '{}'::jsonb) AS push_status
+      FROM groups
+  ), recent AS (
+    SELECT id, status, progress, total_products, modes, error, started_at, completed_at
+      FROM pipeline_jobs
+     WHERE brand_id = p_brand_id
+     ORDER BY started_at DESC
+     LIMIT 5
+  )
+  SELECT jsonb_build_object(
+           'total_products', t.total,
+           'processed_products', t.processed,
+           'pending_products', t.total - t.processed,
+           'flagged_products', t.flagged,
+           'push_status', t.push_status,
+           'active_jobs_count', (
+             SELECT count(*) FROM pipeline_jobs
+              WHERE brand_id = p_brand_id AND status = 'running'
+           ),
+           'recent_jobs', coalesce(
+             (SELECT jsonb_agg(to_jsonb(r) ORDER BY r.started_at DESC) FROM recent r),
+             '[]'::jsonb
+           )
+         )
+    FROM totals t;
+$$;
@@ -0,0 +1,47 @@
+-- Migration: Product facets
+-- Created: 2026-10-17
+-- Description: product_facets returns the distinct vendor, product_type,
+-- push_status and processed values of a brand's products with their counts,
+-- from one grouped pass (GROUPING SETS) over the brand's rows
+
+CREATE OR REPLACE FUNCTION public.product_facets(p_brand_id uuid)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+  WITH rows AS (
+    SELECT nullif(trim(vendor), '') AS vendor,
+           nullif(trim(product_type), '') AS product_type,
+           coalesce(push_status, 'pending') AS push_status,
+           coalesce(processed, false) AS processed
+      FROM products
+     WHERE brand_id = p_brand_id
+  ), groups AS (
+    SELECT CASE
+             WHEN GROUPING(vendor) = 0 THEN 'vendor'
+             WHEN GROUPING(product_type) = 0 THEN 'product_type'
+             WHEN GROUPING(push_status) = 0 THEN 'push_status'
+             ELSE 'processed'
+           END AS facet,
+           CASE
+             WHEN GROUPING(vendor) = 0 THEN to_jsonb(vendor)
+             WHEN GROUPING(product_type) = 0 THEN to_jsonb(product_type)
+             WHEN GROUPING(push_status) = 0 THEN to_jsonb(push_status)
+             ELSE to_jsonb(processed)
+           END AS value,
+           count(*) AS count
+      FROM rows
+     GROUP BY GROUPING SETS ((vendor), (product_type), (push_status), (processed))
+  )
+  SELECT jsonb_build_object('vendor', '[]'::jsonb, 'product_type', '[]'::jsonb,
+                            'push_status', '[]'::jsonb, 'processed', '[]'::jsonb)
+         || coalesce(jsonb_object_agg(facet, entries), '{}'::jsonb)
+    FROM (
+      -- Products without a vendor / type are not a value to filter on
+      SELECT facet, jsonb_agg(jsonb_build_object('value', value, 'count', count)
+                              ORDER BY count DESC, value) AS entries
+        FROM groups
+       WHERE value <> 'null'::jsonb
+       GROUP BY facet
+    ) f;
+$$;
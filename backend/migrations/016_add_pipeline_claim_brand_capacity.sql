@@ -0,0 +1,124 @@
+-- Migration: Cap pipeline claims per brand
+-- Created: 2026-10-17
+-- Description: claim_pipeline_job_items takes how many more items of each
+-- brand the worker may run (p_brand_capacity, with p_default_capacity for
+-- brands not listed), so a worker never leases items it would only hold
+-- behind its brand limit while other workers are idle. Replaces the
+-- 5-argument version from 004.
+
+-- Per-brand order of the claimable items: the claim walks the distinct
+-- brands through it (one index probe per brand) and takes each brand's
+-- items from it, instead of aggregating the whole backlog on every poll
+CREATE INDEX IF NOT EXISTS idx_pipeline_job_items_claimable_brand
+  ON pipeline_job_items(brand_id, created_at, position)
+  WHERE status IN ('pending', 'running');
+
+DROP FUNCTION IF EXISTS public.claim_pipeline_job_items(text, int, int, int, uuid[]);
+
+CREATE OR REPLACE FUNCTION public.claim_pipeline_job_items(
+  p_worker_id text,
+  p_limit int,
+  p_lease_seconds int DEFAULT 120,
+  p_max_attempts int DEFAULT 3,
+  p_exclude_brands uuid[] DEFAULT '{}',
+  p_brand_capacity jsonb DEFAULT '{}',
+  p_default_capacity int DEFAULT NULL
+)
+RETURNS SETOF pipeline_job_items
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_job_id uuid;
+  v_brand_id uuid;
+  v_take int;
+  v_claimed int;
+  v_remaining int := p_limit;
+BEGIN
+  -- Items that keep losing their worker are given up on
+  FOR v_job_id IN
+    UPDATE pipeline_job_items
+       SET status = 'failed',
+           error = 'Lease expired after ' || attempts || ' attempts',
+           lease_owner = NULL,
+           lease_expires_at = NULL,
+           finished_at = now()
+     WHERE status = 'running'
+       AND lease_expires_at < now()
+       AND attempts >= p_max_attempts
+    RETURNING job_id
+  LOOP
+    PERFORM refresh_pipeline_job(v_job_id);
+  END LOOP;
+
+  -- Brands with claimable work and free capacity, the one waiting longest
+  -- first. A skip scan: each step jumps to the next brand's oldest
+  -- claimable item, so the cost grows with brands, not with queued items.
+  FOR v_brand_id IN
+    WITH RECURSIVE brands AS (
+      (SELECT brand_id, created_at
+         FROM pipeline_job_items
+        WHERE status IN ('pending', 'running')
+          AND (status = 'pending' OR lease_expires_at < now())
+          AND attempts < p_max_attempts
+        ORDER BY brand_id, created_at, position
+        LIMIT 1)
+      UNION ALL
+      SELECT n.brand_id, n.created_at
+        FROM brands b
+       CROSS JOIN LATERAL (
+         SELECT brand_id, created_at
+           FROM pipeline_job_items
+          WHERE status IN ('pending', 'running')
+            AND (status = 'pending' OR lease_expires_at < now())
+            AND attempts < p_max_attempts
+            AND brand_id > b.brand_id
+          ORDER BY brand_id, created_at, position
+          LIMIT 1
+       ) n
+    )
+    SELECT brand_id
+      FROM brands
+     WHERE NOT (brand_id = ANY (p_exclude_brands))
+       AND coalesce((p_brand_capacity ->> brand_id::text)::int, p_default_capacity, 1) > 0
+     ORDER BY created_at
+  LOOP
+    EXIT WHEN v_remaining <= 0;
+    v_take := least(v_remaining, coalesce((p_brand_capacity ->> v_brand_id::text)::int, p_default_capacity, v_remaining));
+    CONTINUE WHEN v_take <= 0;
+
+    RETURN QUERY
+    WITH candidates AS (
+      SELECT id
+        FROM pipeline_job_items
+       WHERE brand_id = v_brand_id
+         AND status IN ('pending', 'running')
+         AND (status = 'pending' OR lease_expires_at < now())
+         AND attempts < p_max_attempts
+       ORDER BY created_at, position
+       LIMIT v_take
+       FOR UPDATE SKIP LOCKED
+    ), claimed AS (
+      UPDATE pipeline_job_items i
+         SET status = 'running',
+             attempts = i.attempts + 1,
+             lease_owner = p_worker_id,
+             lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+             heartbeat_at = now(),
+             started_at = now(),
+             error = NULL
+        FROM candidates c
+       WHERE i.id = c.id
+      RETURNING i.*
+    ), started AS (
+      UPDATE pipeline_jobs j
+         SET status = 'running'
+       WHERE j.id IN (SELECT job_id FROM claimed)
+         AND j.status = 'pending'
+    )
+    SELECT * FROM claimed;
+
+    GET DIAGNOSTICS v_claimed = ROW_COUNT;
+    v_remaining := v_remaining - v_claimed;
+  END LOOP;
+END;
+$$;
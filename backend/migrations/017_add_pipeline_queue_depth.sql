@@ -0,0 +1,18 @@
+-- Migration: Pipeline queue depth per brand
+-- Created: 2026-10-17
+-- Description: pipeline_queue_depth counts the claimable items of every brand
+-- (pending, or running with an expired lease, attempts left) for the
+-- pipeline_items_pending metric; reads idx_pipeline_job_items_claimable_brand
+
+CREATE OR REPLACE FUNCTION public.pipeline_queue_depth(p_max_attempts int DEFAULT 3)
+RETURNS TABLE (brand_id uuid, pending bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT i.brand_id, count(*) AS pending
+    FROM pipeline_job_items i
+   WHERE i.status IN ('pending', 'running')
+     AND (i.status = 'pending' OR i.lease_expires_at < now())
+     AND i.attempts < p_max_attempts
+   GROUP BY i.brand_id;
+$$;
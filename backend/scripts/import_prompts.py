@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 
 # Add backend to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -28,7 +29,7 @@ def import_prompts(prompts_dir: str, brand_id: str):
             name = filename
             
             print(f"Importing {name}...")
-            PromptService.save_prompt(brand_id, name, content)
+            asyncio.run(PromptService.save_prompt(brand_id, name, content))
             success_count += 1
             
         except Exception as e:
@@ -0,0 +1,34 @@
+import os
+import sys
+import signal
+import asyncio
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.tracing import setup_tracing, shutdown_tracing
+from app.services.pipeline_worker import pipeline_worker
+from app.services.image_fetcher import image_fetcher
+from app.services.upload_queue import upload_queue
+
+async def main():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    setup_tracing()
+    pipeline_worker.start()
+    print(f"Worker {pipeline_worker.worker_id} running. Press Ctrl+C to stop.")
+    await stop_event.wait()
+
+    print("Stopping worker, releasing unfinished items...")
+    await pipeline_worker.stop()
+    await upload_queue.drain(timeout=30)
+    await image_fetcher.close()
+    shutdown_tracing()
+
+if __name__ == "__main__":
+    # Standalone queue worker; run as many as needed alongside the API
+    # (set PIPELINE_WORKER_ENABLED=false on the API to keep it request-only)
+    asyncio.run(main())
@@ -10,6 +10,15 @@ import 'react-loading-skeleton/dist/skeleton.css';
 import { Prism as SyntaxHighlighter } from 'react-syntax-highlighter';
 import { vscDarkPlus } from 'react-syntax-highlighter/dist/esm/styles/prism';
 import { supabase } from '@/lib/supabase';
+import { subscribePipelineEvents } from '@/lib/pipelineEvents';
+
+// Smallest stored copy of a generated image that still fills a card of the given width
+function previewSrc(img, width = 768) {
+    if (img.shopify_cdn_url) return img.shopify_cdn_url;
+    const sizes = Object.keys(img.thumbnails || {}).map(Number).sort((a, b) => a - b);
+    const size = sizes.find((s) => s >= width);
+    return (size && img.thumbnails[size]) || img.webp_path || img.image_path;
+}
 
 export default function ProductDetailPage() {
     const params = useParams();
@@ -52,15 +61,28 @@ export default function ProductDetailPage() {
         }
     };
 
-    // Poll processing status every 5 seconds when processing
+    // Follow this product on the event stream; the slow poll covers jobs run
+    // by workers in other processes
     useEffect(() => {
         if (!currentBrand || !productId) return;
 
+        const unsubscribe = subscribePipelineEvents(currentBrand.id, (event) => {
+            if (event.product_id !== productId) return;
+            if (event.type === 'product.started') {
+                setIsProcessing(true);
+            } else if (event.type === 'product.completed' || event.type === 'product.failed') {
+                setIsProcessing(false);
+                loadProduct();
+            }
+        });
         const interval = setInterval(() => {
             checkProcessingStatus();
-        }, 5000);
+        }, 30000);
 
-        return () => clearInterval(interval);
+        return () => {
+            unsubscribe();
+            clearInterval(interval);
+        };
     }, [currentBrand, productId]);
 
 
@@ -491,7 +513,7 @@ export default function ProductDetailPage() {
                                                     ) : (
                                                         <>
                                                             <img
-                                                                src={img.shopify_cdn_url || img.image_path}
+                                                                src={previewSrc(img)}
                                                                 alt={img.attribute}
                                                                 className={`w-full h-auto object-contain ${img.flagged ? 'opacity-75' : ''}`}
                                                             />
@@ -686,8 +708,8 @@ function ImageCard({ img, title, onFlag }) {
         );
     }
 
-    // Use Shopify CDN URL if available (for images pushed to Shopify), otherwise use local path
-    const imageSrc = img.shopify_cdn_url || img.image_path;
+    // Use Shopify CDN URL if available (for images pushed to Shopify), otherwise a stored thumbnail
+    const imageSrc = previewSrc(img);
 
     return (
         <div className={`group relative aspect-[3/4] bg-gray-100 rounded-lg overflow-hidden shadow-sm ${img.flagged ? 'border-2 border-orange-500' : 'border'}`}>
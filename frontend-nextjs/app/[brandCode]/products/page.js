@@ -1,6 +1,7 @@
 'use client';
 
 import { supabase } from '@/lib/supabase';
+import { subscribePipelineEvents } from '@/lib/pipelineEvents';
 
 
 import { useState, useEffect, useCallback } from 'react';
@@ -23,10 +24,12 @@ export default function Products() {
 
 
     // Filters & Pagination
-    const [page, setPage] = useState(1);
+    // Keyset pagination: the server hands back cursors for the neighbouring pages
+    const [cursors, setCursors] = useState({ next: null, prev: null });
     const [total, setTotal] = useState(0);
     const [search, setSearch] = useState("");
     const [filters, setFilters] = useState({ processed: null, push_status: null });
+    const [processingIds, setProcessingIds] = useState(new Set());
     const [showFilters, setShowFilters] = useState(false);
 
     // Selection & Pipeline
@@ -42,33 +45,34 @@ export default function Products() {
     // Debounce Search
     useEffect(() => {
         const handler = setTimeout(() => {
-            if (currentBrand) loadProducts(1); // Reset to page 1 on search
+            if (currentBrand) loadProducts(); // Back to the first page on search
         }, 500);
         return () => clearTimeout(handler);
     }, [search, currentBrand, filters]);
 
-    // Pagination Click
+    // Refresh jobs from the event stream while history is open; the slow poll
+    // covers jobs run by workers in other processes
     useEffect(() => {
-        if (currentBrand) loadProducts(page);
-    }, [page]);
-
-    // Poll jobs if history is open
-    useEffect(() => {
-        let interval;
-        if (showHistory && currentBrand) {
-            loadJobs();
-            interval = setInterval(loadJobs, 5000);
-        }
-        return () => clearInterval(interval);
+        if (!showHistory || !currentBrand) return;
+        loadJobs();
+        const unsubscribe = subscribePipelineEvents(currentBrand.id, (event) => {
+            if (event.type.startsWith('job.')) loadJobs();
+        });
+        const interval = setInterval(loadJobs, 30000);
+        return () => {
+            unsubscribe();
+            clearInterval(interval);
+        };
     }, [showHistory, currentBrand]);
 
-    const loadProducts = async (p = page) => {
+    const loadProducts = async (cursor = null) => {
         setLoading(true);
         try {
             const { data: { session } } = await supabase.auth.getSession();
             const authToken = session?.access_token;
 
-            let query = `?brand_id=${currentBrand.id}&page=${p}&limit=20`;
+            let query = `?brand_id=${currentBrand.id}&limit=20`;
+            if (cursor) query += `&cursor=${encodeURIComponent(cursor)}`;
             if (search) query += `&search=${encodeURIComponent(search)}`;
             if (filters.processed !== null) query += `&processed=${filters.processed}`;
             if (filters.push_status) query += `&push_status=${filters.push_status}`;
@@ -79,7 +83,8 @@ export default function Products() {
             const data = await res.json();
             setProducts(data.products || []);
             setTotal(data.total || 0);
-            if (p !== page) setPage(p);
+            setCursors({ next: data.next_cursor || null, prev: data.prev_cursor || null });
+            loadProcessingStatus((data.products || []).map(p => p.product_id), authToken);
         } catch (error) {
             toast.error("Failed to load products");
             console.error(error);
@@ -90,6 +95,29 @@ export default function Products() {
 
 
 
+    // One lookup for the whole page: which of these products are queued or running
+    const loadProcessingStatus = async (productIds, authToken) => {
+        if (productIds.length === 0) {
+            setProcessingIds(new Set());
+            return;
+        }
+        try {
+            const res = await fetch(`/api/pipeline/product-status`, {
+                method: 'POST',
+                headers: {
+                    'Authorization': `Bearer ${authToken}`,
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ brand_id: currentBrand.id, product_ids: productIds })
+            });
+            const data = await res.json();
+            const statuses = data.statuses || {};
+            setProcessingIds(new Set(Object.keys(statuses).filter(id => statuses[id].is_processing)));
+        } catch (e) {
+            console.error(e);
+        }
+    };
+
     const loadJobs = async () => {
         try {
             const { data: { session } } = await supabase.auth.getSession();
@@ -104,6 +132,24 @@ export default function Products() {
         }
     };
 
+    // Re-queue only the failed (or stalled) products of a job
+    const handleRetryJob = async (jobId) => {
+        try {
+            const { data: { session } } = await supabase.auth.getSession();
+            const authToken = session?.access_token;
+            const res = await fetch(`/api/pipeline/jobs/${jobId}/retry`, {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${authToken}` }
+            });
+            const data = await res.json();
+            if (!res.ok) throw new Error(data.detail || "Retry failed");
+            toast.success(`Re-queued ${data.requeued} products`);
+            loadJobs();
+        } catch (e) {
+            toast.error(e.message);
+        }
+    };
+
     const handleRunPipeline = async (productIds = selectedProducts) => {
         if (productIds.length === 0) {
             toast.error("Select products to process");
@@ -211,7 +257,7 @@ export default function Products() {
                             <Play size={18} />
                             Run Pipeline ({selectedProducts.length})
                         </button>
-                        <AddProductModal currentBrand={currentBrand} onSuccess={() => loadProducts(1)} />
+                        <AddProductModal currentBrand={currentBrand} onSuccess={() => loadProducts()} />
                     </div>
                 </div>
             </div>
@@ -400,7 +446,7 @@ export default function Products() {
                                         <div className="text-xs text-gray-400">{product.product_type}</div>
                                     </td>
                                     <td className="p-4 align-top">
-                                        <StatusBadge processed={product.processed} />
+                                        <StatusBadge processed={product.processed} processing={processingIds.has(product.product_id)} />
                                     </td>
                                     <td className="p-4 align-top hidden md:table-cell">
                                         {product.push_status === 'pushed' ? (
@@ -433,15 +479,15 @@ export default function Products() {
                 <span>Showing {products.length} of {total} products</span>
                 <div className="flex gap-2">
                     <button
-                        disabled={page === 1 || loading}
-                        onClick={(e) => { e.stopPropagation(); setPage(page - 1); }}
+                        disabled={!cursors.prev || loading}
+                        onClick={(e) => { e.stopPropagation(); loadProducts(cursors.prev); }}
                         className="px-4 py-2 border rounded-lg hover:bg-white disabled:opacity-50 disabled:hover:bg-transparent transition-colors"
                     >
                         Previous
                     </button>
                     <button
-                        disabled={products.length < 20 || loading}
-                        onClick={(e) => { e.stopPropagation(); setPage(page + 1); }}
+                        disabled={!cursors.next || loading}
+                        onClick={(e) => { e.stopPropagation(); loadProducts(cursors.next); }}
                         className="px-4 py-2 border rounded-lg hover:bg-white disabled:opacity-50 disabled:hover:bg-transparent transition-colors"
                     >
                         Next
@@ -486,6 +532,17 @@ export default function Products() {
                                                 style={{ width: `${(job.progress / job.total_products) * 100}%` }}
                                             ></div>
                                         </div>
+                                        {job.status === 'failed' && (
+                                            <div className="flex items-center justify-between gap-2 mt-3">
+                                                <span className="text-xs text-red-600">{job.error}</span>
+                                                <button
+                                                    onClick={() => handleRetryJob(job.id)}
+                                                    className="inline-flex items-center gap-1 px-2.5 py-1 text-xs font-medium border border-gray-300 rounded-lg hover:bg-gray-50 shrink-0"
+                                                >
+                                                    <RotateCw size={12} /> Retry failed
+                                                </button>
+                                            </div>
+                                        )}
                                     </div>
                                 ))}
                                 {jobs.length === 0 && (
@@ -500,7 +557,14 @@ export default function Products() {
     );
 }
 
-function StatusBadge({ processed }) {
+function StatusBadge({ processed, processing }) {
+    if (processing) {
+        return (
+            <span className="inline-flex items-center gap-1 px-2.5 py-1 rounded-full text-xs font-medium bg-blue-50 text-blue-700 border border-blue-200">
+                <RotateCw size={12} className="animate-spin" /> Processing
+            </span>
+        );
+    }
     if (processed) {
         return (
             <span className="inline-flex items-center gap-1 px-2.5 py-1 rounded-full text-xs font-medium bg-indigo-50 text-indigo-700 border border-indigo-200">
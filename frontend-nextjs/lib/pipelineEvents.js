@@ -0,0 +1,39 @@
+import { supabase } from '@/lib/supabase';
+
+const EVENT_TYPES = [
+    'job.queued', 'job.progress', 'job.completed', 'job.failed',
+    'product.started', 'product.completed', 'product.failed',
+    'step.started', 'step.completed', 'step.failed',
+];
+
+// Subscribe to the pipeline event stream of a brand (optionally one job).
+// Calls onEvent with each parsed event; returns a function that closes the stream.
+export function subscribePipelineEvents(brandId, onEvent, { jobId } = {}) {
+    let source = null;
+    let closed = false;
+
+    (async () => {
+        const { data: { session } } = await supabase.auth.getSession();
+        if (closed || !session?.access_token) return;
+
+        // EventSource cannot send headers, so the token goes in the query string
+        let url = `/api/pipeline/events?brand_id=${brandId}&access_token=${encodeURIComponent(session.access_token)}`;
+        if (jobId) url += `&job_id=${jobId}`;
+
+        source = new EventSource(url);
+        EVENT_TYPES.forEach((type) => {
+            source.addEventListener(type, (e) => {
+                try {
+                    onEvent(JSON.parse(e.data));
+                } catch (error) {
+                    console.error('Bad pipeline event', error);
+                }
+            });
+        });
+    })();
+
+    return () => {
+        closed = true;
+        if (source) source.close();
+    };
+}